@@ -1,8 +1,28 @@
 from django.contrib import admin
-from .models import Crash
+from .models import Borough, Crash, SyncState
+
+
+class BoroughFilter(admin.SimpleListFilter):
+    """Borough choices by name from the Borough table, as the column stores ids"""
+    title = 'borough'
+    parameter_name = 'borough'
+    
+    def lookups(self, request, model_admin):
+        return [(name, name) for name in Borough.objects.order_by('name').values_list('name', flat=True)]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(borough=self.value())
+        return queryset
+
 
 @admin.register(Crash)
 class CrashAdmin(admin.ModelAdmin):
     list_display = ('crash_date', 'borough', 'latitude', 'longitude', 'number_of_persons_injured', 'number_of_persons_killed')
-    list_filter = ('borough', 'crash_date')
-    search_fields = ('borough', 'contributing_factor')
\ No newline at end of file
+    list_filter = (BoroughFilter, 'crash_date')
+    search_fields = ('=collision_id',)
+
+
+@admin.register(SyncState)
+class SyncStateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_window_end', 'max_crash_date', 'max_collision_id', 'updated_at')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AccidentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accidents'
+    
+    def ready(self):
+        # Connect the receivers that keep derived tables in sync with crashes
+        from . import facets, summary, tiles, versions  # noqa: F401
@@ -0,0 +1,186 @@
+import pandas as pd
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .fields import BLANK_ID, MISSING_ID, intern_cache
+from .filters import FACTOR_FIELDS, VEHICLE_TYPE_FIELDS
+from .models import Crash, CrashFactor, CrashVehicle, Factor, VehicleType
+from .signals import crashes_cleared, crashes_rebuilt, crashes_written
+
+
+# collision_ids per lookup of stored facet rows
+LOOKUP_BATCH_SIZE = 1000
+
+
+class Facet:
+    """A crash attribute spread over numbered columns, such as the five vehicle types.
+
+    Distinct values are kept in a dictionary model with the number of
+    crashes citing each, which is also the lookup model the crash columns
+    are interned into, and every non-blank column of a crash becomes a
+    (crash, slot, value) row of the link model.
+    """
+
+    def __init__(self, model, link, field, columns):
+        self.model = model
+        self.link = link
+        self.field = field
+        self.columns = columns
+
+    @property
+    def column(self):
+        return f'{self.field}_id'
+
+    def links(self, frame):
+        """Long frame of (crash_id, slot, name) for the non-blank columns of a frame of crashes"""
+        parts = []
+        for slot, column in enumerate(self.columns, 1):
+            names = frame[column]
+            cited = names.notna() & (names != '')
+            parts.append(pd.DataFrame({
+                'crash_id': frame.loc[cited, 'collision_id'].astype('int64'),
+                'slot': slot,
+                'name': names[cited],
+            }))
+        return pd.concat(parts, ignore_index=True)
+
+    def replace(self, frame, replaced_ids=()):
+        """Store the facet rows of a frame of crashes, first dropping those of replaced_ids.
+
+        Crash counts on the dictionary are adjusted by the difference, each
+        crash counting once per distinct value it cites.
+        """
+        old = []
+        for start in range(0, len(replaced_ids), LOOKUP_BATCH_SIZE):
+            stored = self.link.objects.filter(crash_id__in=replaced_ids[start:start + LOOKUP_BATCH_SIZE])
+            old.extend(stored.values_list('crash_id', self.column))
+            stored.delete()
+        old = pd.DataFrame.from_records(old, columns=['crash_id', 'value_id'])
+
+        new = self.links(frame).sort_values(['crash_id', 'slot'])
+        new['value_id'] = new['name'].map(intern_cache(self.model).intern(new['name'].unique())).astype('int64')
+        ops = connection.ops
+        sql = 'INSERT INTO %s (%s) VALUES (%%s, %%s, %%s)' % (
+            ops.quote_name(self.link._meta.db_table),
+            ', '.join(ops.quote_name(name) for name in ('crash_id', 'slot', self.column)),
+        )
+        counts = new.drop_duplicates(['crash_id', 'value_id'])['value_id'].value_counts().sub(
+            old.drop_duplicates()['value_id'].value_counts(), fill_value=0
+        ).astype('int64')
+        counts = counts[counts != 0]
+        update = 'UPDATE %s SET crash_count = crash_count + %%s WHERE id = %%s' % (
+            ops.quote_name(self.model._meta.db_table)
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, list(new[['crash_id', 'slot', 'value_id']].itertuples(index=False, name=None)))
+            cursor.executemany(update, [(int(count), int(value_id)) for value_id, count in counts.items()])
+
+    def replace_crash(self, crash, created=False):
+        """Store the facet rows of one saved crash, touching only the slots that changed.
+
+        A crash that was just created has no stored rows to compare with.
+        """
+        names = [getattr(crash, column) or '' for column in self.columns]
+        ids = intern_cache(self.model).intern(names)
+        new = {slot: ids[name] for slot, name in enumerate(names, 1) if name}
+        stored = {} if created else dict(
+            self.link.objects.filter(crash_id=crash.pk).values_list('slot', self.column)
+        )
+        if new == stored:
+            return
+        changed = [slot for slot in stored.keys() | new.keys() if stored.get(slot) != new.get(slot)]
+        if stored:
+            self.link.objects.filter(crash_id=crash.pk, slot__in=changed).delete()
+        self.link.objects.bulk_create([
+            self.link(crash_id=crash.pk, slot=slot, **{self.column: new[slot]}) for slot in changed if slot in new
+        ])
+        self.add_counts(set(stored.values()) - set(new.values()), -1)
+        self.add_counts(set(new.values()) - set(stored.values()), 1)
+
+    def add_counts(self, ids, delta):
+        if ids:
+            self.model.objects.filter(pk__in=ids).update(crash_count=F('crash_count') + delta)
+
+    def refresh_counts(self):
+        cited = self.link.objects.filter(**{self.field: OuterRef('pk')}).order_by().values(self.field).annotate(
+            crash_count=Count('crash', distinct=True)
+        ).values('crash_count')
+        self.model.objects.update(crash_count=Coalesce(Subquery(cited), Value(0)))
+
+    def rebuild(self):
+        """Recompute the facet rows and counts of every crash in SQL"""
+        ops = connection.ops
+        with transaction.atomic():
+            self.link.objects.all().delete()
+            with connection.cursor() as cursor:
+                for slot, column in enumerate(self.columns, 1):
+                    # The crash columns already hold ids into the dictionary model
+                    cursor.execute(
+                        'INSERT INTO %s (%s) SELECT %s, %%s, %s FROM %s WHERE %s <> %%s' % (
+                            ops.quote_name(self.link._meta.db_table),
+                            ', '.join(ops.quote_name(name) for name in ('crash_id', 'slot', self.column)),
+                            ops.quote_name(Crash._meta.pk.column),
+                            ops.quote_name(column),
+                            ops.quote_name(Crash._meta.db_table),
+                            ops.quote_name(column),
+                        ),
+                        [slot, BLANK_ID],
+                    )
+            self.refresh_counts()
+
+    def counts(self, crashes=None):
+        """Values by number of crashes citing them, from the stored counts unless crashes is given"""
+        if crashes is None:
+            return self.model.objects.filter(crash_count__gt=0).order_by('-crash_count', 'name').values(
+                'name', 'crash_count'
+            )
+        return self.link.objects.filter(crash__in=crashes).values(name=F(f'{self.field}__name')).annotate(
+            crash_count=Count('crash', distinct=True)
+        ).order_by('-crash_count', 'name')
+
+
+FACETS = {
+    'factor': Facet(Factor, CrashFactor, 'factor', FACTOR_FIELDS),
+    'vehicle_type': Facet(VehicleType, CrashVehicle, 'vehicle_type', VEHICLE_TYPE_FIELDS),
+}
+
+
+@receiver(crashes_written)
+def update_facets(sender, frame, previous, deferred=False, **kwargs):
+    if deferred:
+        # Rebuilt in SQL by rebuild_facets, cheaper than link rows page by page
+        return
+    replaced_ids = previous['collision_id'].tolist()
+    for facet in FACETS.values():
+        facet.replace(frame, replaced_ids)
+
+
+@receiver(post_save, sender=Crash)
+def refresh_saved_crash_facets(sender, instance, created, **kwargs):
+    for facet in FACETS.values():
+        facet.replace_crash(instance, created)
+
+
+@receiver(post_delete, sender=Crash)
+def refresh_deleted_crash_facets(sender, instance, **kwargs):
+    # The facet rows went with the crash; its columns say which values it cited
+    for facet in FACETS.values():
+        cache = intern_cache(facet.model)
+        ids = {cache.id(getattr(instance, column)) for column in facet.columns} - {BLANK_ID, MISSING_ID}
+        facet.add_counts(ids, -1)
+
+
+@receiver(crashes_cleared)
+def clear_facet_counts(sender, **kwargs):
+    # The facet rows went with their crashes
+    for facet in FACETS.values():
+        facet.model.objects.update(crash_count=0)
+
+
+@receiver(crashes_rebuilt)
+def rebuild_facets(sender, **kwargs):
+    for facet in FACETS.values():
+        facet.rebuild()
@@ -0,0 +1,204 @@
+import threading
+
+from django.apps import apps
+from django.core.exceptions import FieldError
+from django.db import connection, models, transaction
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+
+from .signals import crashes_cleared
+
+
+# Stored for blank strings, which have no lookup row
+BLANK_ID = 0
+
+# Compared against for values that have never been stored, so they match nothing
+MISSING_ID = -1
+
+
+class InternCache:
+    """Process-wide name <-> id maps of a lookup model with a unique ``name`` field.
+
+    The whole table is read on first use and single rows on later misses.
+    Lookup rows are only ever added, so a committed mapping stays valid.
+    Rows this process adds inside a transaction are kept out of the maps
+    until it commits, so a rollback cannot leave an id cached that the
+    database may later hand to another name.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.ids = {}
+        self.names = {BLANK_ID: ''}
+        self.pending = set()
+        self.loaded = False
+
+    def load(self):
+        rows = self.model.objects.values_list('name', 'pk')
+        with self.lock:
+            self.loaded = True
+            self.store(rows)
+
+    def store(self, rows):
+        for name, pk in rows:
+            if pk not in self.pending:
+                self.ids[name] = pk
+                self.names[pk] = name
+
+    def publish(self, rows):
+        with self.lock:
+            self.pending.difference_update(rows.values())
+            self.store(rows.items())
+
+    def name(self, pk):
+        """The name stored under an id"""
+        name = self.names.get(pk)
+        if name is not None or pk is None:
+            return name
+        if not self.loaded:
+            self.load()
+            name = self.names.get(pk)
+        if name is None:
+            rows = list(self.model.objects.filter(pk=pk).values_list('name', 'pk'))
+            with self.lock:
+                self.store(rows)
+            name = rows[0][0] if rows else None
+        return name
+
+    def id(self, name):
+        """The id of a name, MISSING_ID if it was never stored; nothing is added"""
+        if not name:
+            return BLANK_ID
+        pk = self.ids.get(name)
+        if pk is not None:
+            return pk
+        if not self.loaded:
+            self.load()
+            pk = self.ids.get(name)
+        if pk is None:
+            rows = list(self.model.objects.filter(name=name).values_list('name', 'pk'))
+            with self.lock:
+                self.store(rows)
+            pk = rows[0][1] if rows else MISSING_ID
+        return pk
+
+    def intern(self, names):
+        """Map names to ids, adding lookup rows for the ones never stored"""
+        if not self.loaded:
+            self.load()
+        ids = {name: BLANK_ID if not name else self.ids.get(name) for name in set(names)}
+        missing = [name for name, pk in ids.items() if pk is None]
+        if missing:
+            self.model.objects.bulk_create([self.model(name=name) for name in missing], ignore_conflicts=True)
+            added = dict(self.model.objects.filter(name__in=missing).values_list('name', 'pk'))
+            ids.update(added)
+            if connection.in_atomic_block:
+                with self.lock:
+                    self.pending.update(added.values())
+                transaction.on_commit(lambda: self.publish(added))
+            else:
+                self.publish(added)
+        return ids
+
+    def intern_column(self, values):
+        """Ids of a pandas column of names, interning each distinct name once"""
+        values = values.fillna('')
+        return values.map(self.intern(values.unique())).tolist()
+
+
+_caches = {}
+
+
+def intern_cache(model):
+    cache = _caches.get(model._meta.label)
+    if cache is None:
+        cache = _caches.setdefault(model._meta.label, InternCache(model))
+    return cache
+
+
+def clear_intern_caches():
+    """Forget every cached mapping; they are reloaded from the lookup tables on next use"""
+    for cache in _caches.values():
+        cache.clear()
+
+
+@receiver(crashes_cleared)
+def reset_intern_caches(sender, **kwargs):
+    # Clearing mid-transaction would forget which ids are still pending
+    transaction.on_commit(clear_intern_caches)
+
+
+class InternedIExact(models.Lookup):
+    """Case-insensitive match of an interned column, through the names in its lookup model"""
+    lookup_name = 'iexact'
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        ids = self.lhs.output_field.cache.model.objects.filter(name__iexact=self.rhs).values('pk')
+        sql, params = ids.query.get_compiler(connection=connection).as_sql()
+        return f'{lhs} IN ({sql})', (*lhs_params, *params)
+
+
+class InternedCharField(models.Field):
+    """A string column stored as the id of its value in a lookup model.
+
+    Values read and write as plain strings and the exact, iexact, in and
+    isnull lookups take strings, but the column holds small integers, so
+    rows and indexes stay compact and grouping compares integers.
+    ``max_length`` bounds the strings as it would for a CharField. Other
+    lookups raise FieldError, as they would compare ids; match against the
+    lookup model instead. Ordering by the column follows ids, not names.
+    """
+
+    # Lookups that compare whole values, which ids stand in for
+    LOOKUPS = {'exact', 'in', 'isnull'}
+
+    def __init__(self, lookup, *args, **kwargs):
+        self.lookup = lookup
+        kwargs.setdefault('blank', True)
+        kwargs.setdefault('default', '')
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['lookup'] = self.lookup if isinstance(self.lookup, str) else self.lookup._meta.label
+        for key, value in (('blank', True), ('default', '')):
+            if kwargs.get(key) == value:
+                del kwargs[key]
+        return name, path, args, kwargs
+
+    @cached_property
+    def cache(self):
+        lookup = apps.get_model(self.lookup) if isinstance(self.lookup, str) else self.lookup
+        return intern_cache(lookup)
+
+    def get_internal_type(self):
+        return 'IntegerField'
+
+    def get_lookup(self, lookup_name):
+        if lookup_name == 'iexact':
+            return InternedIExact
+        if lookup_name not in self.LOOKUPS:
+            raise FieldError(
+                f"Unsupported lookup '{lookup_name}' for interned column {self.name}; "
+                f"filter on {self.lookup if isinstance(self.lookup, str) else self.lookup._meta.label} instead"
+            )
+        return super().get_lookup(lookup_name)
+
+    def from_db_value(self, value, expression, connection):
+        return self.cache.name(value)
+
+    def to_python(self, value):
+        return '' if value is None else str(value)
+
+    def get_prep_value(self, value):
+        return self.cache.id(value)
+
+    def get_db_prep_save(self, value, connection):
+        value = value or ''
+        return self.cache.intern([value])[value]
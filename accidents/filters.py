@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import CrashFactor, CrashVehicle, Factor, VehicleType
+
+
+FILTER_PARAMS = [
+    'borough',
+    'start_date',
+    'end_date',
+    'min_severity',
+    'vehicle_type',
+    'factor',
+    'has_fatalities',
+    'has_injuries',
+    'bbox',
+    'start_time',
+    'end_time',
+]
+
+# Filters the daily summary table can answer on its own
+SUMMARY_FILTER_PARAMS = {'borough', 'start_date', 'end_date'}
+
+FACTOR_FIELDS = [
+    'contributing_factor_vehicle_1',
+    'contributing_factor_vehicle_2',
+    'contributing_factor_vehicle_3',
+    'contributing_factor_vehicle_4',
+    'contributing_factor_vehicle_5',
+]
+
+VEHICLE_TYPE_FIELDS = [
+    'vehicle_type_code1',
+    'vehicle_type_code2',
+    'vehicle_type_code_3',
+    'vehicle_type_code_4',
+    'vehicle_type_code_5',
+]
+
+
+def parse_date(value, name):
+    try:
+        return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}', expected YYYY-MM-DD")
+
+
+def parse_time(value, name):
+    """Parse "HH:MM" into minutes since midnight"""
+    try:
+        parsed = datetime.strptime(value, '%H:%M')
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}', expected HH:MM")
+    return parsed.hour * 60 + parsed.minute
+
+
+def parse_flag(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def parse_bbox(value):
+    """Parse "min_lon,min_lat,max_lon,max_lat" into four floats"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox minimums must not exceed its maximums")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def filter_crashes(queryset, params):
+    """Apply the crash list query parameters to a queryset.
+
+    Supported parameters: ``borough``, ``start_date`` and ``end_date``
+    (inclusive, YYYY-MM-DD), ``min_severity``, ``vehicle_type`` (substring of
+    any vehicle type), ``factor`` (substring of any contributing factor),
+    ``has_fatalities``, ``has_injuries``, ``bbox`` and
+    ``start_time``/``end_time`` (HH:MM, start inclusive and end exclusive;
+    a window wrapping midnight like 22:00-05:00 is allowed). Raises
+    ValueError for malformed values.
+    """
+    borough = params.get('borough')
+    if borough:
+        queryset = queryset.filter(borough=borough.upper())
+
+    start_date = params.get('start_date')
+    if start_date:
+        queryset = queryset.filter(crash_date__gte=parse_date(start_date, 'start_date'))
+
+    end_date = params.get('end_date')
+    if end_date:
+        queryset = queryset.filter(crash_date__lt=parse_date(end_date, 'end_date') + timedelta(days=1))
+
+    min_severity = params.get('min_severity')
+    if min_severity:
+        try:
+            min_severity = int(min_severity)
+        except ValueError:
+            raise ValueError("min_severity must be an integer")
+        queryset = queryset.filter(total_severity__gte=min_severity)
+
+    # Matched against the small dictionary tables, then joined through the
+    # indexed facet tables rather than scanning five columns per crash
+    vehicle_type = params.get('vehicle_type')
+    if vehicle_type:
+        queryset = queryset.filter(collision_id__in=CrashVehicle.objects.filter(
+            vehicle_type__in=VehicleType.objects.filter(name__icontains=vehicle_type).values('id')
+        ).values('crash_id'))
+
+    factor = params.get('factor')
+    if factor:
+        queryset = queryset.filter(collision_id__in=CrashFactor.objects.filter(
+            factor__in=Factor.objects.filter(name__icontains=factor).values('id')
+        ).values('crash_id'))
+
+    if parse_flag(params.get('has_fatalities', '')):
+        queryset = queryset.filter(number_of_persons_killed__gt=0)
+
+    if parse_flag(params.get('has_injuries', '')):
+        queryset = queryset.filter(number_of_persons_injured__gt=0)
+
+    bbox = params.get('bbox')
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = parse_bbox(bbox)
+        # Latitude leads the (latitude, longitude) index
+        queryset = queryset.filter(
+            latitude__gte=min_lat,
+            latitude__lte=max_lat,
+            longitude__gte=min_lon,
+            longitude__lte=max_lon,
+        )
+
+    start_time = params.get('start_time')
+    start_minute = parse_time(start_time, 'start_time') if start_time else None
+    end_time = params.get('end_time')
+    end_minute = parse_time(end_time, 'end_time') if end_time else None
+    if start_minute is not None and end_minute is not None and start_minute > end_minute:
+        queryset = queryset.filter(Q(minute_of_day__gte=start_minute) | Q(minute_of_day__lt=end_minute))
+    else:
+        if start_minute is not None:
+            queryset = queryset.filter(minute_of_day__gte=start_minute)
+        if end_minute is not None:
+            queryset = queryset.filter(minute_of_day__lt=end_minute)
+
+    return queryset
+
+
+def summary_can_filter(params):
+    """Whether every filter given in params can be applied to the daily summary"""
+    return all(name in SUMMARY_FILTER_PARAMS for name in FILTER_PARAMS if params.get(name))
+
+
+def filter_summary(queryset, params):
+    """Apply the borough and date range parameters to a CrashDailySummary queryset"""
+    borough = params.get('borough')
+    if borough:
+        queryset = queryset.filter(borough=borough.upper())
+
+    start_date = params.get('start_date')
+    if start_date:
+        queryset = queryset.filter(date__gte=parse_date(start_date, 'start_date').date())
+
+    end_date = params.get('end_date')
+    if end_date:
+        queryset = queryset.filter(date__lte=parse_date(end_date, 'end_date').date())
+
+    return queryset
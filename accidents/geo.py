@@ -0,0 +1,66 @@
+import numpy as np
+
+
+EARTH_RADIUS_M = 6371008.8
+
+# Metres per degree of latitude
+METERS_PER_DEGREE = 111320
+
+# Grid cells are CELL_SIZE degrees on a side, about 550m north-south; a
+# cell id is row * CELL_ROW_STRIDE + column so each grid row is a
+# contiguous id range
+CELL_SIZE = 0.005
+CELL_ROW_STRIDE = 100000
+
+
+def grid_cell(latitude, longitude):
+    """Return the grid cell id of a point; works on scalars and arrays"""
+    row = np.floor((latitude + 90) / CELL_SIZE)
+    column = np.floor((longitude + 180) / CELL_SIZE)
+    cell = row * CELL_ROW_STRIDE + column
+    if np.ndim(cell):
+        return cell.astype('int64')
+    return int(cell)
+
+
+def bounding_box(latitude, longitude, radius):
+    """Return (min_lat, min_lon, max_lat, max_lon) enclosing a circle of radius metres"""
+    lat_delta = radius / METERS_PER_DEGREE
+    # Degrees of longitude shrink with the cosine of the latitude
+    lon_delta = radius / (METERS_PER_DEGREE * max(np.cos(np.radians(latitude)), 1e-6))
+    return latitude - lat_delta, longitude - lon_delta, latitude + lat_delta, longitude + lon_delta
+
+
+def cell_ranges(latitude, longitude, radius):
+    """Return (first, last) cell id ranges, one per grid row, covering a circle"""
+    min_lat, min_lon, max_lat, max_lon = bounding_box(latitude, longitude, radius)
+    first = grid_cell(min_lat, min_lon)
+    last = grid_cell(max_lat, max_lon)
+    first_row, first_column = divmod(first, CELL_ROW_STRIDE)
+    last_row, last_column = divmod(last, CELL_ROW_STRIDE)
+    return [
+        (row * CELL_ROW_STRIDE + first_column, row * CELL_ROW_STRIDE + last_column)
+        for row in range(first_row, last_row + 1)
+    ]
+
+
+def haversine(latitude, longitude, latitudes, longitudes):
+    """Great-circle distance in metres from one point to arrays of points"""
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype='float64'))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(longitudes, dtype='float64') - longitude)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+# Web Mercator stops at this latitude, where the map becomes square
+MAX_MERCATOR_LATITUDE = 85.0511287798
+
+
+def mercator(latitude, longitude):
+    """Project to Web Mercator (x, y), both in [0, 1] with y growing southwards"""
+    latitude = np.radians(np.clip(latitude, -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+    x = (np.asarray(longitude, dtype='float64') + 180) / 360
+    y = (1 - np.log(np.tan(latitude) + 1 / np.cos(latitude)) / np.pi) / 2
+    return x, y
@@ -0,0 +1,73 @@
+import numpy as np
+
+
+def grid_shape(bbox, resolution):
+    """Return (width, height) in cells, with resolution cells along the longer side.
+
+    Cells are kept roughly square on the ground, so the shorter side gets
+    proportionally fewer of them.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    width_m = (max_lon - min_lon) * np.cos(np.radians((min_lat + max_lat) / 2))
+    height_m = max_lat - min_lat
+    if width_m >= height_m:
+        return resolution, max(1, int(round(resolution * height_m / width_m))) if width_m else 1
+    return max(1, int(round(resolution * width_m / height_m))), resolution
+
+
+def gaussian_kernel(sigma):
+    radius = int(np.ceil(3 * sigma))
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-offsets ** 2 / (2 * sigma ** 2))
+    return kernel / kernel.sum()
+
+
+def gaussian_smooth(grid, sigma):
+    """Blur a 2D grid with a Gaussian of sigma cells, as two 1D passes.
+
+    Each pass is a weighted sum of shifted copies of the zero-padded grid,
+    so the work is one array operation per kernel tap.
+    """
+    kernel = gaussian_kernel(sigma)
+    radius = len(kernel) // 2
+    for axis in (0, 1):
+        padding = [(0, 0), (0, 0)]
+        padding[axis] = (radius, radius)
+        padded = np.pad(grid, padding)
+        length = grid.shape[axis]
+        grid = sum(
+            weight * padded[(slice(None),) * axis + (slice(tap, tap + length),)]
+            for tap, weight in enumerate(kernel)
+        )
+    return grid
+
+
+def density_grid(latitudes, longitudes, weights, bbox, resolution, sigma=0):
+    """Sum weights into a grid over bbox, rows running north to south.
+
+    Points outside the bounding box are ignored. With a positive sigma
+    the grid is smoothed with a Gaussian of that many cells.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    width, height = grid_shape(bbox, resolution)
+    latitudes = np.asarray(latitudes, dtype='float64')
+    longitudes = np.asarray(longitudes, dtype='float64')
+    inside = (
+        (latitudes >= min_lat) & (latitudes <= max_lat) & (longitudes >= min_lon) & (longitudes <= max_lon)
+    )
+    # Rows count down from the northern edge; points on the far edges
+    # fall into the last row or column
+    rows = np.minimum(
+        ((max_lat - latitudes[inside]) / (max_lat - min_lat or 1) * height).astype('int64'), height - 1
+    )
+    columns = np.minimum(
+        ((longitudes[inside] - min_lon) / (max_lon - min_lon or 1) * width).astype('int64'), width - 1
+    )
+    grid = np.bincount(
+        rows * width + columns,
+        weights=None if weights is None else np.asarray(weights, dtype='float64')[inside],
+        minlength=width * height,
+    ).reshape(height, width).astype('float64')
+    if sigma > 0:
+        grid = gaussian_smooth(grid, sigma)
+    return grid
@@ -0,0 +1,301 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.db import connection, models, transaction
+from django.db.models.constants import OnConflict
+
+from .fields import InternedCharField
+from .geo import grid_cell
+from .models import CRASH_TIME_PATTERN, Crash, CrashFactor, CrashVehicle, crash_severity
+from .normalize import INTEGER_FIELDS, TEXT_FIELDS
+from .signals import crashes_cleared, crashes_rebuilt, crashes_written
+
+
+FIELDS = Crash._meta.concrete_fields
+
+# Fields that come from the source dataset and make up a crash's content hash
+SOURCE_FIELDS = ['crash_date', 'latitude', 'longitude'] + INTEGER_FIELDS + TEXT_FIELDS
+
+# Columns refreshed when an existing crash is re-ingested in update mode
+UPDATE_FIELDS = [f for f in FIELDS if not f.primary_key]
+
+
+def crashes_to_frame(crashes):
+    """Collect unsaved Crash instances into a frame with one column per field"""
+    frame = pd.DataFrame({
+        field.attname: [getattr(crash, field.attname) for crash in crashes]
+        for field in FIELDS
+    })
+    frame['crash_date'] = pd.to_datetime(frame['crash_date'], utc=True)
+    return frame.astype({'collision_id': 'int64'})
+
+
+def content_hashes(frame):
+    """Return a signed 64-bit hash of each row's source fields.
+
+    Columns are cast to fixed dtypes first so a record hashes the same
+    whether it came from the API, a dump or unsaved Crash instances.
+    """
+    columns = {'crash_date': pd.to_datetime(frame['crash_date'], utc=True)}
+    for name in ('latitude', 'longitude'):
+        columns[name] = frame[name].astype('float64')
+    for name in INTEGER_FIELDS:
+        columns[name] = frame[name].astype('int64')
+    for name in TEXT_FIELDS:
+        columns[name] = frame[name].astype(str)
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(columns, index=frame.index), index=False)
+    return pd.Series(hashes.to_numpy().view('int64'), index=frame.index)
+
+
+def minutes_of_day(times):
+    """Minutes since midnight of a column of crash_time strings, NA where unreadable"""
+    parts = times.astype(str).str.extract(CRASH_TIME_PATTERN)
+    return (pd.to_numeric(parts[0]) * 60 + pd.to_numeric(parts[1])).astype('Int64')
+
+
+def nullable(values):
+    """Turn a nullable integer column into a list of ints and Nones for the database"""
+    return [None if value is pd.NA else value for value in values.astype(object)]
+
+
+def adapt_datetimes(values):
+    """Convert a column of aware timestamps to database parameters.
+
+    SQLite stores datetimes as UTC text formatted like ``str(datetime)``, so
+    the strings are built for the whole column at once rather than passing
+    every value through the backend's adapter.
+    """
+    if connection.vendor != 'sqlite':
+        adapt = connection.ops.adapt_datetimefield_value
+        return [adapt(value) for value in values.array.to_pydatetime()]
+    naive = values.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+    text = pd.Series(np.datetime_as_string(naive, unit='us')).str.replace('T', ' ', regex=False)
+    # str(datetime) leaves out microseconds when they are zero
+    whole = naive.astype('datetime64[us]').astype('int64') % 1000000 == 0
+    text[whole] = text[whole].str.slice(0, 19)
+    return text.tolist()
+
+
+def clear_crashes():
+    """Delete every crash and its facet rows, then let crashes_cleared receivers reset derived data.
+
+    The tables are emptied with plain DELETEs; QuerySet.delete() would load
+    each crash and send its delete signals, which adjust the summary,
+    facets, version and tile cache one row at a time.
+    """
+    ops = connection.ops
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for model in (CrashFactor, CrashVehicle, Crash):
+                cursor.execute('DELETE FROM %s' % ops.quote_name(model._meta.db_table))
+        crashes_cleared.send(sender=Crash)
+
+
+class RejectReport:
+    """Tally of records rejected during normalization.
+
+    When ``path`` is given the rejected raw records are also appended to it
+    as NDJSON, each with a ``reject_reason`` field.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.counts = {}
+        if path:
+            # Start a fresh report for each run
+            open(path, 'w').close()
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def add(self, rejects):
+        if rejects.empty:
+            return
+        for reason, count in rejects['reject_reason'].value_counts().items():
+            self.counts[reason] = self.counts.get(reason, 0) + int(count)
+        if self.path:
+            with open(self.path, 'a') as f:
+                rejects.to_json(f, orient='records', lines=True)
+
+    def lines(self):
+        return [f"Rejected {count} records: {reason}" for reason, count in sorted(self.counts.items())]
+
+
+class CrashWriter:
+    """Batched writer for Crash rows.
+
+    Stored content hashes of a page's collision_ids are looked up in bulk and
+    new rows are inserted with multi-row INSERTs in chunks of ``batch_size``,
+    bypassing per-instance ORM overhead. With ``on_conflict='update'`` rows
+    that already exist are overwritten when their content hash differs, so a
+    refresh only writes the records that were revised at the source.
+
+    With ``defer_derived`` pages are announced as deferred, letting
+    receivers skip work they redo more cheaply over the whole table; call
+    rebuild_derived() once the load is done.
+    """
+
+    ON_CONFLICT_CHOICES = ('ignore', 'update')
+
+    def __init__(self, batch_size=1000, on_conflict='ignore', defer_derived=False):
+        if on_conflict not in self.ON_CONFLICT_CHOICES:
+            raise ValueError(f"on_conflict must be one of {self.ON_CONFLICT_CHOICES}")
+        self.batch_size = batch_size
+        self.on_conflict = on_conflict
+        self.defer_derived = defer_derived
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+
+        # Watermark of every collision seen, written or already stored
+        self.max_crash_date = None
+        self.max_collision_id = None
+
+    @property
+    def rows_written(self):
+        return self.created + self.updated
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0.0
+        return self.rows_written / self.elapsed
+
+    def stored_hashes(self, collision_ids):
+        """Map the collision_ids already stored to their content hash"""
+        # Plain SQL, as preparing each id as an ORM lookup value costs more
+        # than the query itself on large pages
+        ops = connection.ops
+        sql = 'SELECT %s, %s FROM %s WHERE %s IN (%%s)' % (
+            ops.quote_name(Crash._meta.pk.column),
+            ops.quote_name(Crash._meta.get_field('content_hash').column),
+            ops.quote_name(Crash._meta.db_table),
+            ops.quote_name(Crash._meta.pk.column),
+        )
+        stored = {}
+        with connection.cursor() as cursor:
+            for start in range(0, len(collision_ids), self.batch_size):
+                chunk = [int(collision_id) for collision_id in collision_ids[start:start + self.batch_size]]
+                cursor.execute(sql % ', '.join(['%s'] * len(chunk)), chunk)
+                stored.update(cursor.fetchall())
+        return stored
+
+    def stored_rows(self, collision_ids):
+        """Return the stored values of the given crashes as a frame"""
+        rows = []
+        for start in range(0, len(collision_ids), self.batch_size):
+            chunk = collision_ids[start:start + self.batch_size]
+            rows.extend(Crash.objects.filter(collision_id__in=chunk).values(*(f.attname for f in FIELDS)))
+        return pd.DataFrame.from_records(rows, columns=[f.attname for f in FIELDS])
+
+    def write_frame(self, frame):
+        """Write a normalized frame of crashes, returning the number written"""
+        started = time.perf_counter()
+
+        # Last record wins when a page repeats a collision_id
+        unique = frame.drop_duplicates('collision_id', keep='last')
+        minute_of_day = minutes_of_day(unique['crash_time'])
+        unique = unique.assign(
+            total_severity=crash_severity(
+                unique['number_of_persons_injured'], unique['number_of_persons_killed']
+            ),
+            geo_cell=grid_cell(unique['latitude'].to_numpy(), unique['longitude'].to_numpy()),
+            minute_of_day=minute_of_day,
+            hour=minute_of_day // 60,
+            content_hash=content_hashes(unique),
+        )
+        stored = pd.Series(self.stored_hashes(unique['collision_id'].tolist()), dtype='Int64')
+        is_existing = unique['collision_id'].isin(stored.index)
+        new = unique[~is_existing]
+
+        # Rows stored without a hash count as changed and get one on update
+        stored_hash = unique['collision_id'].map(stored)
+        is_changed = is_existing & stored_hash.ne(unique['content_hash']).fillna(True)
+        changed = unique[is_changed]
+
+        written_rows = new
+        previous = unique.iloc[:0]
+        with transaction.atomic():
+            self.insert(new, OnConflict.IGNORE)
+            if self.on_conflict == 'update' and not changed.empty:
+                # Receivers get the overwritten values so they can apply deltas
+                previous = self.stored_rows(changed['collision_id'].tolist())
+                self.insert(changed, OnConflict.UPDATE)
+                written_rows = pd.concat([new, changed])
+            if not written_rows.empty:
+                crashes_written.send(
+                    sender=Crash, frame=written_rows, previous=previous, deferred=self.defer_derived
+                )
+
+        written = len(new)
+        self.created += len(new)
+        if self.on_conflict == 'update':
+            self.updated += len(changed)
+            written += len(changed)
+        self.skipped += len(frame) - written
+        self.track_watermark(unique)
+
+        self.elapsed += time.perf_counter() - started
+        return written
+
+    def insert(self, frame, on_conflict):
+        """INSERT the rows of a frame, ignoring or overwriting conflicting ones"""
+        if frame.empty:
+            return
+
+        columns = []
+        for field in FIELDS:
+            if field.attname not in frame.columns:
+                values = [field.get_db_prep_save(field.get_default(), connection)] * len(frame)
+            elif isinstance(field, models.DateTimeField):
+                values = adapt_datetimes(frame[field.attname])
+            elif isinstance(field, InternedCharField):
+                values = field.cache.intern_column(frame[field.attname])
+            elif frame[field.attname].dtype == 'Int64':
+                values = nullable(frame[field.attname])
+            else:
+                values = frame[field.attname].tolist()
+            columns.append(values)
+        rows = list(zip(*columns))
+
+        ops = connection.ops
+        suffix = ops.on_conflict_suffix_sql(
+            FIELDS,
+            on_conflict,
+            [f.column for f in UPDATE_FIELDS],
+            [Crash._meta.pk.column],
+        )
+        sql = '%s %s (%s) VALUES (%s) %s' % (
+            ops.insert_statement(on_conflict=on_conflict),
+            ops.quote_name(Crash._meta.db_table),
+            ', '.join(ops.quote_name(f.column) for f in FIELDS),
+            ', '.join(['%s'] * len(FIELDS)),
+            suffix or '',
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[start:start + self.batch_size])
+
+    def rebuild_derived(self):
+        """Rebuild the tables derived from crashes after writes with defer_derived"""
+        with transaction.atomic():
+            crashes_rebuilt.send(sender=Crash)
+
+    def track_watermark(self, frame):
+        if frame.empty:
+            return
+        max_crash_date = frame['crash_date'].max().to_pydatetime()
+        max_collision_id = int(frame['collision_id'].max())
+        if self.max_crash_date is None or max_crash_date > self.max_crash_date:
+            self.max_crash_date = max_crash_date
+        if self.max_collision_id is None or max_collision_id > self.max_collision_id:
+            self.max_collision_id = max_collision_id
+
+    def summary(self):
+        return (
+            f"{self.created} created, {self.updated} updated, {self.skipped} skipped "
+            f"in {self.elapsed:.1f}s ({self.rows_per_second:.0f} rows/sec)"
+        )
@@ -1,9 +1,18 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
-import requests
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from accidents.models import Crash
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from accidents.models import SyncState
+from accidents.ingest import CrashWriter, RejectReport
+from accidents.normalize import normalize_frame
+from accidents.pipeline import StageQueue, StageStats, pipeline_summary
+from accidents.socrata import BASE_URL, SocrataClient, TokenBucket, date_windows
+
+# SyncState row tracking this command's progress
+SYNC_NAME = 'nyc_open_data'
 
 class Command(BaseCommand):
     help = 'Fetch crash data from NYC Open Data API'
@@ -13,147 +22,276 @@ class Command(BaseCommand):
         parser.add_argument('--max-records', type=int, default=50000, help='Max total records')
         parser.add_argument('--api-key-id', type=str, help='Socrata API Key ID')
         parser.add_argument('--api-key-secret', type=str, help='Socrata API Key Secret')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+        parser.add_argument(
+            '--on-conflict',
+            choices=CrashWriter.ON_CONFLICT_CHOICES,
+            default='update',
+            help='Skip existing crashes (ignore) or rewrite those whose contents changed (update)'
+        )
+        parser.add_argument('--workers', type=int, default=1, help='Concurrent API requests')
+        parser.add_argument('--rate', type=float, default=0.5, help='Max API requests per second')
+        parser.add_argument('--start-date', type=str, default='2022-01-01', help='First crash date to fetch (YYYY-MM-DD)')
+        parser.add_argument('--end-date', type=str, help='Fetch crashes before this date (YYYY-MM-DD, default: today)')
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Parse responses incrementally instead of loading whole pages into memory'
+        )
+        parser.add_argument('--reject-file', type=str, help='Write rejected records to this NDJSON file')
+        parser.add_argument('--base-url', type=str, default=BASE_URL, help='Socrata query endpoint')
+        resume = parser.add_mutually_exclusive_group()
+        resume.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only fetch crashes on or after the latest crash date already ingested'
+        )
+        resume.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue a previous run from its last completed date window'
+        )
     
     def handle(self, *args, **options):
         limit = options['limit']
         max_records = options['max_records']
+        workers = max(1, options['workers'])
+        self.stream = options['stream']
         api_key_id = options.get('api_key_id')
         api_key_secret = options.get('api_key_secret')
-        
-        # API Configuration
-        base_url = "https://data.cityofnewyork.us/api/v3/views/h9gi-nx95/query.json"
-        
-        # Headers for the request
-        headers = {
-            'Content-Type': 'application/json',
-        }
+        self.writer = CrashWriter(
+            batch_size=options['batch_size'],
+            on_conflict=options['on_conflict'],
+        )
+        self.rejects = RejectReport(options['reject_file'])
         
         # HTTP Basic Auth with API key
         auth = None
         if api_key_id and api_key_secret:
             auth = (api_key_id, api_key_secret)
         
-        # Fetch by date ranges to avoid pagination issues
-        from datetime import datetime, timedelta
+        # Requests are throttled by a shared token bucket rather than a fixed sleep
+        client = SocrataClient(
+            base_url=options['base_url'],
+            auth=auth,
+            rate_limiter=TokenBucket(options['rate'], burst=workers),
+        )
+        
+        # Fetch by date ranges, paging through each window
+        self.state, _ = SyncState.objects.get_or_create(name=SYNC_NAME)
+        start_date = self.get_start_date(options)
+        end_date = self.parse_option_date(options['end_date']) if options['end_date'] else datetime.now()
+        windows = date_windows(start_date, end_date)
         
-        # Start from a more recent date to get comprehensive recent data
-        start_date = datetime(2022, 1, 1)
-        end_date = start_date + timedelta(days=60)  # 60-day chunks for faster processing
+        total_fetched = self.fetch_windows(client, windows, workers, limit, max_records)
         
+        self.stdout.write(f"Fetched {total_fetched} new records from {len(windows)} date windows")
+        for line in self.rejects.lines():
+            self.stdout.write(line)
+        self.stdout.write(f"Write summary: {self.writer.summary()}")
+        for line in pipeline_summary(self.stages, self.elapsed):
+            self.stdout.write(line)
+    
+    def get_start_date(self, options):
+        """Pick the first date to fetch from the options and saved sync state"""
+        state = self.state
+        if options['incremental'] and state.max_crash_date:
+            # Same-day records may still be arriving, so refetch the watermark
+            # day. Never start past the checkpoint, which would skip windows an
+            # interrupted run left unfinished.
+            watermark = state.max_crash_date.date()
+            if state.last_window_end and state.last_window_end < watermark:
+                watermark = state.last_window_end
+            self.stdout.write(f"Incremental sync from watermark {watermark:%Y-%m-%d} (collision {state.max_collision_id})")
+            return datetime.combine(watermark, datetime.min.time())
+        if options['resume'] and state.last_window_end:
+            self.stdout.write(f"Resuming after checkpoint {state.last_window_end:%Y-%m-%d}")
+            return datetime.combine(state.last_window_end, datetime.min.time())
+        if options['incremental'] or options['resume']:
+            self.stdout.write("No saved sync state, starting from --start-date")
+        return self.parse_option_date(options['start_date'])
+    
+    def save_checkpoint(self, window):
+        """Record a completed window and the ingest watermark"""
+        state = self.state
+        state.last_window_start = window[0].date()
+        state.last_window_end = window[1].date()
+        if self.writer.max_crash_date and (
+            state.max_crash_date is None or self.writer.max_crash_date > state.max_crash_date
+        ):
+            state.max_crash_date = self.writer.max_crash_date
+        if self.writer.max_collision_id and (
+            state.max_collision_id is None or self.writer.max_collision_id > state.max_collision_id
+        ):
+            state.max_collision_id = self.writer.max_collision_id
+        state.save()
+    
+    def parse_option_date(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
+    
+    def fetch_windows(self, client, windows, workers, limit, max_records):
+        """Run fetching, parsing and DB writes as overlapping pipeline stages.
+        
+        Fetch workers hand raw records to a parser thread in chunks of
+        --batch-size and the parser hands normalized frames to this thread,
+        which does all DB writes. Both queues are bounded, so a slow stage
+        holds the others back instead of piling pages up in memory.
+        """
         total_fetched = 0
+        remaining = iter(windows)
+        pending = 0
+        page_saved = {}
+        raw = StageQueue(maxsize=workers * 2)
+        parsed = StageQueue(maxsize=workers * 2)
+        stop = threading.Event()
+        failure = None
+        fetch_stats = StageStats('fetch')
+        parse_stats = StageStats('parse', raw)
+        write_stats = StageStats('write', parsed)
+        self.stages = [fetch_stats, parse_stats, write_stats]
         
-        while total_fetched < max_records:
-            # Build the request payload with date filter
-            payload = {
-                'query': f"SELECT * WHERE latitude IS NOT NULL AND longitude IS NOT NULL AND crash_date >= '{start_date.strftime('%Y-%m-%d')}' AND crash_date < '{end_date.strftime('%Y-%m-%d')}'",
-                'page': {
-                    'pageNumber': 1,
-                    'pageSize': min(limit, max_records - total_fetched)
-                },
-                'includeSynthetic': False
-            }
+        # Windows finish out of order; the checkpoint only advances over a
+        # contiguous run of completed windows so a resume never skips one
+        completed = set()
+        checkpoint = 0
+        
+        def fetch(window, page_number):
+            key = (window, page_number)
+            received = 0
+            error = None
+            started = time.perf_counter()
+            blocked = 0.0
             
-            self.stdout.write(f"Fetching records from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}...")
+            def hand_off(chunk):
+                nonlocal blocked
+                put_started = time.perf_counter()
+                raw.put(('records', key, chunk))
+                blocked += time.perf_counter() - put_started
             
             try:
-                # Make API request
-                response = requests.post(
-                    base_url, 
-                    headers=headers,
-                    json=payload,
-                    auth=auth,
-                    timeout=30
-                )
-                response.raise_for_status()
-                data = response.json()
-                
-                if not data:
-                    self.stdout.write("No more data available")
-                    break
-                
-                # Process and save data
-                saved_count = self.process_batch(data)
-                total_fetched += saved_count
-                
-                self.stdout.write(f"Saved {saved_count} records. Total: {total_fetched}")
+                if self.stream:
+                    records = client.stream_page(window, page_number, limit)
+                else:
+                    records = client.fetch_page(window, page_number, limit)
+                chunk = []
+                for record in records:
+                    if stop.is_set():
+                        break
+                    chunk.append(record)
+                    received += 1
+                    if len(chunk) >= self.writer.batch_size:
+                        hand_off(chunk)
+                        chunk = []
+                if chunk:
+                    hand_off(chunk)
+            except Exception as e:
+                # Reported by the writing thread, which is waiting on this page
+                error = e
+            fetch_stats.add(received, time.perf_counter() - started - blocked)
+            raw.put(('done', key, (received, error)))
+        
+        def parse():
+            # Messages are handled in order, so a page's frames always reach
+            # the writer before its 'done'
+            while True:
+                message = raw.get()
+                if message is None:
+                    return
+                kind, key, payload = message
+                if kind == 'records':
+                    if stop.is_set():
+                        continue
+                    started = time.perf_counter()
+                    try:
+                        kind, payload = 'frame', normalize_frame(pd.DataFrame.from_records(payload))
+                    except Exception as e:
+                        kind, payload = 'error', e
+                    parse_stats.add(len(message[2]), time.perf_counter() - started)
+                parsed.put((kind, key, payload))
+        
+        parser = threading.Thread(target=parse, daemon=True)
+        parser.start()
+        started = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            def submit(window, page_number):
+                nonlocal pending
+                pool.submit(fetch, window, page_number)
+                pending += 1
+            
+            def fill():
+                # Keep every worker busy with the next unstarted window
+                while pending < workers and not stop.is_set():
+                    window = next(remaining, None)
+                    if window is None:
+                        return
+                    submit(window, 1)
+            
+            fill()
+            while pending:
+                kind, key, payload = parsed.get()
                 
-                # If we saved 0 records, move to next date range
-                if saved_count == 0:
-                    self.stdout.write("No new records in this date range. Moving to next period.")
+                if kind in ('frame', 'error'):
+                    # After stopping, keep draining so no stage blocks on a full queue
+                    if stop.is_set():
+                        continue
+                    try:
+                        if kind == 'error':
+                            raise payload
+                        saved_count = self.process_frame(*payload, stats=write_stats)
+                    except Exception as e:
+                        failure = e
+                        stop.set()
+                        continue
+                    total_fetched += saved_count
+                    page_saved[key] = page_saved.get(key, 0) + saved_count
+                    if total_fetched >= max_records:
+                        self.stdout.write(f"Reached --max-records ({max_records}), stopping")
+                        stop.set()
+                    continue
                 
-                # Move to next date range
-                start_date = end_date
-                end_date = start_date + timedelta(days=30)
+                pending -= 1
+                window, page_number = key
+                received, error = payload
+                label = f"{window[0].strftime('%Y-%m-%d')} to {window[1].strftime('%Y-%m-%d')}"
                 
-                # Rate limiting
-                time.sleep(2)
+                if error is not None:
+                    self.stdout.write(f"API Error for {label} page {page_number}: {error}")
+                else:
+                    self.stdout.write(
+                        f"{label} page {page_number}: saved {page_saved.pop(key, 0)} of {received} records. "
+                        f"Total: {total_fetched} ({self.writer.rows_per_second:.0f} rows/sec, "
+                        f"queues: parse {raw.depth()}, write {parsed.depth()})"
+                    )
                 
-            except requests.exceptions.RequestException as e:
-                self.stdout.write(f"API Error: {e}")
-                break
-    
-    def process_batch(self, data):
-        """Process a batch of records and save to database"""
-        saved_count = 0
+                if error is None and not stop.is_set():
+                    if received >= limit:
+                        # A full page means the window may have more records
+                        submit(window, page_number + 1)
+                    else:
+                        completed.add(window)
+                        previous = checkpoint
+                        while checkpoint < len(windows) and windows[checkpoint] in completed:
+                            checkpoint += 1
+                        if checkpoint > previous:
+                            self.save_checkpoint(windows[checkpoint - 1])
+                fill()
         
-        with transaction.atomic():
-            for record in data:
-                try:
-                    # Skip if collision_id already exists (avoid duplicates)
-                    collision_id = int(record.get('collision_id', 0))
-                    if Crash.objects.filter(collision_id=collision_id).exists():
-                        continue
-                    
-                    # Create Crash object from API data
-                    crash = Crash.objects.create(
-                        collision_id=collision_id,
-                        crash_date=self.parse_date(record.get('crash_date')),
-                        crash_time=record.get('crash_time', ''),
-                        latitude=float(record.get('latitude', 0)),
-                        longitude=float(record.get('longitude', 0)),
-                        borough=record.get('borough', ''),
-                        zip_code=record.get('zip_code', ''),
-                        on_street_name=record.get('on_street_name', ''),
-                        cross_street_name=record.get('cross_street_name', ''),
-                        off_street_name=record.get('off_street_name', ''),
-                        number_of_persons_injured=int(record.get('number_of_persons_injured', 0)),
-                        number_of_persons_killed=int(record.get('number_of_persons_killed', 0)),
-                        number_of_pedestrians_injured=int(record.get('number_of_pedestrians_injured', 0)),
-                        number_of_pedestrians_killed=int(record.get('number_of_pedestrians_killed', 0)),
-                        number_of_cyclist_injured=int(record.get('number_of_cyclist_injured', 0)),
-                        number_of_cyclist_killed=int(record.get('number_of_cyclist_killed', 0)),
-                        number_of_motorist_injured=int(record.get('number_of_motorist_injured', 0)),
-                        number_of_motorist_killed=int(record.get('number_of_motorist_killed', 0)),
-                        contributing_factor_vehicle_1=record.get('contributing_factor_vehicle_1', ''),
-                        contributing_factor_vehicle_2=record.get('contributing_factor_vehicle_2', ''),
-                        contributing_factor_vehicle_3=record.get('contributing_factor_vehicle_3', ''),
-                        contributing_factor_vehicle_4=record.get('contributing_factor_vehicle_4', ''),
-                        contributing_factor_vehicle_5=record.get('contributing_factor_vehicle_5', ''),
-                        vehicle_type_code1=record.get('vehicle_type_code1', ''),
-                        vehicle_type_code2=record.get('vehicle_type_code2', ''),
-                        vehicle_type_code_3=record.get('vehicle_type_code_3', ''),
-                        vehicle_type_code_4=record.get('vehicle_type_code_4', ''),
-                        vehicle_type_code_5=record.get('vehicle_type_code_5', ''),
-                    )
-                    saved_count += 1
-                    
-                except (ValueError, KeyError) as e:
-                    # Skip invalid records
-                    self.stdout.write(f"Skipping invalid record: {e}")
-                    continue
+        raw.put(None)
+        parser.join()
+        self.elapsed = time.perf_counter() - started
+        if failure is not None:
+            raise failure
         
-        return saved_count
+        return total_fetched
     
-    def parse_date(self, date_string):
-        """Parse NYC API date format"""
-        if not date_string:
-            return datetime.now()
-        
-        try:
-            # Handle different date formats from NYC API
-            if 'T' in date_string:
-                return datetime.fromisoformat(date_string.replace('Z', '+00:00'))
-            else:
-                return datetime.strptime(date_string, '%Y-%m-%d')
-        except:
-            return datetime.now()
\ No newline at end of file
+    def process_frame(self, frame, rejects, stats):
+        """Save a normalized frame to the database in one transaction"""
+        started = time.perf_counter()
+        self.rejects.add(rejects)
+        saved_count = self.writer.write_frame(frame)
+        stats.add(len(frame), time.perf_counter() - started)
+        return saved_count
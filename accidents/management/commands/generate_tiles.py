@@ -0,0 +1,51 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from accidents.filters import parse_bbox
+from accidents.points import crash_points
+from accidents.tiles import (
+    MAX_TILE_ZOOM, NYC_BBOX, load_hotspots, prune_tile_cache, store_tile, tile_directory, tile_path,
+    tiles_at_zoom,
+)
+
+class Command(BaseCommand):
+    help = 'Pre-generate the cached crash and hotspot vector tiles'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--min-zoom', type=int, default=0, help='Lowest zoom level to generate')
+        parser.add_argument('--max-zoom', type=int, default=MAX_TILE_ZOOM, help='Highest zoom level to generate')
+        parser.add_argument('--bbox', type=str, help='min_lon,min_lat,max_lon,max_lat to cover (default: NYC)')
+        parser.add_argument('--force', action='store_true', help='Rebuild tiles that are already cached')
+    
+    def handle(self, *args, **options):
+        min_zoom = options['min_zoom']
+        max_zoom = options['max_zoom']
+        if not 0 <= min_zoom <= max_zoom <= MAX_TILE_ZOOM:
+            raise CommandError(f'Zoom levels must satisfy 0 <= min-zoom <= max-zoom <= {MAX_TILE_ZOOM}')
+        try:
+            bbox = parse_bbox(options['bbox']) if options['bbox'] else NYC_BBOX
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        prune_tile_cache()
+        directory = tile_directory()
+        points = crash_points()
+        hotspots = load_hotspots()
+        
+        for zoom in range(min_zoom, max_zoom + 1):
+            started = time.perf_counter()
+            written = skipped = 0
+            for tile_x, tile_y, tile in tiles_at_zoom(points, hotspots, zoom, bbox):
+                path = tile_path(directory, zoom, tile_x, tile_y)
+                if not options['force'] and os.path.exists(path):
+                    skipped += 1
+                    continue
+                store_tile(path, tile)
+                written += 1
+            self.stdout.write(
+                f"Zoom {zoom}: wrote {written} tiles, kept {skipped} cached "
+                f"({time.perf_counter() - started:.1f}s)"
+            )
+        
+        self.stdout.write(self.style.SUCCESS(f"Tiles cached in {directory}"))
@@ -1,9 +1,157 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.db import models
-from datetime import timedelta
+from django.db import connection, models
+from datetime import datetime, timedelta, timezone as dt_timezone
+from accidents.ingest import CrashWriter, clear_crashes
 from accidents.models import Crash
+import numpy as np
+import pandas as pd
 import random
+import time
+
+# NYC boroughs and their approximate coordinates
+BOROUGHS = [
+    ('MANHATTAN', 40.7831, -73.9712),
+    ('BROOKLYN', 40.6782, -73.9442),
+    ('QUEENS', 40.7282, -73.7949),
+    ('BRONX', 40.8448, -73.8648),
+    ('STATEN ISLAND', 40.5795, -74.1502),
+]
+
+# Common contributing factors
+CONTRIBUTING_FACTORS = [
+    'Driver Inattention/Distraction',
+    'Following Too Closely',
+    'Unsafe Speed',
+    'Failure to Yield Right-of-Way',
+    'Passing or Lane Usage Improper',
+    'Backing Unsafely',
+    'Passing Too Closely',
+    'Turning Improperly',
+    'Traffic Control Disregarded',
+    'Other Vehicular',
+]
+
+# Common vehicle types
+VEHICLE_TYPES = [
+    'PASSENGER VEHICLE',
+    'SPORT UTILITY / STATION WAGON',
+    'TAXI',
+    'PICK-UP TRUCK',
+    'LIVERY VEHICLE',
+    'BICYCLE',
+    'MOTORCYCLE',
+    'BUS',
+    'TRUCK',
+    'VAN',
+]
+
+# Common street names by borough
+STREET_NAMES = {
+    'MANHATTAN': ['BROADWAY', '5TH AVE', 'LEXINGTON AVE', 'MADISON AVE', 'PARK AVE'],
+    'BROOKLYN': ['FLATBUSH AVE', 'ATLANTIC AVE', 'BROOKLYN AVE', '4TH AVE', 'OCEAN PKWY'],
+    'QUEENS': ['QUEENS BLVD', 'WOODHAVEN BLVD', 'NORTHERN BLVD', 'ASTORIA BLVD', 'ROCKAWAY BLVD'],
+    'BRONX': ['FORDHAM RD', 'CONCOURSE', 'WHITE PLAINS RD', 'BROADWAY', '3RD AVE'],
+    'STATEN ISLAND': ['HYLAN BLVD', 'RICHMOND AVE', 'VICTORY BLVD', 'ARTHUR KILL RD', 'RICHMOND RD'],
+}
+
+# Zip codes by borough (rough approximation)
+ZIP_CODES = {
+    'MANHATTAN': ['10001', '10002', '10003', '10004', '10005'],
+    'BROOKLYN': ['11201', '11202', '11203', '11204', '11205'],
+    'QUEENS': ['11375', '11377', '11378', '11379', '11380'],
+    'BRONX': ['10451', '10452', '10453', '10454', '10455'],
+    'STATEN ISLAND': ['10301', '10302', '10303', '10304', '10305'],
+}
+
+# Share of crashes per borough in --scale mode, in BOROUGHS order
+BOROUGH_WEIGHTS = [0.20, 0.31, 0.27, 0.16, 0.06]
+
+# Relative crash frequency by hour of day, peaking at the evening rush
+HOUR_WEIGHTS = [
+    3, 2, 2, 2, 2, 3, 4, 6, 8, 7, 6, 6,
+    7, 7, 8, 9, 9, 9, 8, 7, 6, 5, 4, 3,
+]
+
+# --scale mode: crash hotspots per borough and the share of crashes near one
+HOTSPOTS_PER_BOROUGH = 12
+HOTSPOT_SHARE = 0.7
+
+# --scale mode dates end here rather than now, so runs are reproducible
+SCALE_END_DATE = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def pick(rng, choices, size, p=None):
+    """Draw ``size`` values from a list as an object array"""
+    return np.asarray(choices, dtype=object)[rng.choice(len(choices), size=size, p=p)]
+
+
+def generate_crashes(rng, hotspots, first_id, count, days=730):
+    """Generate a frame of ``count`` synthetic crashes with NumPy.
+
+    Locations cluster around ``hotspots`` (one row of centers per borough)
+    with the rest scattered over the borough.
+    """
+    borough = rng.choice(len(BOROUGHS), size=count, p=BOROUGH_WEIGHTS)
+    centers = np.array([(lat, lon) for _, lat, lon in BOROUGHS])
+
+    # Around a random hotspot of the borough, or anywhere near its center
+    near_hotspot = rng.random(count) < HOTSPOT_SHARE
+    hotspot = hotspots[borough, rng.integers(0, HOTSPOTS_PER_BOROUGH, size=count)]
+    origin = np.where(near_hotspot[:, None], hotspot, centers[borough])
+    spread = np.where(near_hotspot, 0.003, 0.04)[:, None]
+    location = origin + rng.normal(size=(count, 2)) * spread
+
+    hour = rng.choice(24, size=count, p=np.array(HOUR_WEIGHTS) / sum(HOUR_WEIGHTS))
+    minute = rng.integers(0, 60, size=count)
+    day = rng.integers(1, days + 1, size=count)
+
+    # Most crashes injure nobody; deaths are rare
+    injured = rng.poisson(0.35, size=count)
+    killed = (rng.random(count) < 0.002).astype('int64')
+    shares = [0.15, 0.08, 0.77]
+    injured_split = rng.multinomial(injured, shares)
+    killed_split = rng.multinomial(killed, shares)
+
+    streets = np.array([STREET_NAMES[name] for name, _, _ in BOROUGHS], dtype=object)
+    zip_codes = np.array([ZIP_CODES[name] for name, _, _ in BOROUGHS], dtype=object)
+    on_street = rng.integers(0, streets.shape[1], size=count)
+    cross_street = (on_street + rng.integers(1, streets.shape[1], size=count)) % streets.shape[1]
+    blank = np.full(count, '', dtype=object)
+
+    return pd.DataFrame({
+        'collision_id': np.arange(first_id, first_id + count, dtype='int64'),
+        # Like the source data, the date is midnight and the time is separate
+        'crash_date': pd.Timestamp(SCALE_END_DATE) - pd.to_timedelta(day, unit='D'),
+        'crash_time': pd.Series(hour).astype(str) + ':' + pd.Series(minute).astype(str).str.zfill(2),
+        'latitude': location[:, 0],
+        'longitude': location[:, 1],
+        'borough': np.array([name for name, _, _ in BOROUGHS], dtype=object)[borough],
+        'zip_code': zip_codes[borough, rng.integers(0, zip_codes.shape[1], size=count)],
+        'on_street_name': streets[borough, on_street],
+        'cross_street_name': streets[borough, cross_street],
+        'off_street_name': blank,
+        'number_of_persons_injured': injured,
+        'number_of_persons_killed': killed,
+        'number_of_pedestrians_injured': injured_split[:, 0],
+        'number_of_pedestrians_killed': killed_split[:, 0],
+        'number_of_cyclist_injured': injured_split[:, 1],
+        'number_of_cyclist_killed': killed_split[:, 1],
+        'number_of_motorist_injured': injured_split[:, 2],
+        'number_of_motorist_killed': killed_split[:, 2],
+        'contributing_factor_vehicle_1': pick(rng, CONTRIBUTING_FACTORS, count),
+        'contributing_factor_vehicle_2': np.where(
+            rng.random(count) < 0.3, pick(rng, CONTRIBUTING_FACTORS, count), blank
+        ),
+        'contributing_factor_vehicle_3': blank,
+        'contributing_factor_vehicle_4': blank,
+        'contributing_factor_vehicle_5': blank,
+        'vehicle_type_code1': pick(rng, VEHICLE_TYPES, count),
+        'vehicle_type_code2': np.where(rng.random(count) < 0.4, pick(rng, VEHICLE_TYPES, count), blank),
+        'vehicle_type_code_3': blank,
+        'vehicle_type_code_4': blank,
+        'vehicle_type_code_5': blank,
+    })
 
 
 class Command(BaseCommand):
@@ -21,6 +169,23 @@ class Command(BaseCommand):
             action='store_true',
             help='Clear existing crash data before importing'
         )
+        parser.add_argument(
+            '--scale',
+            action='store_true',
+            help='Generate --count crashes with NumPy and bulk insert them (for large load-test datasets)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed for --scale mode; the same seed gives the same data (default: 0)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100000,
+            help='Rows generated and inserted per chunk in --scale mode (default: 100000)'
+        )
 
     def handle(self, *args, **options):
         count = options['count']
@@ -28,65 +193,63 @@ class Command(BaseCommand):
         
         if clear:
             self.stdout.write('Clearing existing crash data...')
-            Crash.objects.all().delete()
+            clear_crashes()
             self.stdout.write(
                 self.style.SUCCESS('Successfully cleared existing data')
             )
         
-        self.stdout.write(f'Creating {count} test crash records...')
-        
-        # NYC boroughs and their approximate coordinates
-        boroughs = [
-            ('MANHATTAN', 40.7831, -73.9712),
-            ('BROOKLYN', 40.6782, -73.9442),
-            ('QUEENS', 40.7282, -73.7949),
-            ('BRONX', 40.8448, -73.8648),
-            ('STATEN ISLAND', 40.5795, -74.1502),
-        ]
+        if options['scale']:
+            created_count = self.generate_scaled(count, options['seed'], options['chunk_size'])
+        else:
+            created_count = self.create_records(count)
         
-        # Common contributing factors
-        contributing_factors = [
-            'Driver Inattention/Distraction',
-            'Following Too Closely',
-            'Unsafe Speed',
-            'Failure to Yield Right-of-Way',
-            'Passing or Lane Usage Improper',
-            'Backing Unsafely',
-            'Passing Too Closely',
-            'Turning Improperly',
-            'Traffic Control Disregarded',
-            'Other Vehicular',
-        ]
-        
-        # Common vehicle types
-        vehicle_types = [
-            'PASSENGER VEHICLE',
-            'SPORT UTILITY / STATION WAGON',
-            'TAXI',
-            'PICK-UP TRUCK',
-            'LIVERY VEHICLE',
-            'BICYCLE',
-            'MOTORCYCLE',
-            'BUS',
-            'TRUCK',
-            'VAN',
-        ]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully created {created_count} test crash records'
+            )
+        )
+        self.print_summary()
+    
+    def generate_scaled(self, count, seed, chunk_size):
+        """Generate crashes in vectorized chunks and bulk insert them"""
+        self.stdout.write(f'Generating {count} test crash records (seed {seed})...')
+        rng = np.random.default_rng(seed)
+        centers = np.array([(lat, lon) for _, lat, lon in BOROUGHS])
+        hotspots = centers[:, None, :] + rng.normal(size=(len(BOROUGHS), HOTSPOTS_PER_BOROUGH, 2)) * 0.03
         
-        # Common street names by borough
-        street_names = {
-            'MANHATTAN': ['BROADWAY', '5TH AVE', 'LEXINGTON AVE', 'MADISON AVE', 'PARK AVE'],
-            'BROOKLYN': ['FLATBUSH AVE', 'ATLANTIC AVE', 'BROOKLYN AVE', '4TH AVE', 'OCEAN PKWY'],
-            'QUEENS': ['QUEENS BLVD', 'WOODHAVEN BLVD', 'NORTHERN BLVD', 'ASTORIA BLVD', 'ROCKAWAY BLVD'],
-            'BRONX': ['FORDHAM RD', 'CONCOURSE', 'WHITE PLAINS RD', 'BROADWAY', '3RD AVE'],
-            'STATEN ISLAND': ['HYLAN BLVD', 'RICHMOND AVE', 'VICTORY BLVD', 'ARTHUR KILL RD', 'RICHMOND RD'],
-        }
+        if connection.vendor == 'sqlite':
+            # Random keys touch most index pages; a page cache well above
+            # SQLite's 2MB default keeps them in memory for the load
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA cache_size = -262144')
+        # Facets and the tile cache are rebuilt once at the end instead of per chunk
+        writer = CrashWriter(batch_size=5000, defer_derived=True)
+        started = time.perf_counter()
+        generated = 0
+        while generated < count:
+            size = min(chunk_size, count - generated)
+            frame = generate_crashes(rng, hotspots, 100000000 + generated, size)
+            writer.write_frame(frame)
+            generated += size
+            self.stdout.write(
+                f'Generated {generated} crashes ({generated / (time.perf_counter() - started):.0f} rows/sec)'
+            )
+        writer.rebuild_derived()
+        self.stdout.write(
+            f'Rebuilt facets ({count / (time.perf_counter() - started):.0f} rows/sec overall)'
+        )
+        return writer.created
+    
+    def create_records(self, count):
+        """Create crashes one at a time with the ORM"""
+        self.stdout.write(f'Creating {count} test crash records...')
         
         created_count = 0
         base_collision_id = 100000000
         
         for i in range(count):
             # Select random borough
-            borough, base_lat, base_lon = random.choice(boroughs)
+            borough, base_lat, base_lon = random.choice(BOROUGHS)
             
             # Generate random coordinates within borough (rough approximation)
             lat = base_lat + random.uniform(-0.1, 0.1)
@@ -126,19 +289,12 @@ class Command(BaseCommand):
                 motorist_injured = motorist_killed = 0
             
             # Select random streets
-            streets = street_names[borough]
+            streets = STREET_NAMES[borough]
             on_street = random.choice(streets)
             cross_street = random.choice([s for s in streets if s != on_street])
             
-            # Generate zip code (rough approximation)
-            zip_codes = {
-                'MANHATTAN': ['10001', '10002', '10003', '10004', '10005'],
-                'BROOKLYN': ['11201', '11202', '11203', '11204', '11205'],
-                'QUEENS': ['11375', '11377', '11378', '11379', '11380'],
-                'BRONX': ['10451', '10452', '10453', '10454', '10455'],
-                'STATEN ISLAND': ['10301', '10302', '10303', '10304', '10305'],
-            }
-            zip_code = random.choice(zip_codes[borough])
+            # Pick a zip code in the borough
+            zip_code = random.choice(ZIP_CODES[borough])
             
             crash_data = {
                 'collision_id': base_collision_id + i,
@@ -159,10 +315,10 @@ class Command(BaseCommand):
                 'number_of_cyclist_killed': cyclist_killed,
                 'number_of_motorist_injured': motorist_injured,
                 'number_of_motorist_killed': motorist_killed,
-                'contributing_factor_vehicle_1': random.choice(contributing_factors),
-                'contributing_factor_vehicle_2': random.choice(contributing_factors) if random.random() < 0.3 else '',
-                'vehicle_type_code1': random.choice(vehicle_types),
-                'vehicle_type_code2': random.choice(vehicle_types) if random.random() < 0.4 else '',
+                'contributing_factor_vehicle_1': random.choice(CONTRIBUTING_FACTORS),
+                'contributing_factor_vehicle_2': random.choice(CONTRIBUTING_FACTORS) if random.random() < 0.3 else '',
+                'vehicle_type_code1': random.choice(VEHICLE_TYPES),
+                'vehicle_type_code2': random.choice(VEHICLE_TYPES) if random.random() < 0.4 else '',
             }
             
             try:
@@ -177,13 +333,10 @@ class Command(BaseCommand):
                     self.style.ERROR(f'Error creating crash {i}: {str(e)}')
                 )
         
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Successfully created {created_count} test crash records'
-            )
-        )
-        
-        # Display summary statistics
+        return created_count
+    
+    def print_summary(self):
+        """Display summary statistics"""
         total_crashes = Crash.objects.count()
         total_injured = Crash.objects.aggregate(
             total=models.Sum('number_of_persons_injured')
@@ -0,0 +1,82 @@
+import os
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from accidents.ingest import CrashWriter, RejectReport
+from accidents.normalize import normalize_frame
+
+class Command(BaseCommand):
+    help = 'Load a downloaded NYC Motor Vehicle Collisions dump (CSV or NDJSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='Path to the dump (.csv, .ndjson or .jsonl, optionally compressed)')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'ndjson'],
+            help='File format (default: guessed from the file extension)'
+        )
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Rows parsed and committed per chunk')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument(
+            '--on-conflict',
+            choices=CrashWriter.ON_CONFLICT_CHOICES,
+            default='update',
+            help='Skip existing crashes (ignore) or rewrite those whose contents changed (update)'
+        )
+        parser.add_argument('--reject-file', type=str, help='Write rejected rows to this NDJSON file')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+
+        file_format = options['format'] or self.guess_format(path)
+        writer = CrashWriter(
+            batch_size=options['batch_size'],
+            on_conflict=options['on_conflict'],
+        )
+
+        rejects = RejectReport(options['reject_file'])
+        rows_read = 0
+        started = time.perf_counter()
+
+        self.stdout.write(f"Loading {file_format} dump from {path}...")
+        for chunk in self.read_chunks(path, file_format, options['chunk_size']):
+            frame, rejected = normalize_frame(chunk)
+            writer.write_frame(frame)
+            rejects.add(rejected)
+            rows_read += len(chunk)
+
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"Read {rows_read} rows: {writer.created} created, {writer.updated} updated, "
+                f"{rejects.total} rejected ({rows_read / elapsed:.0f} rows/sec)"
+            )
+
+        for line in rejects.lines():
+            self.stdout.write(f"  {line}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded {rows_read} rows in {time.perf_counter() - started:.1f}s. "
+                f"Write summary: {writer.summary()}"
+            )
+        )
+
+    def guess_format(self, path):
+        name = path.lower()
+        for suffix in ('.gz', '.bz2', '.zip', '.xz', '.zst'):
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+        if name.endswith('.csv'):
+            return 'csv'
+        if name.endswith(('.ndjson', '.jsonl', '.json')):
+            return 'ndjson'
+        raise CommandError(f"Cannot tell the format of {path}, pass --format")
+
+    def read_chunks(self, path, file_format, chunk_size):
+        """Yield the dump as frames of raw values, chunk_size rows at a time"""
+        if file_format == 'csv':
+            # Keep every value a string; typing is done by normalize_frame
+            return pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size)
+        return pd.read_json(path, lines=True, dtype=False, convert_dates=False, chunksize=chunk_size)
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from accidents.facets import FACETS
+from accidents.models import CrashDailySummary, CrashHourlyRollup
+from accidents.summary import rebuild_daily_summary, rebuild_hourly_rollup
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the daily summary and hourly rollup used by the stats and timeseries endpoints, '
+        'and optionally the factor and vehicle type facets'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', type=str, help='First day to rebuild (YYYY-MM-DD, default: all)')
+        parser.add_argument('--end-date', type=str, help='Last day to rebuild (YYYY-MM-DD, default: all)')
+        parser.add_argument(
+            '--facets',
+            action='store_true',
+            help='Also rebuild the factor and vehicle type facet tables of every crash'
+        )
+    
+    def handle(self, *args, **options):
+        start_date = self.parse_option_date(options['start_date'])
+        end_date = self.parse_option_date(options['end_date'])
+        
+        rebuild_daily_summary(start_date, end_date)
+        rebuild_hourly_rollup(start_date, end_date)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt daily summary: {CrashDailySummary.objects.count()} rows, "
+            f"hourly rollup: {CrashHourlyRollup.objects.count()} rows"
+        ))
+        
+        if options['facets']:
+            for name, facet in FACETS.items():
+                facet.rebuild()
+                self.stdout.write(self.style.SUCCESS(
+                    f"Rebuilt {name} facet: {facet.link.objects.count()} rows, "
+                    f"{facet.model.objects.filter(crash_count__gt=0).count()} values"
+                ))
+    
+    def parse_option_date(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
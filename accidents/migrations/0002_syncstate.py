@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_window_start', models.DateField(blank=True, null=True)),
+                ('last_window_end', models.DateField(blank=True, null=True)),
+                ('max_crash_date', models.DateTimeField(blank=True, null=True)),
+                ('max_collision_id', models.BigIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidents', '0002_syncstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crash',
+            name='content_hash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
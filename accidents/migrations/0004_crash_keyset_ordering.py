@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidents', '0003_crash_content_hash'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='crash',
+            options={'ordering': ['-crash_date', 'collision_id']},
+        ),
+        migrations.AddIndex(
+            model_name='crash',
+            index=models.Index(fields=['-crash_date', 'collision_id'], name='crash_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:48
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_total_severity(apps, schema_editor):
+    Crash = apps.get_model('accidents', 'Crash')
+    Crash.objects.update(
+        total_severity=F('number_of_persons_injured') + F('number_of_persons_killed') * 10
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidents', '0004_crash_keyset_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crash',
+            name='total_severity',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        # One UPDATE fills total_severity on every row; the index is then sorted once from the filled column
+        migrations.RunPython(backfill_total_severity, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='crash',
+            index=models.Index(fields=['total_severity'], name='accidents_c_total_s_595644_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:50
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_daily_summary(apps, schema_editor):
+    Crash = apps.get_model('accidents', 'Crash')
+    CrashDailySummary = apps.get_model('accidents', 'CrashDailySummary')
+    groups = Crash.objects.order_by().annotate(date=TruncDate('crash_date')).values('date', 'borough').annotate(
+        crash_count=Count('collision_id'),
+        injured=Sum('number_of_persons_injured'),
+        killed=Sum('number_of_persons_killed'),
+    )
+    CrashDailySummary.objects.bulk_create(
+        (CrashDailySummary(**group) for group in groups.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidents', '0005_crash_total_severity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrashDailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('borough', models.CharField(blank=True, max_length=50)),
+                ('crash_count', models.IntegerField(default=0)),
+                ('injured', models.IntegerField(default=0)),
+                ('killed', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='crashdailysummary',
+            constraint=models.UniqueConstraint(fields=('date', 'borough'), name='unique_daily_summary'),
+        ),
+        migrations.RunPython(build_daily_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:53
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Floor
+
+# Grid constants of accidents.geo at the time of this migration
+CELL_SIZE = 0.005
+CELL_ROW_STRIDE = 100000
+
+
+def backfill_geo_cell(apps, schema_editor):
+    Crash = apps.get_model('accidents', 'Crash')
+    Crash.objects.update(
+        geo_cell=Floor((F('latitude') + 90) / CELL_SIZE) * CELL_ROW_STRIDE
+        + Floor((F('longitude') + 180) / CELL_SIZE)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidents', '0006_crashdailysummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crash',
+            name='geo_cell',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        # Existing rows have no geo_cell until the backfill, so the cell index is added once they do
+        migrations.RunPython(backfill_geo_cell, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='crash',
+            index=models.Index(fields=['geo_cell'], name='accidents_c_geo_cel_1a4ab3_idx'),
+        ),
+    ]
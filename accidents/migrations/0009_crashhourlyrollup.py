@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:40
+
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Sum, Value, When
+from django.db.models.functions import Cast, StrIndex, Substr, TruncDate
+
+
+def build_hourly_rollup(apps, schema_editor):
+    Crash = apps.get_model('accidents', 'Crash')
+    CrashHourlyRollup = apps.get_model('accidents', 'CrashHourlyRollup')
+    hour = Case(
+        When(
+            crash_time__regex=r'^([01]?[0-9]|2[0-3]):',
+            then=Cast(Substr('crash_time', 1, StrIndex('crash_time', Value(':')) - 1), IntegerField()),
+        ),
+        default=Value(-1),
+    )
+    groups = Crash.objects.order_by().annotate(
+        date=TruncDate('crash_date'), hour=hour
+    ).values('date', 'hour', 'borough', 'zip_code').annotate(
+        crash_count=Count('collision_id'),
+        injured=Sum('number_of_persons_injured'),
+        killed=Sum('number_of_persons_killed'),
+    )
+    CrashHourlyRollup.objects.bulk_create(
+        (CrashHourlyRollup(**group) for group in groups.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidents', '0008_datasetversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrashHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.SmallIntegerField()),
+                ('borough', models.CharField(blank=True, max_length=50)),
+                ('zip_code', models.CharField(blank=True, max_length=10)),
+                ('crash_count', models.IntegerField(default=0)),
+                ('injured', models.IntegerField(default=0)),
+                ('killed', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='crashhourlyrollup',
+            constraint=models.UniqueConstraint(fields=('date', 'hour', 'borough', 'zip_code'), name='unique_hourly_rollup'),
+        ),
+        migrations.RunPython(build_hourly_rollup, migrations.RunPython.noop),
+    ]
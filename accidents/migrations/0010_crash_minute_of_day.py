@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:58
+
+from django.db import migrations, models
+from django.db.models import F, IntegerField, Value
+from django.db.models.functions import Cast, StrIndex, Substr
+
+
+def backfill_minute_of_day(apps, schema_editor):
+    Crash = apps.get_model('accidents', 'Crash')
+    colon = StrIndex('crash_time', Value(':'))
+    Crash.objects.filter(crash_time__regex=r'^([01]?[0-9]|2[0-3]):([0-5][0-9])').update(
+        minute_of_day=Cast(Substr('crash_time', 1, colon - 1), IntegerField()) * 60
+        + Cast(Substr('crash_time', colon + 1, 2), IntegerField())
+    )
+    # Integer division truncates, giving the hour
+    Crash.objects.filter(minute_of_day__isnull=False).update(hour=F('minute_of_day') / 60)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidents', '0009_crashhourlyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crash',
+            name='hour',
+            field=models.SmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='crash',
+            name='minute_of_day',
+            field=models.SmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        # The backfill writes minute_of_day and then hour in two UPDATEs; indexing afterwards skips maintaining both indexes through them
+        migrations.RunPython(backfill_minute_of_day, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='crash',
+            index=models.Index(fields=['minute_of_day'], name='accidents_c_minute__06104b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='crash',
+            index=models.Index(fields=['hour'], name='accidents_c_hour_a09c90_idx'),
+        ),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:25
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+FACETS = [
+    ('Factor', 'CrashFactor', 'factor', [
+        'contributing_factor_vehicle_1',
+        'contributing_factor_vehicle_2',
+        'contributing_factor_vehicle_3',
+        'contributing_factor_vehicle_4',
+        'contributing_factor_vehicle_5',
+    ]),
+    ('VehicleType', 'CrashVehicle', 'vehicle_type', [
+        'vehicle_type_code1',
+        'vehicle_type_code2',
+        'vehicle_type_code_3',
+        'vehicle_type_code_4',
+        'vehicle_type_code_5',
+    ]),
+]
+
+
+def build_facets(apps, schema_editor):
+    Crash = apps.get_model('accidents', 'Crash')
+    quote = schema_editor.quote_name
+    for model_name, link_name, field, columns in FACETS:
+        Model = apps.get_model('accidents', model_name)
+        Link = apps.get_model('accidents', link_name)
+        names = set()
+        for column in columns:
+            names.update(Crash.objects.exclude(**{column: ''}).order_by().values_list(column, flat=True).distinct())
+        Model.objects.bulk_create([Model(name=name) for name in sorted(names)], batch_size=500)
+        for slot, column in enumerate(columns, 1):
+            schema_editor.execute(
+                'INSERT INTO %s (crash_id, slot, %s) SELECT c.collision_id, %%s, d.id FROM %s c JOIN %s d ON d.name = c.%s'
+                % (
+                    quote(Link._meta.db_table),
+                    quote(f'{field}_id'),
+                    quote(Crash._meta.db_table),
+                    quote(Model._meta.db_table),
+                    quote(column),
+                ),
+                [slot],
+            )
+        cited = Link.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+            crash_count=Count('crash', distinct=True)
+        ).values('crash_count')
+        Model.objects.update(crash_count=Coalesce(Subquery(cited), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidents', '0010_crash_minute_of_day'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Factor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('crash_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VehicleType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('crash_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CrashFactor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('crash', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='factors', to='accidents.crash')),
+                ('factor', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='accidents.factor')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CrashVehicle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('crash', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vehicles', to='accidents.crash')),
+                ('vehicle_type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='accidents.vehicletype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['vehicle_type', 'crash'], name='accidents_c_vehicle_49a3f8_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='crashvehicle',
+            constraint=models.UniqueConstraint(fields=('crash', 'slot'), name='unique_crash_vehicle'),
+        ),
+        migrations.AddIndex(
+            model_name='crashfactor',
+            index=models.Index(fields=['factor', 'crash'], name='accidents_c_factor__7aa897_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='crashfactor',
+            constraint=models.UniqueConstraint(fields=('crash', 'slot'), name='unique_crash_factor'),
+        ),
+        migrations.RunPython(build_facets, migrations.RunPython.noop),
+    ]
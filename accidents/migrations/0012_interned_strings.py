@@ -0,0 +1,164 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:10
+
+import accidents.fields
+from django.db import migrations, models
+from django.db.models import CharField, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce
+
+
+# Crash columns and the lookup model their values move to
+INTERNED_COLUMNS = {
+    'borough': 'Borough',
+    'zip_code': 'ZipCode',
+    'on_street_name': 'Street',
+    'cross_street_name': 'Street',
+    'off_street_name': 'Street',
+    'contributing_factor_vehicle_1': 'Factor',
+    'contributing_factor_vehicle_2': 'Factor',
+    'contributing_factor_vehicle_3': 'Factor',
+    'contributing_factor_vehicle_4': 'Factor',
+    'contributing_factor_vehicle_5': 'Factor',
+    'vehicle_type_code1': 'VehicleType',
+    'vehicle_type_code2': 'VehicleType',
+    'vehicle_type_code_3': 'VehicleType',
+    'vehicle_type_code_4': 'VehicleType',
+    'vehicle_type_code_5': 'VehicleType',
+}
+
+
+def intern_columns(apps, schema_editor):
+    # Replace each string with the id of its lookup row while the columns
+    # are still text; blanks become 0. AlterField then retypes them.
+    Crash = apps.get_model('accidents', 'Crash')
+    for column, model_name in INTERNED_COLUMNS.items():
+        Lookup = apps.get_model('accidents', model_name)
+        names = Crash.objects.exclude(**{column: ''}).order_by().values_list(column, flat=True).distinct()
+        Lookup.objects.bulk_create([Lookup(name=name) for name in names], batch_size=500, ignore_conflicts=True)
+    for column, model_name in INTERNED_COLUMNS.items():
+        Lookup = apps.get_model('accidents', model_name)
+        pk = Lookup.objects.filter(name=OuterRef(column)).values('pk')
+        Crash.objects.update(**{column: Cast(Coalesce(Subquery(pk), Value(0)), CharField())})
+
+
+def restore_columns(apps, schema_editor):
+    Crash = apps.get_model('accidents', 'Crash')
+    for column, model_name in INTERNED_COLUMNS.items():
+        Lookup = apps.get_model('accidents', model_name)
+        name = Lookup.objects.filter(pk=Cast(OuterRef(column), IntegerField())).values('name')
+        Crash.objects.update(**{column: Coalesce(Subquery(name), Value(''))})
+
+
+
+def analyze(apps, schema_editor):
+    # Rebuilding the crash table drops its planner statistics on SQLite,
+    # without which it stops walking the keyset index for filtered pages
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('ANALYZE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accidents', '0011_crash_facets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Borough',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Street',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ZipCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=10, unique=True)),
+            ],
+        ),
+        migrations.RunPython(intern_columns, restore_columns),
+        migrations.AlterField(
+            model_name='crash',
+            name='borough',
+            field=accidents.fields.InternedCharField(lookup='accidents.Borough', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='contributing_factor_vehicle_1',
+            field=accidents.fields.InternedCharField(lookup='accidents.Factor', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='contributing_factor_vehicle_2',
+            field=accidents.fields.InternedCharField(lookup='accidents.Factor', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='contributing_factor_vehicle_3',
+            field=accidents.fields.InternedCharField(lookup='accidents.Factor', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='contributing_factor_vehicle_4',
+            field=accidents.fields.InternedCharField(lookup='accidents.Factor', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='contributing_factor_vehicle_5',
+            field=accidents.fields.InternedCharField(lookup='accidents.Factor', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='cross_street_name',
+            field=accidents.fields.InternedCharField(lookup='accidents.Street', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='off_street_name',
+            field=accidents.fields.InternedCharField(lookup='accidents.Street', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='on_street_name',
+            field=accidents.fields.InternedCharField(lookup='accidents.Street', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='vehicle_type_code1',
+            field=accidents.fields.InternedCharField(lookup='accidents.VehicleType', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='vehicle_type_code2',
+            field=accidents.fields.InternedCharField(lookup='accidents.VehicleType', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='vehicle_type_code_3',
+            field=accidents.fields.InternedCharField(lookup='accidents.VehicleType', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='vehicle_type_code_4',
+            field=accidents.fields.InternedCharField(lookup='accidents.VehicleType', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='vehicle_type_code_5',
+            field=accidents.fields.InternedCharField(lookup='accidents.VehicleType', max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='crash',
+            name='zip_code',
+            field=accidents.fields.InternedCharField(lookup='accidents.ZipCode', max_length=10),
+        ),
+        migrations.RunPython(analyze, migrations.RunPython.noop),
+    ]
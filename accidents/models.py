@@ -1,4 +1,73 @@
-from django.db import models
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .fields import InternedCharField
+from .geo import grid_cell
+
+
+# crash_time values ("14:30", "2:05") that can be read as a time of day
+CRASH_TIME_PATTERN = r'^([01]?[0-9]|2[0-3]):([0-5][0-9])'
+
+
+def crash_severity(injured, killed):
+    """Severity score of a crash: injuries + 10 * fatalities.
+
+    Works on plain integers, pandas Series and query expressions alike.
+    """
+    return injured + killed * 10
+
+
+def crash_minute_of_day(crash_time):
+    """Minutes since midnight of a crash_time string, None if it cannot be read"""
+    match = re.match(CRASH_TIME_PATTERN, crash_time or '')
+    return int(match[1]) * 60 + int(match[2]) if match else None
+
+
+class Borough(models.Model):
+    """A distinct borough name, referenced by Crash.borough"""
+    name = models.CharField(max_length=50, unique=True)
+    
+    def __str__(self):
+        return self.name
+
+
+class ZipCode(models.Model):
+    """A distinct ZIP code, referenced by Crash.zip_code"""
+    name = models.CharField(max_length=10, unique=True)
+    
+    def __str__(self):
+        return self.name
+
+
+class Street(models.Model):
+    """A distinct street name, referenced by the street name columns of Crash"""
+    name = models.CharField(max_length=200, unique=True)
+    
+    def __str__(self):
+        return self.name
+
+
+class Factor(models.Model):
+    """A distinct contributing factor, with the number of crashes citing it"""
+    name = models.CharField(max_length=200, unique=True)
+    crash_count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.crash_count} crashes"
+
+
+class VehicleType(models.Model):
+    """A distinct vehicle type code, with the number of crashes involving it"""
+    name = models.CharField(max_length=50, unique=True)
+    crash_count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.crash_count} crashes"
+
 
 class Crash(models.Model):
     # Primary key from NYC API
@@ -8,14 +77,15 @@ class Crash(models.Model):
     crash_date = models.DateTimeField()
     crash_time = models.CharField(max_length=10, blank=True)
     
-    # Location fields
+    # Location fields; repeated strings here and below are stored as ids
+    # into lookup tables (see accidents.fields)
     latitude = models.FloatField()
     longitude = models.FloatField()
-    borough = models.CharField(max_length=50, blank=True)
-    zip_code = models.CharField(max_length=10, blank=True)
-    on_street_name = models.CharField(max_length=200, blank=True)
-    cross_street_name = models.CharField(max_length=200, blank=True)
-    off_street_name = models.CharField(max_length=200, blank=True)
+    borough = InternedCharField(Borough, max_length=50)
+    zip_code = InternedCharField(ZipCode, max_length=10)
+    on_street_name = InternedCharField(Street, max_length=200)
+    cross_street_name = InternedCharField(Street, max_length=200)
+    off_street_name = InternedCharField(Street, max_length=200)
     
     # Injury/fatality counts
     number_of_persons_injured = models.IntegerField(default=0)
@@ -28,31 +98,202 @@ class Crash(models.Model):
     number_of_motorist_killed = models.IntegerField(default=0)
     
     # Contributing factors (up to 5 vehicles)
-    contributing_factor_vehicle_1 = models.CharField(max_length=200, blank=True)
-    contributing_factor_vehicle_2 = models.CharField(max_length=200, blank=True)
-    contributing_factor_vehicle_3 = models.CharField(max_length=200, blank=True)
-    contributing_factor_vehicle_4 = models.CharField(max_length=200, blank=True)
-    contributing_factor_vehicle_5 = models.CharField(max_length=200, blank=True)
+    contributing_factor_vehicle_1 = InternedCharField(Factor, max_length=200)
+    contributing_factor_vehicle_2 = InternedCharField(Factor, max_length=200)
+    contributing_factor_vehicle_3 = InternedCharField(Factor, max_length=200)
+    contributing_factor_vehicle_4 = InternedCharField(Factor, max_length=200)
+    contributing_factor_vehicle_5 = InternedCharField(Factor, max_length=200)
     
     # Vehicle types (up to 5 vehicles)
-    vehicle_type_code1 = models.CharField(max_length=50, blank=True)
-    vehicle_type_code2 = models.CharField(max_length=50, blank=True)
-    vehicle_type_code_3 = models.CharField(max_length=50, blank=True)
-    vehicle_type_code_4 = models.CharField(max_length=50, blank=True)
-    vehicle_type_code_5 = models.CharField(max_length=50, blank=True)
+    vehicle_type_code1 = InternedCharField(VehicleType, max_length=50)
+    vehicle_type_code2 = InternedCharField(VehicleType, max_length=50)
+    vehicle_type_code_3 = InternedCharField(VehicleType, max_length=50)
+    vehicle_type_code_4 = InternedCharField(VehicleType, max_length=50)
+    vehicle_type_code_5 = InternedCharField(VehicleType, max_length=50)
+    
+    # Stored so severity filters and rankings can use an index; kept in
+    # sync by save() and the ingest writer
+    total_severity = models.IntegerField(default=0, editable=False)
+    
+    # crash_time parsed on save and ingest, so time-of-day filters and
+    # hourly aggregates run in SQL; null when the time cannot be read
+    minute_of_day = models.SmallIntegerField(null=True, blank=True, editable=False)
+    hour = models.SmallIntegerField(null=True, blank=True, editable=False)
+    
+    # Spatial grid cell of the location (see accidents.geo), indexed for radius searches
+    geo_cell = models.BigIntegerField(null=True, blank=True, editable=False)
+    
+    # Hash of the source fields, set on ingest to detect revised records
+    content_hash = models.BigIntegerField(null=True, blank=True, editable=False)
     
     class Meta:
         indexes = [
             models.Index(fields=['crash_date']),
             models.Index(fields=['borough']),
             models.Index(fields=['latitude', 'longitude']),
+            # Serves the list endpoint's keyset pagination
+            models.Index(fields=['-crash_date', 'collision_id'], name='crash_keyset_idx'),
+            models.Index(fields=['total_severity']),
+            models.Index(fields=['geo_cell']),
+            models.Index(fields=['minute_of_day']),
+            models.Index(fields=['hour']),
         ]
-        ordering = ['-crash_date']
+        ordering = ['-crash_date', 'collision_id']
     
     def __str__(self):
         return f"Crash {self.collision_id} on {self.crash_date} in {self.borough}"
     
-    @property
-    def total_severity(self):
-        """Calculate total severity score (injuries + 10*fatalities)"""
-        return self.number_of_persons_injured + (self.number_of_persons_killed * 10)
\ No newline at end of file
+    def save(self, *args, **kwargs):
+        self.total_severity = crash_severity(self.number_of_persons_injured, self.number_of_persons_killed)
+        self.geo_cell = grid_cell(self.latitude, self.longitude)
+        self.minute_of_day = crash_minute_of_day(self.crash_time)
+        self.hour = None if self.minute_of_day is None else self.minute_of_day // 60
+        # Commit the row together with what the save receivers derive from it
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class CrashFactor(models.Model):
+    """The contributing factor in one of a crash's contributing_factor_vehicle_N columns.
+
+    Kept in sync with the crash columns by ingest and save, so factor
+    filters and facets are indexed joins instead of five column scans.
+    """
+    crash = models.ForeignKey(Crash, on_delete=models.CASCADE, related_name='factors')
+    slot = models.PositiveSmallIntegerField()
+    factor = models.ForeignKey(Factor, on_delete=models.PROTECT)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['crash', 'slot'], name='unique_crash_factor'),
+        ]
+        indexes = [
+            models.Index(fields=['factor', 'crash']),
+        ]
+
+
+class CrashVehicle(models.Model):
+    """The vehicle type in one of a crash's vehicle_type_code columns, kept like CrashFactor"""
+    crash = models.ForeignKey(Crash, on_delete=models.CASCADE, related_name='vehicles')
+    slot = models.PositiveSmallIntegerField()
+    vehicle_type = models.ForeignKey(VehicleType, on_delete=models.PROTECT)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['crash', 'slot'], name='unique_crash_vehicle'),
+        ]
+        indexes = [
+            models.Index(fields=['vehicle_type', 'crash']),
+        ]
+
+
+class SyncState(models.Model):
+    """Progress of an ingest source, used for resuming and incremental syncs"""
+    name = models.CharField(max_length=50, unique=True)
+    
+    # End of the last contiguous run of fully fetched date windows
+    last_window_start = models.DateField(null=True, blank=True)
+    last_window_end = models.DateField(null=True, blank=True)
+    
+    # Watermark of the data ingested so far
+    max_crash_date = models.DateTimeField(null=True, blank=True)
+    max_collision_id = models.BigIntegerField(null=True, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} synced through {self.last_window_end}"
+
+
+class CrashDailySummary(models.Model):
+    """Crash totals per day and borough, kept up to date by ingest.
+
+    Lets the stats endpoint answer from a few rows per day instead of
+    scanning the crash table.
+    """
+    date = models.DateField()
+    borough = models.CharField(max_length=50, blank=True)
+    crash_count = models.IntegerField(default=0)
+    injured = models.IntegerField(default=0)
+    killed = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'borough'], name='unique_daily_summary'),
+        ]
+    
+    def __str__(self):
+        return f"{self.borough or 'Unknown'} on {self.date}: {self.crash_count} crashes"
+
+
+class CrashHourlyRollup(models.Model):
+    """Crash totals per day, hour, borough and ZIP code, kept up to date by ingest.
+
+    Serves trend queries that need the hour of day or a ZIP code; an hour
+    of UNKNOWN_HOUR counts crashes whose time could not be read.
+    """
+    UNKNOWN_HOUR = -1
+    
+    date = models.DateField()
+    hour = models.SmallIntegerField()
+    borough = models.CharField(max_length=50, blank=True)
+    zip_code = models.CharField(max_length=10, blank=True)
+    crash_count = models.IntegerField(default=0)
+    injured = models.IntegerField(default=0)
+    killed = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'hour', 'borough', 'zip_code'], name='unique_hourly_rollup'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.zip_code or self.borough or 'Unknown'} on {self.date} at {self.hour}h: {self.crash_count} crashes"
+
+
+# Dataset versions already read while serving the current request, by name
+_pinned_versions = ContextVar('pinned_versions', default={})
+
+
+class DatasetVersion(models.Model):
+    """Change counter of a dataset, used to invalidate in-process caches"""
+    name = models.CharField(max_length=50, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+    
+    @classmethod
+    def current(cls, name):
+        pinned = _pinned_versions.get()
+        if name in pinned:
+            return pinned[name]
+        return cls.stored(name)
+    
+    @classmethod
+    def stored(cls, name):
+        """The version in the database, even inside a pinned() block"""
+        return cls.objects.filter(name=name).values_list('version', flat=True).first() or 0
+    
+    @classmethod
+    @contextmanager
+    def pinned(cls, versions):
+        """Answer current() from a mapping of versions already read, inside the block"""
+        token = _pinned_versions.set({**_pinned_versions.get(), **versions})
+        try:
+            yield
+        finally:
+            _pinned_versions.reset(token)
+    
+    @classmethod
+    def bump(cls, name):
+        """Increment a dataset's version, creating its row on first use"""
+        # update() skips auto_now, so the timestamp is set here
+        changes = {'version': models.F('version') + 1, 'updated_at': timezone.now()}
+        if not cls.objects.filter(name=name).update(**changes):
+            obj, created = cls.objects.get_or_create(name=name, defaults={'version': 1})
+            if not created:
+                cls.objects.filter(name=name).update(**changes)
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+from .models import Crash
+
+
+INTEGER_FIELDS = [
+    'number_of_persons_injured',
+    'number_of_persons_killed',
+    'number_of_pedestrians_injured',
+    'number_of_pedestrians_killed',
+    'number_of_cyclist_injured',
+    'number_of_cyclist_killed',
+    'number_of_motorist_injured',
+    'number_of_motorist_killed',
+]
+
+TEXT_FIELDS = [
+    'crash_time',
+    'borough',
+    'zip_code',
+    'on_street_name',
+    'cross_street_name',
+    'off_street_name',
+    'contributing_factor_vehicle_1',
+    'contributing_factor_vehicle_2',
+    'contributing_factor_vehicle_3',
+    'contributing_factor_vehicle_4',
+    'contributing_factor_vehicle_5',
+    'vehicle_type_code1',
+    'vehicle_type_code2',
+    'vehicle_type_code_3',
+    'vehicle_type_code_4',
+    'vehicle_type_code_5',
+]
+
+# CSV exports name some columns differently from the API
+COLUMN_ALIASES = {
+    'vehicle_type_code_1': 'vehicle_type_code1',
+    'vehicle_type_code_2': 'vehicle_type_code2',
+}
+
+
+def canonical_column(name):
+    """Map a source column name ("VEHICLE TYPE CODE 1") to a Crash field name"""
+    name = str(name).strip().lower().replace(' ', '_')
+    return COLUMN_ALIASES.get(name, name)
+
+
+def to_number(values):
+    """Convert a column to float64, with unparseable values as NaN"""
+    try:
+        # A plain cast is several times faster than to_numeric when every value parses
+        return values.astype('float64')
+    except (ValueError, TypeError):
+        return pd.to_numeric(values, errors='coerce')
+
+
+def parse_crash_dates(values):
+    """Parse API (ISO 8601) and CSV (MM/DD/YYYY) dates as UTC timestamps"""
+    parsed = pd.to_datetime(values, format='ISO8601', errors='coerce', utc=True)
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry], format='%m/%d/%Y', errors='coerce', utc=True)
+    return parsed
+
+
+def normalize_frame(raw):
+    """Convert a frame of raw source records into typed Crash columns.
+
+    Returns ``(frame, rejects)``: ``frame`` has one column per Crash field
+    for every valid record, ``rejects`` holds the raw rows that could not be
+    loaded with a ``reject_reason`` column.
+    """
+    raw = raw.rename(columns=canonical_column)
+    blank = pd.Series('', index=raw.index, dtype=object)
+    missing = pd.Series(np.nan, index=raw.index, dtype=object)
+
+    def column(name):
+        return raw[name] if name in raw.columns else missing
+
+    columns = {
+        'collision_id': to_number(column('collision_id')),
+        'crash_date': parse_crash_dates(column('crash_date')),
+        'latitude': to_number(column('latitude')),
+        'longitude': to_number(column('longitude')),
+    }
+
+    for name in INTEGER_FIELDS:
+        columns[name] = to_number(column(name)).fillna(0).astype('int64')
+
+    for name in TEXT_FIELDS:
+        if name not in raw.columns:
+            columns[name] = blank
+            continue
+        values = raw[name].fillna('').astype(str)
+        # Truncation is a second pass over the column, so only pay for it when needed
+        max_length = Crash._meta.get_field(name).max_length
+        if max(map(len, values.to_numpy()), default=0) > max_length:
+            values = values.str.slice(0, max_length)
+        columns[name] = values
+
+    # Build the frame in one go; inserting columns one by one copies blocks
+    frame = pd.DataFrame(columns)
+
+    # Later checks take precedence when a row has several problems
+    reasons = pd.Series(None, index=raw.index, dtype=object)
+    no_location = (
+        frame['latitude'].isna() | frame['longitude'].isna()
+        | ((frame['latitude'] == 0) & (frame['longitude'] == 0))
+    )
+    reasons[no_location] = 'missing coordinates'
+    reasons[frame['crash_date'].isna()] = 'invalid crash_date'
+    reasons[frame['collision_id'].isna()] = 'invalid collision_id'
+
+    rejected = reasons.notna()
+    rejects = raw[rejected].assign(reject_reason=reasons[rejected])
+    frame = frame[~rejected].astype({'collision_id': 'int64'})
+    return frame, rejects
+
@@ -0,0 +1,83 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over crashes in (-crash_date, collision_id) order.
+
+    The cursor holds the sort key of the last row served, so each page is a
+    range scan of the matching index that starts where the previous page
+    stopped. Unlike OFFSET, a deep page costs the same as the first one.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 1000
+    max_page_size = 10000
+    ordering = ('-crash_date', 'collision_id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return one page of the queryset, raising ValueError for bad parameters"""
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            crash_date, collision_id = self.decode_cursor(cursor)
+            # The first condition bounds the index scan, the second skips
+            # rows already served that share the cursor's crash_date
+            queryset = queryset.filter(crash_date__lte=crash_date).filter(
+                Q(crash_date__lt=crash_date) | Q(collision_id__gt=collision_id)
+            )
+
+        # Fetch one extra row to learn whether there is a next page
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if not value:
+            return self.page_size
+        try:
+            page_size = int(value)
+        except ValueError:
+            page_size = 0
+        if page_size < 1:
+            raise ValueError("page_size must be a positive integer")
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, crash):
+        # Pages hold Crash instances or, for .values() querysets, dicts
+        if isinstance(crash, dict):
+            crash_date, collision_id = crash['crash_date'], crash['collision_id']
+        else:
+            crash_date, collision_id = crash.crash_date, crash.collision_id
+        key = f"{crash_date.isoformat()} {collision_id}"
+        return base64.urlsafe_b64encode(key.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            crash_date, collision_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(' ')
+            return datetime.fromisoformat(crash_date), int(collision_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Invalid cursor")
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
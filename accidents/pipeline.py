@@ -0,0 +1,64 @@
+import queue
+import threading
+
+
+class StageQueue(queue.Queue):
+    """Bounded queue between two pipeline stages that records its peak depth"""
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.max_depth = 0
+
+    def _put(self, item):
+        # Called with the queue's mutex held
+        super()._put(item)
+        self.max_depth = max(self.max_depth, len(self.queue))
+
+    def depth(self):
+        return f"{self.qsize()}/{self.maxsize}"
+
+
+class StageStats:
+    """Thread-safe row and timing counters for one pipeline stage.
+
+    ``busy`` is the time the stage spent working, excluding time blocked on
+    its queues, so comparing it with wall time shows which stage is the
+    bottleneck and how much the stages overlapped.
+    """
+
+    def __init__(self, name, inbox=None):
+        self.name = name
+        self.inbox = inbox
+        self.rows = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, rows, seconds):
+        with self.lock:
+            self.rows += rows
+            self.batches += 1
+            self.busy += seconds
+
+    @property
+    def rows_per_second(self):
+        if not self.busy:
+            return 0.0
+        return self.rows / self.busy
+
+    def summary(self):
+        line = (
+            f"{self.name}: {self.rows} rows in {self.batches} batches, "
+            f"busy {self.busy:.1f}s ({self.rows_per_second:.0f} rows/sec)"
+        )
+        if self.inbox is not None:
+            line += f", queue peak {self.inbox.max_depth}/{self.inbox.maxsize}"
+        return line
+
+
+def pipeline_summary(stages, wall):
+    """Lines describing each stage's throughput over a run of ``wall`` seconds"""
+    busy = sum(stage.busy for stage in stages)
+    lines = [f"Pipeline: {wall:.1f}s wall, {busy:.1f}s busy across stages ({busy / wall if wall else 0:.1f}x overlap)"]
+    lines.extend(f"  {stage.summary()}" for stage in stages)
+    return lines
@@ -0,0 +1,169 @@
+import threading
+
+import numpy as np
+from django.utils.functional import cached_property
+from sklearn.neighbors import BallTree
+
+from .geo import EARTH_RADIUS_M, mercator
+from .models import Crash, DatasetVersion
+from .versions import CRASHES
+
+
+# Map tiles are TILE_SIZE pixels wide; clusters cover CLUSTER_RADIUS_PX
+# pixel squares at any zoom
+TILE_SIZE = 256
+CLUSTER_RADIUS_PX = 60
+
+
+class CrashPoints:
+    """Packed arrays of every crash location at one version of the crash table.
+
+    Columns are plain NumPy arrays so the snapshot is compact (about 32
+    bytes per crash); the BallTree and clusters over them are only built
+    when first needed.
+    """
+
+    def __init__(self, version, collision_ids, latitudes, longitudes, injured, killed):
+        self.version = version
+        self.collision_ids = collision_ids
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.injured = injured
+        self.killed = killed
+        self._tree = None
+        self._tree_lock = threading.Lock()
+        self._clusters = {}
+
+    def __len__(self):
+        return len(self.collision_ids)
+
+    @classmethod
+    def load(cls, version):
+        rows = Crash.objects.order_by().values_list(
+            'collision_id', 'latitude', 'longitude', 'number_of_persons_injured', 'number_of_persons_killed'
+        )
+        packed = np.fromiter(
+            rows.iterator(chunk_size=10000),
+            dtype=[
+                ('collision_id', 'int64'),
+                ('latitude', 'float64'),
+                ('longitude', 'float64'),
+                ('injured', 'int32'),
+                ('killed', 'int32'),
+            ],
+        )
+        return cls(
+            version,
+            packed['collision_id'],
+            packed['latitude'],
+            packed['longitude'],
+            packed['injured'],
+            packed['killed'],
+        )
+
+    @property
+    def tree(self):
+        with self._tree_lock:
+            if self._tree is None:
+                coordinates = np.radians(np.column_stack([self.latitudes, self.longitudes]))
+                self._tree = BallTree(coordinates, metric='haversine')
+            return self._tree
+
+    @cached_property
+    def mercator(self):
+        """Web Mercator (x, y) arrays of every crash"""
+        return mercator(self.latitudes, self.longitudes)
+
+    def clusters(self, zoom):
+        """Return the Clusters of every crash at a zoom level, computed once per snapshot"""
+        clusters = self._clusters.get(zoom)
+        if clusters is None:
+            clusters = self._clusters.setdefault(zoom, Clusters.build(self, zoom))
+        return clusters
+
+    def nearest(self, latitude, longitude, k):
+        """Return (collision_ids, distances in metres) of the k closest crashes"""
+        k = min(k, len(self))
+        if not k:
+            return self.collision_ids[:0], np.empty(0)
+        distances, indexes = self.tree.query(np.radians([[latitude, longitude]]), k=k)
+        return self.collision_ids[indexes[0]], distances[0] * EARTH_RADIUS_M
+
+
+class Clusters:
+    """Crashes grouped into square screen-space grid cells at one zoom level.
+
+    A cell is CLUSTER_RADIUS_PX pixels on a side in Web Mercator, so
+    clusters keep the same spacing on screen at every zoom. Each cluster
+    holds the count, summed casualties and centroid of its crashes, plus
+    the collision_id when it holds a single crash.
+    """
+
+    def __init__(self, zoom, latitudes, longitudes, counts, injured, killed, collision_ids):
+        self.zoom = zoom
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.counts = counts
+        self.injured = injured
+        self.killed = killed
+        self.collision_ids = collision_ids
+
+    def __len__(self):
+        return len(self.counts)
+
+    @classmethod
+    def build(cls, points, zoom):
+        cell_size = CLUSTER_RADIUS_PX / (TILE_SIZE * 2 ** zoom)
+        columns = int(np.ceil(1 / cell_size))
+        x, y = points.mercator
+        cells = (
+            np.minimum(np.floor(y / cell_size), columns - 1).astype('int64') * columns
+            + np.minimum(np.floor(x / cell_size), columns - 1).astype('int64')
+        )
+        unique, members = np.unique(cells, return_inverse=True)
+        counts = np.bincount(members, minlength=len(unique))
+        # Only meaningful where the count is one, where the single member wins
+        collision_ids = np.empty(len(unique), dtype='int64')
+        collision_ids[members] = points.collision_ids
+        return cls(
+            zoom,
+            np.bincount(members, weights=points.latitudes, minlength=len(unique)) / counts,
+            np.bincount(members, weights=points.longitudes, minlength=len(unique)) / counts,
+            counts,
+            np.bincount(members, weights=points.injured, minlength=len(unique)).astype('int64'),
+            np.bincount(members, weights=points.killed, minlength=len(unique)).astype('int64'),
+            collision_ids,
+        )
+
+    def within(self, min_lon, min_lat, max_lon, max_lat):
+        """Return the indexes of clusters whose centroid lies in a bounding box"""
+        return np.flatnonzero(
+            (self.latitudes >= min_lat)
+            & (self.latitudes <= max_lat)
+            & (self.longitudes >= min_lon)
+            & (self.longitudes <= max_lon)
+        )
+
+
+_points = None
+_points_lock = threading.Lock()
+
+
+def crash_points():
+    """Return the snapshot of crash locations for the current crash table.
+
+    The snapshot is kept per process and reloaded when the crashes
+    DatasetVersion has moved on since it was built.
+    """
+    global _points
+    version = DatasetVersion.current(CRASHES)
+    points = _points
+    if points is not None and points.version == version:
+        return points
+    with _points_lock:
+        if _points is None or _points.version != version:
+            # The version is read before the rows, so a write racing the
+            # load only makes the snapshot newer than its version, and the
+            # next call reloads it
+            _points = CrashPoints.load(version)
+        return _points
@@ -0,0 +1,82 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class Echo:
+    """File-like object whose write() returns what it was given, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+class StreamingRenderer(BaseRenderer):
+    """Renderer that can also encode rows lazily for a streaming response.
+
+    ``stream(columns, chunks)`` takes an iterable of row chunks and yields one
+    encoded piece per chunk, so a response can start before the last rows
+    are read from the database.
+    """
+
+    charset = 'utf-8'
+
+    def stream(self, columns, chunks):
+        raise NotImplementedError
+
+
+class NDJSONRenderer(StreamingRenderer):
+    """Newline-delimited JSON, one object per row"""
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = [data]
+        return ''.join(json.dumps(item, cls=DjangoJSONEncoder) + '\n' for item in data).encode()
+
+    def stream(self, columns, chunks):
+        encode = DjangoJSONEncoder().encode
+        for rows in chunks:
+            yield ''.join(encode(dict(zip(columns, row))) + '\n' for row in rows)
+
+
+class CSVRenderer(StreamingRenderer):
+    """CSV with a header row"""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = [data]
+        if not data:
+            return b''
+        columns = list(data[0])
+        writer = csv.writer(Echo())
+        lines = [writer.writerow(columns)]
+        lines.extend(writer.writerow([item.get(column) for column in columns]) for item in data)
+        return ''.join(lines).encode()
+
+    def stream(self, columns, chunks):
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        for rows in chunks:
+            yield ''.join(writer.writerow(row) for row in rows)
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """Compact JSON holding one array per field instead of one object per row.
+
+    Views check for this renderer's format and build the columnar payload
+    themselves; the renderer only gives it its own media type.
+    """
+
+    media_type = 'application/vnd.crashes.columnar+json'
+    format = 'columnar'
@@ -0,0 +1,17 @@
+from django.dispatch import Signal
+
+
+# Sent by CrashWriter inside its transaction after each write. ``frame``
+# holds the rows written and ``previous`` the stored values of the rows
+# they overwrote (empty unless existing crashes were updated), both with
+# one column per Crash field. ``deferred`` is true during a bulk load that
+# ends with crashes_rebuilt, so receivers that rebuild more cheaply than
+# they update may wait for that.
+crashes_written = Signal()
+
+# Sent after crashes are deleted in bulk, e.g. by import_test_data --clear
+crashes_cleared = Signal()
+
+# Sent by CrashWriter.rebuild_derived after a bulk load whose writes were
+# deferred, so receivers that skipped them rebuild from the crash table
+crashes_rebuilt = Signal()
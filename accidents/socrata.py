@@ -0,0 +1,154 @@
+import codecs
+import json
+import threading
+import time
+from datetime import timedelta
+
+import requests
+
+
+# NYC Open Data Motor Vehicle Collisions - Crashes
+BASE_URL = "https://data.cityofnewyork.us/api/v3/views/h9gi-nx95/query.json"
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing ``rate`` requests per second.
+
+    Up to ``burst`` requests can start back to back before callers are
+    throttled to the steady rate.
+    """
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may start"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def iter_json_array(chunks):
+    """Yield the objects of a JSON array from an iterable of byte chunks.
+
+    Only the object being decoded is held in memory, so a page of any size
+    is parsed in constant space.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    started = False
+
+    for chunk in chunks:
+        buffer += text.decode(chunk)
+        pos = 0
+        while True:
+            # Skip whitespace and separators between elements
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Element continues in the next chunk
+                break
+            yield record
+        buffer = buffer[pos:]
+
+    buffer += text.decode(b'', final=True)
+    if buffer.strip():
+        raise ValueError("Truncated JSON array")
+
+
+def date_windows(start_date, end_date, first_days=60, days=30):
+    """Split [start_date, end_date) into fetch windows.
+
+    The first window spans ``first_days`` and the rest ``days`` each.
+    """
+    windows = []
+    window_start = start_date
+    span = first_days
+    while window_start < end_date:
+        window_end = min(window_start + timedelta(days=span), end_date)
+        windows.append((window_start, window_end))
+        window_start = window_end
+        span = days
+    return windows
+
+
+class SocrataClient:
+    """Thread-safe client for the collisions query endpoint"""
+
+    def __init__(self, base_url=BASE_URL, auth=None, timeout=30, rate_limiter=None):
+        self.base_url = base_url
+        self.auth = auth
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        # requests.Session is not thread-safe, so each worker keeps its own
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def build_payload(self, window, page_number, page_size):
+        start_date, end_date = window
+        return {
+            'query': (
+                "SELECT * WHERE latitude IS NOT NULL AND longitude IS NOT NULL "
+                f"AND crash_date >= '{start_date.strftime('%Y-%m-%d')}' "
+                f"AND crash_date < '{end_date.strftime('%Y-%m-%d')}'"
+            ),
+            'page': {
+                'pageNumber': page_number,
+                'pageSize': page_size
+            },
+            'includeSynthetic': False
+        }
+
+    def post(self, window, page_number, page_size, stream=False):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        response = self.session.post(
+            self.base_url,
+            headers={'Content-Type': 'application/json'},
+            json=self.build_payload(window, page_number, page_size),
+            auth=self.auth,
+            timeout=self.timeout,
+            stream=stream
+        )
+        response.raise_for_status()
+        return response
+
+    def fetch_page(self, window, page_number, page_size):
+        """Fetch one page of records for a date window"""
+        return self.post(window, page_number, page_size).json()
+
+    def stream_page(self, window, page_number, page_size, chunk_size=64 * 1024):
+        """Yield the records of a page as the response body arrives"""
+        with self.post(window, page_number, page_size, stream=True) as response:
+            yield from iter_json_array(response.iter_content(chunk_size=chunk_size))
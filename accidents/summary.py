@@ -0,0 +1,190 @@
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Crash, CrashDailySummary, CrashHourlyRollup
+from .signals import crashes_cleared, crashes_written
+
+
+SUMMARY_COLUMNS = ['crash_count', 'injured', 'killed']
+
+# Crash fields that decide a crash's summary and rollup rows and its counts there
+CRASH_SUMMARY_FIELDS = [
+    'crash_date', 'hour', 'borough', 'zip_code', 'number_of_persons_injured', 'number_of_persons_killed'
+]
+
+
+def summarize(frame, hourly=False):
+    """Group a frame of crashes into totals per day and borough.
+
+    With hourly, totals are per day, hour, borough and ZIP code instead,
+    as stored in CrashHourlyRollup.
+    """
+    columns = {'date': frame['crash_date'].dt.tz_convert(timezone.get_current_timezone()).dt.date}
+    if hourly:
+        columns['hour'] = frame['hour'].fillna(CrashHourlyRollup.UNKNOWN_HOUR).astype('int64')
+    columns['borough'] = frame['borough']
+    if hourly:
+        columns['zip_code'] = frame['zip_code']
+    keys = list(columns)
+    return pd.DataFrame({
+        **columns,
+        'crash_count': 1,
+        'injured': frame['number_of_persons_injured'],
+        'killed': frame['number_of_persons_killed'],
+    }).groupby(keys).sum()
+
+
+def apply_deltas(deltas, model=CrashDailySummary):
+    """Add deltas to the stored summary rows of model.
+
+    deltas is indexed by the model's unique key columns. One INSERT ...
+    ON CONFLICT DO UPDATE per group, run with executemany; the increments
+    happen in SQL so no summary rows are read first.
+    """
+    deltas = deltas[(deltas != 0).any(axis=1)]
+    if deltas.empty:
+        return
+    keys = list(deltas.index.names)
+    ops = connection.ops
+
+    def adapt(value):
+        if isinstance(value, date):
+            return ops.adapt_datefield_value(value)
+        if isinstance(value, np.integer):
+            return int(value)
+        return value
+
+    # Keys repeat a lot within a batch, so adapt each distinct value once
+    frame = deltas[SUMMARY_COLUMNS].astype('int64').reset_index()
+    for name in keys:
+        frame[name] = frame[name].map({value: adapt(value) for value in frame[name].unique()})
+    upsert_deltas(model, keys, list(frame.itertuples(index=False, name=None)))
+
+
+def upsert_deltas(model, keys, rows):
+    """Add rows of key values followed by SUMMARY_COLUMNS increments to the stored rows of model"""
+    ops = connection.ops
+    table = ops.quote_name(model._meta.db_table)
+    columns = ', '.join(ops.quote_name(name) for name in keys + SUMMARY_COLUMNS)
+    placeholders = ', '.join(['%s'] * (len(keys) + len(SUMMARY_COLUMNS)))
+    conflict = ', '.join(ops.quote_name(name) for name in keys)
+    increments = ', '.join(
+        f'{ops.quote_name(name)} = {table}.{ops.quote_name(name)} + excluded.{ops.quote_name(name)}'
+        for name in SUMMARY_COLUMNS
+    )
+    sql = (
+        f'INSERT INTO {table} ({columns}) VALUES ({placeholders}) '
+        f'ON CONFLICT ({conflict}) DO UPDATE SET {increments}'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def crashes_between(start_date=None, end_date=None):
+    """Crashes on the given local days (inclusive), all of them by default"""
+    crashes = Crash.objects.order_by()
+    if start_date:
+        crashes = crashes.filter(crash_date__gte=timezone.make_aware(datetime.combine(start_date, time.min)))
+    if end_date:
+        crashes = crashes.filter(
+            crash_date__lt=timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+        )
+    return crashes
+
+
+def rebuild(model, groups, start_date=None, end_date=None, names=None):
+    """Replace the rows of a summary model in a date range with freshly grouped ones.
+
+    names maps group keys to model fields where they differ.
+    """
+    names = names or {}
+    summaries = model.objects.all()
+    if start_date:
+        summaries = summaries.filter(date__gte=start_date)
+    if end_date:
+        summaries = summaries.filter(date__lte=end_date)
+    groups = groups.annotate(
+        crash_count=Count('collision_id'),
+        injured=Sum('number_of_persons_injured'),
+        killed=Sum('number_of_persons_killed'),
+    )
+    with transaction.atomic():
+        summaries.delete()
+        model.objects.bulk_create(
+            (model(**{names.get(key, key): value for key, value in group.items()}) for group in groups.iterator()),
+            batch_size=500,
+        )
+
+
+def rebuild_daily_summary(start_date=None, end_date=None):
+    """Recompute the summary from the crash table, optionally for a date range (inclusive)"""
+    groups = crashes_between(start_date, end_date).annotate(date=TruncDate('crash_date')).values(
+        'date', 'borough'
+    )
+    rebuild(CrashDailySummary, groups, start_date, end_date)
+
+
+def rebuild_hourly_rollup(start_date=None, end_date=None):
+    """Recompute the hourly rollup from the crash table, optionally for a date range (inclusive)"""
+    groups = crashes_between(start_date, end_date).annotate(
+        date=TruncDate('crash_date'), rollup_hour=Coalesce('hour', Value(CrashHourlyRollup.UNKNOWN_HOUR))
+    ).values('date', 'rollup_hour', 'borough', 'zip_code')
+    rebuild(CrashHourlyRollup, groups, start_date, end_date, names={'rollup_hour': 'hour'})
+
+
+@receiver(crashes_written)
+def update_daily_summary(sender, frame, previous, **kwargs):
+    for model, hourly in ((CrashDailySummary, False), (CrashHourlyRollup, True)):
+        deltas = summarize(frame, hourly)
+        if not previous.empty:
+            deltas = deltas.sub(summarize(previous, hourly), fill_value=0)
+        apply_deltas(deltas, model)
+
+
+def add_crash(values, sign=1):
+    """Add one crash's counts to its summary and rollup rows, or take them away with sign=-1.
+
+    values maps CRASH_SUMMARY_FIELDS to the crash's values.
+    """
+    day = connection.ops.adapt_datefield_value(timezone.localdate(values['crash_date']))
+    hour = CrashHourlyRollup.UNKNOWN_HOUR if values['hour'] is None else values['hour']
+    counts = (sign, sign * values['number_of_persons_injured'], sign * values['number_of_persons_killed'])
+    upsert_deltas(CrashDailySummary, ['date', 'borough'], [(day, values['borough']) + counts])
+    upsert_deltas(
+        CrashHourlyRollup, ['date', 'hour', 'borough', 'zip_code'],
+        [(day, hour, values['borough'], values['zip_code']) + counts],
+    )
+
+
+@receiver(pre_save, sender=Crash)
+def remember_stored_crash_counts(sender, instance, **kwargs):
+    # A save can move the crash to other rows, so its stored counts come off first
+    stored = Crash.objects.filter(pk=instance.pk).values(*CRASH_SUMMARY_FIELDS)
+    instance._stored_summary_values = stored.first()
+
+
+@receiver(post_save, sender=Crash)
+def refresh_saved_crash_counts(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_summary_values', None)
+    if stored:
+        add_crash(stored, -1)
+    add_crash({name: getattr(instance, name) for name in CRASH_SUMMARY_FIELDS})
+
+
+@receiver(post_delete, sender=Crash)
+def refresh_deleted_crash_counts(sender, instance, **kwargs):
+    add_crash({name: getattr(instance, name) for name in CRASH_SUMMARY_FIELDS}, -1)
+
+
+@receiver(crashes_cleared)
+def clear_daily_summary(sender, **kwargs):
+    CrashDailySummary.objects.all().delete()
+    CrashHourlyRollup.objects.all().delete()
@@ -1,10 +1,39 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest.mock import patch
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import FieldError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.utils import timezone
-from datetime import datetime, timedelta
-from .models import Crash
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .models import (
+    Borough, Crash, CrashDailySummary, CrashFactor, CrashHourlyRollup, CrashVehicle, DatasetVersion, Factor, Street,
+    SyncState, VehicleType,
+)
+from .facets import FACETS
+from .fields import clear_intern_caches, intern_cache
+from .geo import cell_ranges, grid_cell, haversine, mercator
+from .ingest import CrashWriter, clear_crashes, crashes_to_frame
+from . import points, tiles, timeseries
+from .socrata import iter_json_array
+from .versions import CRASHES, HOTSPOTS
+from hotspots.models import Hotspot
 
 
 class CrashModelTest(TestCase):
@@ -52,7 +81,7 @@ class CrashModelTest(TestCase):
         self.assertEqual(str(crash), expected_str)
     
     def test_total_severity_property(self):
-        """Test the total_severity property calculation"""
+        """Test that total_severity is stored on save"""
         # Test with injuries only
         crash = Crash.objects.create(**self.crash_data)
         self.assertEqual(crash.total_severity, 2)  # 2 injuries + 0*10 fatalities
@@ -62,6 +91,17 @@ class CrashModelTest(TestCase):
         crash.save()
         self.assertEqual(crash.total_severity, 12)  # 2 injuries + 1*10 fatalities
     
+    def test_time_of_day_columns(self):
+        """Test that crash_time is parsed into minute_of_day and hour on save"""
+        crash = Crash.objects.create(**self.crash_data)
+        self.assertEqual(crash.minute_of_day, 870)
+        self.assertEqual(crash.hour, 14)
+        
+        crash.crash_time = ''
+        crash.save()
+        self.assertIsNone(crash.minute_of_day)
+        self.assertIsNone(crash.hour)
+    
     def test_unique_collision_id(self):
         """Test that collision_id must be unique"""
         Crash.objects.create(**self.crash_data)
@@ -152,10 +192,11 @@ class CrashAPITest(APITestCase):
         response = self.client.get(url)
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNone(response.data['next'])
         
         # Check that each crash has the expected fields
-        for crash_data in response.data:
+        for crash_data in response.data['results']:
             self.assertIn('collision_id', crash_data)
             self.assertIn('crash_date', crash_data)
             self.assertIn('latitude', crash_data)
@@ -211,6 +252,40 @@ class CrashAPITest(APITestCase):
             self.assertIn('borough', result)
             self.assertIn('total_severity', result)
     
+    def test_search_by_location_exact_radius(self):
+        """Test that results are within the radius and sorted by distance"""
+        # About 700m and 1.3m east, and 1.1km north of the Manhattan crash
+        for collision_id, lat, lon in (
+            (111111112, 40.7589, -73.9768),
+            (111111113, 40.7589, -73.9851 + 0.0000158),
+            (111111114, 40.7689, -73.9851),
+        ):
+            Crash.objects.create(
+                collision_id=collision_id, crash_date=timezone.now(), latitude=lat, longitude=lon
+            )
+        
+        response = self.client.get(reverse('crash-search-by-location'), {
+            'lat': 40.7589,
+            'lon': -73.9851,
+            'radius': 1000
+        })
+        
+        results = response.data['results']
+        self.assertEqual([r['collision_id'] for r in results], [111111111, 111111113, 111111112])
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(results[0]['distance'], 0)
+        self.assertAlmostEqual(results[2]['distance'], 700, delta=5)
+    
+    def test_search_by_location_radius_limits(self):
+        """Test that non-positive and oversized radii are rejected"""
+        for radius in (0, -5, 10 ** 9):
+            response = self.client.get(reverse('crash-search-by-location'), {
+                'lat': 40.7589,
+                'lon': -73.9851,
+                'radius': radius
+            })
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
     def test_search_by_location_missing_params(self):
         """Test search by location with missing parameters"""
         url = reverse('crash-search-by-location')
@@ -258,6 +333,921 @@ class CrashAPITest(APITestCase):
         self.assertEqual(manhattan_stats['injured_count'], 1)
         self.assertEqual(manhattan_stats['killed_count'], 0)
 
+    
+    def list_ids(self, **params):
+        response = self.client.get(reverse('crash-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {crash['collision_id'] for crash in response.data['results']}
+    
+    def test_list_filters(self):
+        """Test filtering the crash list with query parameters"""
+        today = timezone.now().date()
+        self.assertEqual(self.list_ids(borough='brooklyn'), {222222222})
+        self.assertEqual(self.list_ids(min_severity=3), {222222222, 333333333})
+        self.assertEqual(self.list_ids(has_fatalities='true'), {222222222})
+        self.assertEqual(self.list_ids(has_injuries='true'), {111111111, 333333333})
+        self.assertEqual(self.list_ids(vehicle_type='passenger'), {111111111, 222222222, 333333333})
+        self.assertEqual(self.list_ids(vehicle_type='bicycle'), set())
+        self.assertEqual(
+            self.list_ids(
+                start_date=(today - timedelta(days=2)).isoformat(),
+                end_date=(today - timedelta(days=2)).isoformat(),
+            ),
+            {222222222}
+        )
+        self.assertEqual(self.list_ids(bbox='-74.0,40.7,-73.9,40.8'), {111111111})
+        self.assertEqual(self.list_ids(borough='QUEENS', has_injuries='1', min_severity=3), {333333333})
+    
+    def test_list_time_window(self):
+        """Test filtering the crash list by time of day, including windows wrapping midnight"""
+        self.assertEqual(self.list_ids(start_time='09:00', end_time='15:30'), {111111111})
+        self.assertEqual(self.list_ids(start_time='15:30'), {222222222})
+        self.assertEqual(self.list_ids(end_time='10:00'), {333333333})
+        self.assertEqual(self.list_ids(start_time='12:00', end_time='09:00'), {222222222, 333333333})
+    
+    def test_hourly(self):
+        """Test crash counts per hour of day"""
+        response = self.client.get(reverse('crash-hourly'))
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([r['hour'] for r in results], list(range(24)))
+        self.assertEqual(
+            {r['hour']: r['crash_count'] for r in results if r['crash_count']}, {8: 1, 10: 1, 15: 1}
+        )
+        self.assertEqual(results[15]['killed_count'], 1)
+        
+        response = self.client.get(reverse('crash-hourly'), {'borough': 'QUEENS'})
+        self.assertEqual(sum(r['crash_count'] for r in response.data['results']), 1)
+    
+    def test_list_pagination(self):
+        """Test walking the crash list with keyset cursors"""
+        # Crashes sharing a crash_date are ordered by collision_id
+        same_day = self.crashes[0].crash_date
+        for collision_id in (111111110, 111111112):
+            Crash.objects.create(
+                collision_id=collision_id, crash_date=same_day, latitude=40.7, longitude=-73.9
+            )
+        
+        seen = []
+        url = reverse('crash-list') + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(crash['collision_id'] for crash in response.data['results'])
+            url = response.data['next']
+        
+        self.assertEqual(seen, [111111110, 111111111, 111111112, 222222222, 333333333])
+    
+    def test_list_invalid_pagination(self):
+        """Test that malformed cursors and page sizes are rejected"""
+        for params in ({'cursor': 'not-a-cursor'}, {'page_size': '0'}, {'page_size': 'all'}):
+            response = self.client.get(reverse('crash-list'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+    
+    def test_list_columnar(self):
+        """Test the compact columnar list format"""
+        response = self.client.get(reverse('crash-list'), {'format': 'columnar', 'page_size': 2})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/vnd.crashes.columnar+json')
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        columns = data['columns']
+        self.assertEqual(columns['collision_id'], [111111111, 222222222])
+        self.assertEqual(columns['total_severity'], [1, 10])
+        self.assertEqual(columns['latitude'], [40.7589, 40.6782])
+        self.assertEqual(
+            [data['dictionaries']['borough'][code] for code in columns['borough']],
+            ['MANHATTAN', 'BROOKLYN']
+        )
+        
+        # The cursor continues in the same format
+        response = self.client.get(data['next'])
+        self.assertEqual(response.json()['columns']['collision_id'], [333333333])
+        self.assertIsNone(response.json()['next'])
+    
+    def test_list_columnar_by_accept_header(self):
+        """Test selecting the columnar format through content negotiation"""
+        response = self.client.get(reverse('crash-list'), HTTP_ACCEPT='application/vnd.crashes.columnar+json')
+        
+        self.assertEqual(response.json()['count'], 3)
+    
+    def test_top_severity(self):
+        """Test ranking crashes by their stored severity"""
+        response = self.client.get(reverse('crash-top-severity'), {'limit': 2})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['collision_id'] for c in response.data], [222222222, 333333333])
+        self.assertEqual([c['total_severity'] for c in response.data], [10, 3])
+    
+    def test_export_ndjson(self):
+        """Test streaming the filtered crash table as NDJSON"""
+        response = self.client.get(reverse('crash-export'), {'has_injuries': 'true'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['collision_id'] for row in rows], [111111111, 333333333])
+        self.assertEqual(rows[0]['on_street_name'], 'BROADWAY')
+        self.assertEqual(rows[0]['crash_date'], self.crashes[0].crash_date.isoformat())
+        self.assertNotIn('content_hash', rows[0])
+    
+    def test_export_csv(self):
+        """Test streaming the crash table as CSV"""
+        response = self.client.get(reverse('crash-export'), {'format': 'csv'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1]['collision_id'], '222222222')
+        self.assertEqual(rows[1]['number_of_persons_killed'], '1')
+    
+    def test_export_invalid_filters(self):
+        """Test that export rejects malformed filters with an error"""
+        response = self.client.get(reverse('crash-export'), {'format': 'csv', 'bbox': 'x'})
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(b'bbox', response.content)
+    
+    def test_list_invalid_filters(self):
+        """Test that malformed filter values are rejected"""
+        for params in (
+            {'start_date': '01/02/2024'}, {'min_severity': 'high'}, {'bbox': '1,2,3'}, {'start_time': '25:00'}
+        ):
+            response = self.client.get(reverse('crash-list'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+    
+    def test_stats_filters(self):
+        """Test that stats are computed over the filtered crashes"""
+        response = self.client.get(reverse('crash-stats'), {'has_injuries': 'true'})
+        
+        self.assertEqual(response.data['total_crashes'], 2)
+        self.assertEqual(response.data['total_injured'], 4)
+    
+    def test_conditional_get(self):
+        """Test that a repeated GET is answered with 304 until the crashes change"""
+        response = self.client.get(reverse('crash-list'))
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        
+        etag = response['ETag']
+        response = self.client.get(reverse('crash-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        
+        self.crashes[0].number_of_persons_injured = 5
+        self.crashes[0].save()
+        response = self.client.get(reverse('crash-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_conditional_get_by_date(self):
+        """Test that If-Modified-Since alone revalidates against the last write"""
+        DatasetVersion.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        last_modified = self.client.get(reverse('crash-list'))['Last-Modified']
+        response = self.client.get(reverse('crash-list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        self.crashes[0].save()
+        response = self.client.get(reverse('crash-list'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['Last-Modified'], last_modified)
+    
+    def test_conditional_get_after_delete(self):
+        """Test that deleting a crash changes the ETag of crash responses"""
+        etag = self.client.get(reverse('crash-list'))['ETag']
+        
+        self.crashes[0].delete()
+        response = self.client.get(reverse('crash-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data['results']), 2)
+    
+    def test_conditional_get_per_renderer(self):
+        """Test that the ETag differs between renderers of the same data"""
+        json_etag = self.client.get(reverse('crash-list'), HTTP_ACCEPT='application/json')['ETag']
+        response = self.client.get(reverse('crash-list'), HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=json_etag)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_hotspot_conditional_get(self):
+        """Test that hotspot responses follow the hotspot dataset version"""
+        etag = self.client.get(reverse('hotspot-list'))['ETag']
+        
+        # Crash writes leave hotspot responses valid until they are regenerated
+        self.crashes[0].save()
+        response = self.client.get(reverse('hotspot-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        DatasetVersion.bump(HOTSPOTS)
+        response = self.client.get(reverse('hotspot-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_gzip(self):
+        """Test that responses are compressed for clients accepting gzip"""
+        response = self.client.get(reverse('crash-export'), {'format': 'csv'}, HTTP_ACCEPT_ENCODING='gzip')
+        
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        
+        response = self.client.get(reverse('crash-export'), {'format': 'csv'})
+        self.assertNotIn('Content-Encoding', response)
+
+class CrashNearestTest(APITestCase):
+    """Test the k-nearest crash endpoint"""
+    
+    def setUp(self):
+        """Create crashes at known offsets from a reference point"""
+        # Versions roll back between tests, so drop the cached snapshot
+        points._points = None
+        self.origin = (40.7589, -73.9851)
+        # About 0, 110, 220 and 1110 metres north of the origin
+        for collision_id, offset in ((1, 0), (2, 0.001), (3, 0.002), (4, 0.01)):
+            Crash.objects.create(
+                collision_id=collision_id,
+                crash_date=timezone.now(),
+                latitude=self.origin[0] + offset,
+                longitude=self.origin[1],
+            )
+    
+    def get(self, **params):
+        return self.client.get(reverse('crash-nearest'), {
+            'lat': self.origin[0], 'lon': self.origin[1], **params
+        })
+    
+    def test_nearest_orders_by_distance(self):
+        """Test that the k closest crashes come back nearest first with distances"""
+        response = self.get(k=3)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([r['collision_id'] for r in results], [1, 2, 3])
+        distances = haversine(
+            *self.origin,
+            [self.origin[0], self.origin[0] + 0.001, self.origin[0] + 0.002],
+            [self.origin[1]] * 3,
+        )
+        for result, distance in zip(results, distances):
+            self.assertAlmostEqual(result['distance'], distance, delta=0.1)
+    
+    def test_nearest_sees_new_crashes(self):
+        """Test that a write invalidates the cached snapshot"""
+        self.assertEqual(self.get(k=1).data['results'][0]['collision_id'], 1)
+        
+        CrashWriter().write_frame(crashes_to_frame([Crash(
+            collision_id=5,
+            crash_date=timezone.now(),
+            latitude=self.origin[0],
+            longitude=self.origin[1] + 0.00001,
+        )]))
+        Crash.objects.filter(collision_id=1).delete()
+        
+        response = self.get(k=2)
+        self.assertEqual([r['collision_id'] for r in response.data['results']], [5, 2])
+    
+    def test_nearest_invalid_params(self):
+        """Test that missing, malformed and out-of-range parameters are rejected"""
+        for params in ({'k': 0}, {'k': 1001}, {'k': 'x'}, {'lat': 91}, {'lat': ''}):
+            response = self.get(**params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+        for k in (0, 1001, 'x', 2.5):
+            response = self.get(k=k)
+            self.assertEqual(response.data['error'], 'k must be an integer between 1 and 1000')
+
+
+class CrashClustersTest(APITestCase):
+    """Test the map clusters endpoint"""
+    
+    def setUp(self):
+        """Create a tight group of crashes and one far away"""
+        points._points = None
+        for collision_id, lat, lon, injured in (
+            (1, 40.7580, -73.9850, 1),
+            (2, 40.7582, -73.9852, 2),
+            (3, 40.7584, -73.9854, 0),
+            (4, 40.6500, -73.9500, 3),
+        ):
+            Crash.objects.create(
+                collision_id=collision_id,
+                crash_date=timezone.now(),
+                latitude=lat,
+                longitude=lon,
+                number_of_persons_injured=injured,
+                number_of_persons_killed=1 if collision_id == 4 else 0,
+            )
+    
+    def test_clusters_aggregate_nearby_crashes(self):
+        """Test that close crashes share a cluster with summed counts and centroid"""
+        response = self.client.get(reverse('crash-clusters'), {'zoom': 12})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['zoom'], 12)
+        results = sorted(response.data['results'], key=lambda r: r['count'])
+        self.assertEqual([r['count'] for r in results], [1, 3])
+        single, group = results
+        self.assertEqual(single['collision_id'], 4)
+        self.assertEqual((single['injured'], single['killed']), (3, 1))
+        self.assertIsNone(group['collision_id'])
+        self.assertEqual((group['injured'], group['killed']), (3, 0))
+        self.assertAlmostEqual(group['latitude'], 40.7582, places=6)
+        self.assertAlmostEqual(group['longitude'], -73.9852, places=6)
+        
+        # At street level every crash is its own cluster
+        response = self.client.get(reverse('crash-clusters'), {'zoom': 20})
+        self.assertEqual(response.data['count'], 4)
+    
+    def test_clusters_bbox_and_limit(self):
+        """Test bbox filtering and the fallback to a coarser zoom"""
+        response = self.client.get(reverse('crash-clusters'), {
+            'zoom': 20, 'bbox': '-74.0,40.75,-73.98,40.77'
+        })
+        self.assertEqual(sorted(r['collision_id'] for r in response.data['results']), [1, 2, 3])
+        
+        with patch('accidents.views.MAX_CLUSTERS', 2):
+            response = self.client.get(reverse('crash-clusters'), {'zoom': 20})
+        self.assertLessEqual(response.data['count'], 2)
+        self.assertLess(response.data['zoom'], 20)
+    
+    def test_clusters_invalid_params(self):
+        """Test that missing or malformed zoom and bbox are rejected"""
+        for params in ({}, {'zoom': 'x'}, {'zoom': 23}, {'zoom': 5, 'bbox': '1,2,3'}):
+            response = self.client.get(reverse('crash-clusters'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, pos
+
+
+def read_fields(data):
+    """Yield (field number, value) pairs of a protobuf message"""
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        else:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        yield number, value
+
+
+def decode_tile(data):
+    """Decode a tile of point features into {layer: [(id, x, y, properties)]}"""
+    layers = {}
+    for _, layer in read_fields(data):
+        fields = list(read_fields(layer))
+        keys = [value.decode() for number, value in fields if number == 3]
+        values = []
+        for number, value in fields:
+            if number == 4:
+                kind, raw = next(read_fields(value))
+                values.append(raw.decode() if kind == 1 else struct.unpack('<d', raw)[0] if kind == 3 else raw)
+        features = []
+        for number, value in fields:
+            if number != 2:
+                continue
+            feature = dict(read_fields(value))
+            tags = [read_varint(feature[2], pos)[0] for pos in range(len(feature[2]))]
+            geometry = feature[4]
+            _, pos = read_varint(geometry, 0)
+            x, pos = read_varint(geometry, pos)
+            y, pos = read_varint(geometry, pos)
+            properties = {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])}
+            features.append((feature.get(1), x >> 1 ^ -(x & 1), y >> 1 ^ -(y & 1), properties))
+        layers[dict(fields)[1].decode()] = features
+    return layers
+
+
+class VectorTileTest(TestCase):
+    """Test the cached vector tile endpoint"""
+    
+    def setUp(self):
+        """Create two nearby crashes, one far away and a hotspot"""
+        points._points = None
+        # Lookup rows roll back between tests, so drop the cached ids
+        clear_intern_caches()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(TILE_CACHE_DIR=self.tmpdir.name)
+        self.settings_override.enable()
+        for collision_id, lat, lon, injured in (
+            (1, 40.7580, -73.9850, 1),
+            (2, 40.7581, -73.9851, 2),
+            (3, 40.6500, -73.9500, 0),
+        ):
+            Crash.objects.create(
+                collision_id=collision_id,
+                crash_date=timezone.now(),
+                latitude=lat,
+                longitude=lon,
+                number_of_persons_injured=injured,
+            )
+        Hotspot.objects.create(
+            name='Times Square', latitude=40.7580, longitude=-73.9855, radius=200,
+            crash_count=2, total_injured=3, total_killed=0, severity_index=3.0
+        )
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+    
+    def tile_of(self, zoom, lat, lon):
+        x, y = mercator(lat, lon)
+        return zoom, int(x * 2 ** zoom), int(y * 2 ** zoom)
+    
+    def get_tile(self, zoom, x, y):
+        response = self.client.get(reverse('crash-tile', args=[zoom, x, y]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        return decode_tile(response.content)
+    
+    def test_tile_features(self):
+        """Test detailed crashes at high zoom and aggregates at low zoom"""
+        layers = self.get_tile(*self.tile_of(16, 40.7580, -73.9850))
+        crashes = sorted(layers['crashes'])
+        self.assertEqual([c[0] for c in crashes], [1, 2])
+        self.assertEqual(crashes[1][3], {'injured': 2, 'killed': 0, 'severity': 2})
+        self.assertTrue(all(0 <= c[1] < 4096 and 0 <= c[2] < 4096 for c in crashes))
+        self.assertEqual(layers['hotspots'][0][3]['name'], 'Times Square')
+        
+        layers = self.get_tile(*self.tile_of(8, 40.7580, -73.9850))
+        counts = sorted(c[3]['count'] for c in layers['crashes'])
+        self.assertEqual(counts, [1, 2])
+        
+        # Tiles with nothing in them are empty
+        self.assertEqual(self.get_tile(10, 0, 0), {})
+    
+    def test_write_invalidates_touched_tiles_only(self):
+        """Test that an ingest drops the cached tiles containing its crashes"""
+        near = self.tile_of(16, 40.7580, -73.9850)
+        far = self.tile_of(16, 40.6500, -73.9500)
+        self.get_tile(*near)
+        self.get_tile(*far)
+        near_path = os.path.join(self.tmpdir.name, 'h0', *map(str, near[:2]), f'{near[2]}.mvt')
+        far_path = os.path.join(self.tmpdir.name, 'h0', *map(str, far[:2]), f'{far[2]}.mvt')
+        self.assertTrue(os.path.exists(near_path))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            CrashWriter().write_frame(crashes_to_frame([Crash(
+                collision_id=4, crash_date=timezone.now(), latitude=40.7581, longitude=-73.9850
+            )]))
+        
+        self.assertFalse(os.path.exists(near_path))
+        self.assertTrue(os.path.exists(far_path))
+        self.assertEqual(sorted(c[0] for c in self.get_tile(*near)['crashes']), [1, 2, 4])
+    
+    def test_tile_not_cached_after_concurrent_write(self):
+        """Test that a tile built from a snapshot older than the stored crashes is not cached"""
+        near = self.tile_of(16, 40.7580, -73.9850)
+        version = DatasetVersion.current(CRASHES)
+        points.crash_points()
+        # Another process writes crashes while this request holds the old version
+        DatasetVersion.bump(CRASHES)
+        with DatasetVersion.pinned({CRASHES: version}):
+            tiles.get_tile(*near)
+        
+        path = os.path.join(self.tmpdir.name, 'h0', *map(str, near[:2]), f'{near[2]}.mvt')
+        self.assertFalse(os.path.exists(path))
+    
+    def test_delete_invalidates_tile(self):
+        """Test that deleting a crash drops the cached tile containing it"""
+        near = self.tile_of(16, 40.7580, -73.9850)
+        self.get_tile(*near)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Crash.objects.get(pk=2).delete()
+        
+        self.assertEqual(sorted(c[0] for c in self.get_tile(*near)['crashes']), [1])
+    
+    def test_generate_tiles_command(self):
+        """Test that generate_tiles caches every tile covering the bbox"""
+        out = StringIO()
+        call_command('generate_tiles', '--max-zoom', '12', '--bbox=-74.0,40.7,-73.9,40.8', stdout=out)
+        
+        zoom, x, y = self.tile_of(12, 40.7580, -73.9850)
+        path = os.path.join(self.tmpdir.name, 'h0', str(zoom), str(x), f'{y}.mvt')
+        with open(path, 'rb') as f:
+            self.assertEqual(sorted(c[3]['count'] for c in decode_tile(f.read())['crashes']), [2])
+        self.assertIn('Zoom 12', out.getvalue())
+    
+    def test_tile_out_of_range(self):
+        """Test that tiles beyond the pyramid are not found"""
+        for args in ((17, 0, 0), (2, 4, 0), (2, 0, 4)):
+            response = self.client.get(reverse('crash-tile', args=args))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class HeatmapTest(APITestCase):
+    """Test the density heatmap endpoint"""
+    
+    def setUp(self):
+        """Create crashes with known severities in a small bbox"""
+        points._points = None
+        cache.clear()
+        self.bbox = '-74.0,40.7,-73.9,40.8'
+        for collision_id, lat, lon, injured, killed, borough in (
+            (1, 40.75, -73.95, 2, 0, 'MANHATTAN'),
+            (2, 40.75, -73.95, 0, 1, 'MANHATTAN'),
+            (3, 40.71, -73.99, 1, 0, 'BROOKLYN'),
+            (4, 40.71, -73.99, 0, 0, 'BROOKLYN'),
+            (5, 41.50, -73.95, 5, 0, 'BRONX'),
+        ):
+            Crash.objects.create(
+                collision_id=collision_id,
+                crash_date=timezone.now(),
+                latitude=lat,
+                longitude=lon,
+                borough=borough,
+                number_of_persons_injured=injured,
+                number_of_persons_killed=killed,
+            )
+    
+    def get(self, **params):
+        response = self.client.get(reverse('crash-heatmap'), {'bbox': self.bbox, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+    
+    def test_heatmap_weights(self):
+        """Test that cells sum the severities or counts of the crashes inside the bbox"""
+        data = self.get(resolution=10)
+        grid = np.array(data['grid'])
+        self.assertEqual(grid.shape, (data['height'], data['width']))
+        self.assertEqual(grid.sum(), 13)
+        self.assertEqual(data['max'], 12)
+        # Rows run north to south, so the northern crashes come first
+        self.assertLess(np.argwhere(grid == 12)[0][0], np.argwhere(grid == 1)[0][0])
+        
+        self.assertEqual(np.array(self.get(resolution=10, weight='count')['grid']).sum(), 4)
+    
+    def test_heatmap_smoothing_and_filters(self):
+        """Test that smoothing spreads density and filters narrow the crashes"""
+        grid = np.array(self.get(resolution=50, sigma=2)['grid'])
+        # A little density near the bbox edge is blurred out of it
+        self.assertAlmostEqual(grid.sum(), 13, delta=0.1)
+        self.assertLess(grid.max(), 12)
+        
+        grid = np.array(self.get(resolution=10, borough='brooklyn')['grid'])
+        self.assertEqual(grid.sum(), 1)
+    
+    def test_heatmap_is_cached_per_version(self):
+        """Test that repeated requests are cached until crashes change"""
+        self.get(resolution=10, borough='MANHATTAN')
+        with self.assertNumQueries(1):
+            self.get(resolution=10, borough='MANHATTAN')
+        
+        Crash.objects.create(
+            collision_id=6, crash_date=timezone.now(), latitude=40.75, longitude=-73.95,
+            borough='MANHATTAN', number_of_persons_injured=1
+        )
+        self.assertEqual(np.array(self.get(resolution=10, borough='MANHATTAN')['grid']).sum(), 13)
+    
+    def test_heatmap_invalid_params(self):
+        """Test that malformed parameters are rejected"""
+        for params in ({'resolution': 0}, {'resolution': 'x'}, {'sigma': 11}, {'weight': 'x'},
+                       {'bbox': '1,2'}, {'min_severity': 'x'}):
+            response = self.client.get(reverse('crash-heatmap'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+
+
+class FacetTest(APITestCase):
+    """Test the contributing factor and vehicle type facet tables"""
+    
+    def setUp(self):
+        # Lookup rows roll back between tests, so drop the cached ids
+        clear_intern_caches()
+    
+    def make_crash(self, collision_id, factors=(), vehicles=()):
+        factors = list(factors) + [''] * (5 - len(factors))
+        vehicles = list(vehicles) + [''] * (5 - len(vehicles))
+        return Crash(
+            collision_id=collision_id,
+            crash_date=timezone.now(),
+            crash_time='12:00',
+            latitude=40.7128,
+            longitude=-74.0060,
+            borough='MANHATTAN' if collision_id % 2 else 'BROOKLYN',
+            contributing_factor_vehicle_1=factors[0],
+            contributing_factor_vehicle_2=factors[1],
+            contributing_factor_vehicle_3=factors[2],
+            contributing_factor_vehicle_4=factors[3],
+            contributing_factor_vehicle_5=factors[4],
+            vehicle_type_code1=vehicles[0],
+            vehicle_type_code2=vehicles[1],
+            vehicle_type_code_3=vehicles[2],
+            vehicle_type_code_4=vehicles[3],
+            vehicle_type_code_5=vehicles[4],
+        )
+    
+    def factor_counts(self):
+        return dict(Factor.objects.filter(crash_count__gt=0).values_list('name', 'crash_count'))
+    
+    def vehicle_counts(self):
+        return dict(VehicleType.objects.filter(crash_count__gt=0).values_list('name', 'crash_count'))
+    
+    def test_save_keeps_facets(self):
+        """Test that saving a crash stores its facet rows and counts each crash once per value"""
+        crash = self.make_crash(1, ['Unsafe Speed', 'Unspecified', 'Unspecified'], ['Sedan', 'Bike'])
+        crash.save()
+        self.make_crash(2, ['Unspecified'], ['Sedan']).save()
+        
+        self.assertEqual(self.factor_counts(), {'Unsafe Speed': 1, 'Unspecified': 2})
+        self.assertEqual(self.vehicle_counts(), {'Sedan': 2, 'Bike': 1})
+        self.assertEqual(
+            list(CrashFactor.objects.filter(crash=crash).order_by('slot').values_list('slot', 'factor__name')),
+            [(1, 'Unsafe Speed'), (2, 'Unspecified'), (3, 'Unspecified')]
+        )
+        
+        crash.contributing_factor_vehicle_1 = 'Following Too Closely'
+        crash.vehicle_type_code2 = ''
+        crash.save()
+        self.assertEqual(self.factor_counts(), {'Following Too Closely': 1, 'Unspecified': 2})
+        self.assertEqual(self.vehicle_counts(), {'Sedan': 2})
+    
+    def test_save_matches_rebuild(self):
+        """Test that slot-by-slot updates on save leave the same rows and counts as a rebuild"""
+        crash = self.make_crash(1, ['Unsafe Speed', 'Unspecified', 'Unspecified'], ['Sedan'])
+        crash.save()
+        crash.contributing_factor_vehicle_1 = 'Unspecified'
+        crash.contributing_factor_vehicle_3 = ''
+        crash.vehicle_type_code2 = 'Sedan'
+        crash.save()
+        
+        rows = list(CrashFactor.objects.order_by('slot').values_list('slot', 'factor__name'))
+        self.assertEqual(rows, [(1, 'Unspecified'), (2, 'Unspecified')])
+        self.assertEqual(self.factor_counts(), {'Unspecified': 1})
+        self.assertEqual(self.vehicle_counts(), {'Sedan': 1})
+        
+        for facet in FACETS.values():
+            facet.rebuild()
+        self.assertEqual(list(CrashFactor.objects.order_by('slot').values_list('slot', 'factor__name')), rows)
+        self.assertEqual(self.factor_counts(), {'Unspecified': 1})
+        self.assertEqual(self.vehicle_counts(), {'Sedan': 1})
+    
+    def test_delete_keeps_facets(self):
+        """Test that deleting a crash drops its facet rows and its share of the counts"""
+        crash = self.make_crash(1, ['Unsafe Speed', 'Unspecified'], ['Sedan', 'Bike'])
+        crash.save()
+        self.make_crash(2, ['Unspecified'], ['Sedan']).save()
+        
+        crash.delete()
+        self.assertEqual(self.factor_counts(), {'Unspecified': 1})
+        self.assertEqual(self.vehicle_counts(), {'Sedan': 1})
+        self.assertFalse(CrashFactor.objects.filter(crash_id=1).exists())
+    
+    def test_ingest_keeps_facets(self):
+        """Test that the ingest writer fills the facet tables and replaces them on update"""
+        crashes = [self.make_crash(i, ['Unspecified'], ['Sedan', 'Taxi']) for i in range(1, 4)]
+        CrashWriter().write_frame(crashes_to_frame(crashes))
+        self.assertEqual(CrashVehicle.objects.count(), 6)
+        self.assertEqual(self.vehicle_counts(), {'Sedan': 3, 'Taxi': 3})
+        
+        crashes[0].vehicle_type_code2 = 'Bus'
+        crashes[1].contributing_factor_vehicle_1 = ''
+        CrashWriter(on_conflict='update').write_frame(crashes_to_frame(crashes))
+        self.assertEqual(CrashVehicle.objects.count(), 6)
+        self.assertEqual(self.vehicle_counts(), {'Sedan': 3, 'Taxi': 2, 'Bus': 1})
+        self.assertEqual(self.factor_counts(), {'Unspecified': 2})
+    
+    def test_facets_endpoint(self):
+        """Test facet counts, from the stored totals and for filtered crashes"""
+        CrashWriter().write_frame(crashes_to_frame([
+            self.make_crash(1, ['Unsafe Speed', 'Unspecified'], ['Sedan']),
+            self.make_crash(2, ['Unsafe Speed'], ['Bike']),
+            self.make_crash(3, ['Unspecified'], ['Sedan']),
+            self.make_crash(4, ['Driver Inattention/Distraction'], ['Taxi']),
+        ]))
+        
+        response = self.client.get(reverse('crash-facets'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['facet'], 'factor')
+        self.assertEqual(
+            [(r['name'], r['crash_count']) for r in response.data['results']],
+            [('Unsafe Speed', 2), ('Unspecified', 2), ('Driver Inattention/Distraction', 1)]
+        )
+        
+        response = self.client.get(reverse('crash-facets'), {'facet': 'vehicle_type', 'borough': 'manhattan'})
+        self.assertEqual(
+            [(r['name'], r['crash_count']) for r in response.data['results']], [('Sedan', 2)]
+        )
+        response = self.client.get(reverse('crash-facets'), {'facet': 'vehicle_type', 'factor': 'speed', 'limit': 1})
+        self.assertEqual(len(response.data['results']), 1)
+        
+        response = self.client.get(reverse('crash-facets'), {'facet': 'borough'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_facet_filters(self):
+        """Test filtering crashes by factor and vehicle type through the facet tables"""
+        CrashWriter().write_frame(crashes_to_frame([
+            self.make_crash(1, ['Unsafe Speed'], ['Sedan', 'Bike']),
+            self.make_crash(2, ['Unspecified', 'Unsafe Speed'], ['Taxi']),
+            self.make_crash(3, ['Unspecified'], ['Sedan']),
+        ]))
+        
+        def list_ids(**params):
+            response = self.client.get(reverse('crash-list'), params)
+            return {crash['collision_id'] for crash in response.data['results']}
+        
+        self.assertEqual(list_ids(factor='unsafe speed'), {1, 2})
+        self.assertEqual(list_ids(vehicle_type='sedan'), {1, 3})
+        self.assertEqual(list_ids(factor='unspecified', vehicle_type='sedan'), {3})
+        self.assertEqual(list_ids(vehicle_type='truck'), set())
+    
+    def test_rebuild_facets(self):
+        """Test that the rebuild command recomputes the facet tables from the crash columns"""
+        CrashWriter().write_frame(crashes_to_frame([
+            self.make_crash(1, ['Unsafe Speed', 'Unspecified'], ['Sedan']),
+            self.make_crash(2, ['Unspecified'], ['Sedan', 'Sedan']),
+        ]))
+        links = set(CrashFactor.objects.values_list('crash_id', 'slot', 'factor__name'))
+        counts = (self.factor_counts(), self.vehicle_counts())
+        Factor.objects.update(crash_count=0)
+        CrashVehicle.objects.all().delete()
+        
+        call_command('rebuild_crash_summary', '--facets', stdout=StringIO())
+        self.assertEqual(set(CrashFactor.objects.values_list('crash_id', 'slot', 'factor__name')), links)
+        self.assertEqual((self.factor_counts(), self.vehicle_counts()), counts)
+        self.assertEqual(counts[1], {'Sedan': 2})
+    
+    def test_scale_generation_rebuilds_facets(self):
+        """Test that --scale leaves the facet tables it deferred matching the crash columns"""
+        call_command('import_test_data', scale=True, count=300, chunk_size=100, stdout=StringIO())
+        links = set(CrashFactor.objects.values_list('crash_id', 'slot', 'factor_id'))
+        counts = (self.factor_counts(), self.vehicle_counts())
+        self.assertTrue(links)
+        
+        call_command('rebuild_crash_summary', '--facets', stdout=StringIO())
+        self.assertEqual(set(CrashFactor.objects.values_list('crash_id', 'slot', 'factor_id')), links)
+        self.assertEqual((self.factor_counts(), self.vehicle_counts()), counts)
+
+
+class InternedStringTest(TestCase):
+    """Test that repeated crash strings are stored as ids into lookup tables"""
+    
+    def setUp(self):
+        # Lookup rows roll back between tests, so drop the cached ids
+        clear_intern_caches()
+    
+    def make_crash(self, collision_id, borough, street='BROADWAY'):
+        return Crash(
+            collision_id=collision_id,
+            crash_date=timezone.now(),
+            latitude=40.7128,
+            longitude=-74.0060,
+            borough=borough,
+            on_street_name=street,
+            cross_street_name=street,
+        )
+    
+    def stored(self, collision_id, column):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {column} FROM accidents_crash WHERE collision_id = %s', [collision_id])
+            return cursor.fetchone()[0]
+    
+    def test_stores_ids_and_reads_strings(self):
+        """Test that strings round trip through integer columns, with blanks stored as 0"""
+        self.make_crash(1, 'MANHATTAN').save()
+        CrashWriter().write_frame(crashes_to_frame([
+            self.make_crash(2, 'MANHATTAN'), self.make_crash(3, '', street='5 AVENUE')
+        ]))
+        
+        self.assertEqual(self.stored(1, 'borough'), Borough.objects.get(name='MANHATTAN').pk)
+        self.assertEqual(self.stored(2, 'borough'), self.stored(1, 'borough'))
+        self.assertEqual(self.stored(3, 'borough'), 0)
+        self.assertEqual(self.stored(3, 'on_street_name'), self.stored(3, 'cross_street_name'))
+        self.assertEqual(Street.objects.count(), 2)
+        
+        self.assertEqual(Crash.objects.get(collision_id=3).on_street_name, '5 AVENUE')
+        self.assertEqual(
+            list(Crash.objects.order_by('collision_id').values_list('borough', flat=True)), ['MANHATTAN', 'MANHATTAN', '']
+        )
+    
+    def test_lookups_take_strings(self):
+        """Test filtering and grouping by interned columns"""
+        CrashWriter().write_frame(crashes_to_frame([
+            self.make_crash(1, 'MANHATTAN'), self.make_crash(2, 'QUEENS'), self.make_crash(3, 'QUEENS')
+        ]))
+        
+        self.assertEqual(Crash.objects.filter(borough='QUEENS').count(), 2)
+        self.assertEqual(Crash.objects.filter(borough__in=['MANHATTAN', 'BRONX']).count(), 1)
+        self.assertEqual(Crash.objects.exclude(borough='').count(), 3)
+        self.assertEqual(
+            {g['borough']: g['n'] for g in Crash.objects.values('borough').annotate(n=Count('collision_id'))},
+            {'MANHATTAN': 1, 'QUEENS': 2}
+        )
+        # Looking up a value never stored adds no lookup row
+        self.assertFalse(Crash.objects.filter(borough='ATLANTIS').exists())
+        self.assertFalse(Borough.objects.filter(name='ATLANTIS').exists())
+    
+    def test_lookups_on_names_only(self):
+        """Test that iexact matches names and lookups that would compare ids are refused"""
+        CrashWriter().write_frame(crashes_to_frame([self.make_crash(1, 'MANHATTAN'), self.make_crash(2, 'QUEENS')]))
+        
+        self.assertEqual(list(Crash.objects.filter(borough__iexact='queens').values_list('pk', flat=True)), [2])
+        self.assertFalse(Crash.objects.filter(borough__iexact='atlantis').exists())
+        for lookup in ('borough__icontains', 'borough__startswith', 'borough__gt', 'zip_code__range'):
+            with self.assertRaises(FieldError):
+                Crash.objects.filter(**{lookup: 'M'})
+    
+    def test_admin_borough_filter(self):
+        """Test that the admin borough filter lists and matches names"""
+        CrashWriter().write_frame(crashes_to_frame([self.make_crash(1, 'QUEENS'), self.make_crash(2, 'BRONX')]))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        
+        response = self.client.get(reverse('admin:accidents_crash_changelist'), {'borough': 'QUEENS'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c.pk for c in response.context['cl'].result_list], [1])
+        choices = [c['display'] for c in response.context['cl'].filter_specs[0].choices(response.context['cl'])]
+        self.assertEqual(choices, ['All', 'BRONX', 'QUEENS'])
+    
+    def test_rolled_back_ids_are_not_cached(self):
+        """Test that an id given out in a rolled back transaction is not trusted afterwards"""
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.make_crash(1, 'STATEN ISLAND').save()
+                raise RuntimeError
+        self.assertFalse(Borough.objects.exists())
+        
+        self.make_crash(2, 'BRONX').save()
+        self.make_crash(3, 'BROOKLYN').save()
+        self.assertEqual(
+            list(Crash.objects.order_by('collision_id').values_list('borough', flat=True)), ['BRONX', 'BROOKLYN']
+        )
+        self.assertEqual(Crash.objects.filter(borough='STATEN ISLAND').count(), 0)
+    
+    def test_clear_resets_caches(self):
+        """Test that clearing the crashes drops the cached lookup ids once committed"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.make_crash(1, 'QUEENS').save()
+        cache = intern_cache(Borough)
+        self.assertIn('QUEENS', cache.ids)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_test_data', clear=True, count=0, stdout=StringIO())
+        self.assertFalse(cache.loaded)
+        self.assertEqual(cache.ids, {})
+        self.assertEqual(cache.id('QUEENS'), Borough.objects.get(name='QUEENS').pk)
+
+
+class GeoTest(TestCase):
+    """Test the spatial grid and distance helpers"""
+    
+    def test_haversine(self):
+        """Test distances against known values"""
+        # One degree of latitude and JFK to LaGuardia
+        self.assertAlmostEqual(haversine(40.0, -74.0, [41.0], [-74.0])[0], 111195, delta=1)
+        self.assertAlmostEqual(haversine(40.6413, -73.7781, [40.7769], [-73.8740])[0], 17000, delta=300)
+    
+    def test_cell_ranges_cover_circle(self):
+        """Test that every point within the radius falls in a covered cell"""
+        rng = np.random.default_rng(0)
+        lat, lon, radius = 40.7128, -74.0060, 1500
+        points = np.column_stack([
+            lat + rng.uniform(-0.02, 0.02, 5000),
+            lon + rng.uniform(-0.03, 0.03, 5000),
+        ])
+        inside = haversine(lat, lon, points[:, 0], points[:, 1]) <= radius
+        cells = grid_cell(points[:, 0], points[:, 1])
+        covered = np.zeros(len(points), dtype=bool)
+        for first, last in cell_ranges(lat, lon, radius):
+            covered |= (cells >= first) & (cells <= last)
+        
+        self.assertTrue(inside.any())
+        self.assertTrue(covered[inside].all())
+    
+    def test_saved_crash_has_cell(self):
+        """Test that save() and the ingest writer both set the grid cell"""
+        crash = Crash.objects.create(
+            collision_id=1, crash_date=timezone.now(), latitude=40.7128, longitude=-74.0060
+        )
+        CrashWriter().write_frame(crashes_to_frame([
+            Crash(collision_id=2, crash_date=timezone.now(), latitude=40.7128, longitude=-74.0060)
+        ]))
+        
+        self.assertEqual(crash.geo_cell, grid_cell(40.7128, -74.0060))
+        self.assertEqual(Crash.objects.get(collision_id=2).geo_cell, crash.geo_cell)
 
 class CrashDataImportTest(TestCase):
     """Test data import functionality"""
@@ -317,3 +1307,637 @@ class CrashDataImportTest(TestCase):
         # Test severity calculations
         total_severity = sum(crash.total_severity for crash in created_crashes)
         self.assertEqual(total_severity, 3)  # 1 + 2 injuries
+
+    
+    def test_scale_generation_is_reproducible(self):
+        """Test that --scale writes the same crashes for the same seed"""
+        def generate(seed):
+            Crash.objects.all().delete()
+            call_command('import_test_data', scale=True, count=500, seed=seed, chunk_size=200, stdout=StringIO())
+            return list(Crash.objects.order_by('collision_id').values_list(
+                'collision_id', 'crash_date', 'latitude', 'longitude', 'borough', 'number_of_persons_injured'
+            ))
+        
+        first = generate(seed=7)
+        self.assertEqual(len(first), 500)
+        self.assertEqual(generate(seed=7), first)
+        self.assertNotEqual(generate(seed=8), first)
+    
+    def test_scale_generation_values(self):
+        """Test that --scale crashes have consistent counts and NYC locations"""
+        call_command('import_test_data', scale=True, count=1000, stdout=StringIO())
+        
+        for crash in Crash.objects.all():
+            self.assertEqual(
+                crash.number_of_persons_injured,
+                crash.number_of_pedestrians_injured + crash.number_of_cyclist_injured
+                + crash.number_of_motorist_injured
+            )
+            self.assertNotEqual(crash.on_street_name, crash.cross_street_name)
+            self.assertTrue(40.3 < crash.latitude < 41.1)
+            self.assertTrue(-74.5 < crash.longitude < -73.5)
+            self.assertRegex(crash.crash_time, r'^\d{1,2}:\d{2}$')
+        self.assertEqual(Crash.objects.values('borough').distinct().count(), 5)
+
+class CrashWriterTest(TestCase):
+    """Test the batched ingest writer"""
+    
+    def make_crash(self, collision_id, injured=0):
+        return Crash(
+            collision_id=collision_id,
+            crash_date=timezone.now(),
+            crash_time='12:00',
+            latitude=40.7128,
+            longitude=-74.0060,
+            borough='MANHATTAN',
+            number_of_persons_injured=injured,
+        )
+    
+    def test_inserts_new_crashes(self):
+        """Test that new crashes are bulk inserted"""
+        writer = CrashWriter(batch_size=2)
+        written = writer.write_frame(crashes_to_frame([self.make_crash(i) for i in range(1, 6)]))
+        
+        self.assertEqual(written, 5)
+        self.assertEqual(Crash.objects.count(), 5)
+        self.assertEqual(writer.created, 5)
+    
+    def test_skips_existing_crashes(self):
+        """Test that existing collision_ids are skipped in ignore mode"""
+        self.make_crash(1, injured=3).save()
+        writer = CrashWriter()
+        written = writer.write_frame(crashes_to_frame([self.make_crash(1), self.make_crash(2)]))
+        
+        self.assertEqual(written, 1)
+        self.assertEqual(writer.skipped, 1)
+        self.assertEqual(Crash.objects.get(collision_id=1).number_of_persons_injured, 3)
+    
+    def test_updates_existing_crashes(self):
+        """Test that existing collision_ids are overwritten in update mode"""
+        CrashWriter().write_frame(crashes_to_frame([self.make_crash(1, injured=3)]))
+        writer = CrashWriter(on_conflict='update')
+        written = writer.write_frame(crashes_to_frame([self.make_crash(1, injured=5)]))
+        
+        self.assertEqual(written, 1)
+        self.assertEqual(writer.updated, 1)
+        self.assertEqual(Crash.objects.get(collision_id=1).number_of_persons_injured, 5)
+    
+    def test_update_skips_unchanged_crashes(self):
+        """Test that update mode only rewrites crashes whose content hash changed"""
+        crashes = [self.make_crash(i) for i in range(1, 4)]
+        CrashWriter().write_frame(crashes_to_frame(crashes))
+        stored = dict(Crash.objects.values_list('collision_id', 'content_hash'))
+        self.assertNotIn(None, stored.values())
+        
+        crashes[1].number_of_persons_injured = 4
+        writer = CrashWriter(on_conflict='update')
+        written = writer.write_frame(crashes_to_frame(crashes))
+        
+        self.assertEqual(written, 1)
+        self.assertEqual(writer.updated, 1)
+        self.assertEqual(writer.skipped, 2)
+        self.assertEqual(Crash.objects.get(collision_id=2).number_of_persons_injured, 4)
+        self.assertNotEqual(Crash.objects.get(collision_id=2).content_hash, stored[2])
+    
+    def test_update_hashes_unhashed_crashes(self):
+        """Test that crashes saved without a content hash are rewritten once"""
+        crash = self.make_crash(1)
+        crash.save()
+        
+        writer = CrashWriter(on_conflict='update')
+        self.assertEqual(writer.write_frame(crashes_to_frame([crash])), 1)
+        self.assertIsNotNone(Crash.objects.get(collision_id=1).content_hash)
+        self.assertEqual(writer.write_frame(crashes_to_frame([crash])), 0)
+    
+    def test_writes_total_severity(self):
+        """Test that the stored severity is computed for written rows"""
+        crash = self.make_crash(1, injured=2)
+        crash.number_of_persons_killed = 1
+        CrashWriter().write_frame(crashes_to_frame([crash]))
+        
+        self.assertEqual(Crash.objects.get(collision_id=1).total_severity, 12)
+        self.assertEqual(Crash.objects.filter(total_severity__gte=12).count(), 1)
+    
+    def test_writes_time_of_day(self):
+        """Test that minute_of_day and hour are computed for written rows"""
+        crashes = [self.make_crash(1), self.make_crash(2), self.make_crash(3)]
+        crashes[1].crash_time = '7:05'
+        crashes[2].crash_time = 'unknown'
+        CrashWriter().write_frame(crashes_to_frame(crashes))
+        
+        self.assertEqual(
+            dict((c, (m, h)) for c, m, h in Crash.objects.values_list('collision_id', 'minute_of_day', 'hour')),
+            {1: (720, 12), 2: (425, 7), 3: (None, None)}
+        )
+    
+    def test_duplicate_ids_in_page(self):
+        """Test that a collision_id repeated within a page is written once"""
+        writer = CrashWriter()
+        written = writer.write_frame(crashes_to_frame([self.make_crash(1), self.make_crash(1, injured=2)]))
+        
+        self.assertEqual(written, 1)
+        self.assertEqual(Crash.objects.get(collision_id=1).number_of_persons_injured, 2)
+
+
+class CrashDailySummaryTest(TestCase):
+    """Test that the daily summary follows ingest"""
+    
+    def make_crash(self, collision_id, day, borough='MANHATTAN', injured=0, killed=0):
+        return Crash(
+            collision_id=collision_id,
+            crash_date=datetime(2024, 1, day, 8, 30, tzinfo=dt_timezone.utc),
+            latitude=40.7128,
+            longitude=-74.0060,
+            borough=borough,
+            number_of_persons_injured=injured,
+            number_of_persons_killed=killed,
+        )
+    
+    def summary(self):
+        return {
+            (row.date.isoformat(), row.borough): (row.crash_count, row.injured, row.killed)
+            # Rows emptied by revisions and deletes stay behind with zero counts
+            for row in CrashDailySummary.objects.filter(crash_count__gt=0)
+        }
+    
+    def rollup(self):
+        return {
+            (row.date.isoformat(), row.hour, row.borough, row.zip_code): (row.crash_count, row.injured, row.killed)
+            # Rows emptied by revisions stay behind with zero counts
+            for row in CrashHourlyRollup.objects.filter(crash_count__gt=0)
+        }
+    
+    def test_writer_updates_summary(self):
+        """Test that inserts and updates are applied as deltas"""
+        crashes = [
+            self.make_crash(1, 1, injured=2),
+            self.make_crash(2, 1, injured=1, killed=1),
+            self.make_crash(3, 2, borough='QUEENS'),
+        ]
+        CrashWriter().write_frame(crashes_to_frame(crashes))
+        self.assertEqual(self.summary(), {
+            ('2024-01-01', 'MANHATTAN'): (2, 3, 1),
+            ('2024-01-02', 'QUEENS'): (1, 0, 0),
+        })
+        
+        # Revisions move a crash to another borough and amend its injuries
+        revised = self.make_crash(2, 2, borough='QUEENS', injured=4)
+        CrashWriter(on_conflict='update').write_frame(crashes_to_frame([revised, self.make_crash(4, 3)]))
+        self.assertEqual(self.summary(), {
+            ('2024-01-01', 'MANHATTAN'): (1, 2, 0),
+            ('2024-01-02', 'QUEENS'): (2, 4, 0),
+            ('2024-01-03', 'MANHATTAN'): (1, 0, 0),
+        })
+    
+    def test_summary_matches_rebuild(self):
+        """Test that the incremental summary and rollup match ones rebuilt from scratch"""
+        call_command('import_test_data', scale=True, count=300, chunk_size=100, stdout=StringIO())
+        self.make_crash(999, 5).save()
+        first, second = Crash.objects.order_by('collision_id')[:2]
+        # A revision that loses its time moves to the unknown hour
+        second.crash_time = 'bad'
+        CrashWriter(on_conflict='update').write_frame(crashes_to_frame([first, second]))
+        incremental = self.summary()
+        incremental_rollup = self.rollup()
+        
+        call_command('rebuild_crash_summary', stdout=StringIO())
+        self.assertEqual(self.summary(), incremental)
+        self.assertEqual(self.rollup(), incremental_rollup)
+        self.assertGreater(len(incremental_rollup), len(incremental))
+    
+    def test_save_moves_crash_between_days(self):
+        """Test that saving a crash on another day recounts the day it left"""
+        crash = self.make_crash(1, 1, injured=2)
+        crash.save()
+        self.make_crash(2, 1).save()
+        
+        crash.crash_date = datetime(2024, 1, 3, 8, 30, tzinfo=dt_timezone.utc)
+        crash.save()
+        self.assertEqual(self.summary(), {
+            ('2024-01-01', 'MANHATTAN'): (1, 0, 0),
+            ('2024-01-03', 'MANHATTAN'): (1, 2, 0),
+        })
+        self.assertEqual(self.client.get(reverse('crash-stats')).data['total_crashes'], 2)
+    
+    def test_save_moves_crash_between_hours(self):
+        """Test that a save changing a crash's day or time recounts its old rollup rows"""
+        crash = self.make_crash(1, 1, injured=2)
+        crash.crash_time = '08:30'
+        crash.save()
+        
+        crash.crash_time = '17:05'
+        crash.save()
+        self.assertEqual(self.rollup(), {('2024-01-01', 17, 'MANHATTAN', ''): (1, 2, 0)})
+        
+        crash.crash_date = datetime(2024, 1, 3, 17, 5, tzinfo=dt_timezone.utc)
+        crash.save()
+        self.assertEqual(self.rollup(), {('2024-01-03', 17, 'MANHATTAN', ''): (1, 2, 0)})
+    
+    def test_delete_recounts_day(self):
+        """Test that deleting a crash takes it out of the summary and rollup"""
+        self.make_crash(1, 1, injured=2).save()
+        self.make_crash(2, 1).save()
+        self.make_crash(3, 2).save()
+        
+        Crash.objects.get(pk=1).delete()
+        Crash.objects.get(pk=3).delete()
+        self.assertEqual(self.summary(), {('2024-01-01', 'MANHATTAN'): (1, 0, 0)})
+        self.assertEqual(self.rollup(), {('2024-01-01', CrashHourlyRollup.UNKNOWN_HOUR, 'MANHATTAN', ''): (1, 0, 0)})
+    
+    def test_clear_empties_summary(self):
+        """Test that import_test_data --clear also clears the summary"""
+        self.make_crash(1, 1).save()
+        call_command('import_test_data', clear=True, count=0, stdout=StringIO())
+        
+        self.assertEqual(CrashDailySummary.objects.count(), 0)
+        self.assertEqual(CrashHourlyRollup.objects.count(), 0)
+    
+    def test_clear_skips_row_signals(self):
+        """Test that clearing runs a fixed number of queries however many crashes there are"""
+        CrashWriter().write_frame(crashes_to_frame([self.make_crash(i, i % 28 + 1) for i in range(1, 51)]))
+        
+        with self.assertNumQueries(10):
+            clear_crashes()
+        self.assertFalse(Crash.objects.exists())
+        self.assertFalse(CrashFactor.objects.exists())
+    
+    def test_stats_from_summary_match_crash_table(self):
+        """Test that summary-backed stats agree with stats computed from crashes"""
+        call_command('import_test_data', scale=True, count=300, stdout=StringIO())
+        url = reverse('crash-stats')
+        start_date = Crash.objects.order_by('crash_date').values_list('crash_date', flat=True)[150].date()
+        params = {'borough': 'brooklyn', 'start_date': start_date.isoformat()}
+        
+        # The dataset version for the ETag, then the summary table only
+        with self.assertNumQueries(2):
+            from_summary = self.client.get(url, params).data
+        # An always-true filter forces the crash table path
+        from_crashes = self.client.get(url, {**params, 'min_severity': 0}).data
+        
+        self.assertGreater(from_summary['total_crashes'], 0)
+        self.assertEqual(from_summary, from_crashes)
+
+class TimeseriesTest(APITestCase):
+    """Test the timeseries endpoint"""
+    
+    def setUp(self):
+        """Write crashes spread over days, hours and boroughs"""
+        timeseries._rollup = None
+        # 2024-01-01 is a Monday
+        rows = [
+            (1, 1, '8:15', 'MANHATTAN', '10001', 1, 0),
+            (2, 1, '08:45', 'MANHATTAN', '10002', 0, 1),
+            (3, 2, '17:00', 'BROOKLYN', '11201', 2, 0),
+            (4, 9, '17:30', 'MANHATTAN', '10001', 0, 0),
+            (5, 31, '', 'QUEENS', '11375', 1, 0),
+        ]
+        CrashWriter().write_frame(crashes_to_frame([Crash(
+            collision_id=collision_id,
+            crash_date=datetime(2024, 1, day, tzinfo=dt_timezone.utc),
+            crash_time=crash_time,
+            latitude=40.7128,
+            longitude=-74.0060,
+            borough=borough,
+            zip_code=zip_code,
+            number_of_persons_injured=injured,
+            number_of_persons_killed=killed,
+        ) for collision_id, day, crash_time, borough, zip_code, injured, killed in rows]))
+    
+    def get(self, **params):
+        response = self.client.get(reverse('crash-timeseries'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+    
+    def points(self, **params):
+        return [
+            tuple(point.values()) for point in self.get(**params)['series'][0]['points']
+        ]
+    
+    def test_timeline_buckets(self):
+        """Test day, multi-day, week and month buckets, with empty buckets filled"""
+        days = self.points(bucket='day')
+        self.assertEqual(len(days), 31)
+        self.assertEqual(days[:3], [('2024-01-01', 2, 1, 1), ('2024-01-02', 1, 2, 0), ('2024-01-03', 0, 0, 0)])
+        
+        self.assertEqual(self.points(bucket='week')[:2], [('2024-01-01', 3, 3, 1), ('2024-01-08', 1, 0, 0)])
+        self.assertEqual(self.points(bucket='month'), [('2024-01-01', 5, 4, 1)])
+        self.assertEqual(
+            self.points(bucket='day', size=10, start_date='2024-01-02', end_date='2024-01-09'),
+            [('2024-01-02', 2, 2, 0)]
+        )
+        
+        hours = self.points(bucket='hour', size=12)
+        self.assertEqual(hours[0], ('2024-01-01T00:00:00', 2, 1, 1))
+        self.assertEqual(hours[3], ('2024-01-02T12:00:00', 1, 2, 0))
+    
+    def test_cycle_buckets(self):
+        """Test hour of day and weekday buckets; crashes without a time are left out of hours"""
+        hours = self.points(bucket='hour_of_day')
+        self.assertEqual(len(hours), 24)
+        self.assertEqual(hours[8], (8, 2, 1, 1))
+        self.assertEqual(hours[17], (17, 2, 2, 0))
+        self.assertEqual(sum(hour[1] for hour in hours), 4)
+        
+        weekdays = self.points(bucket='weekday')
+        self.assertEqual([day[1] for day in weekdays], [2, 2, 1, 0, 0, 0, 0])
+        self.assertEqual(weekdays[0], (0, 2, 1, 1))
+    
+    def test_borough_and_zip_filters(self):
+        """Test borough series and the ZIP code filter"""
+        series = self.get(bucket='month', by_borough='true')['series']
+        self.assertEqual(
+            {s['borough']: s['points'][0]['crash_count'] for s in series},
+            {'BROOKLYN': 1, 'MANHATTAN': 3, 'QUEENS': 1}
+        )
+        self.assertEqual(self.points(bucket='month', zip_code='10001'), [('2024-01-01', 2, 1, 0)])
+        self.assertEqual(self.points(bucket='month', borough='brooklyn'), [('2024-01-01', 1, 2, 0)])
+    
+    def test_rollup_reloads_after_writes(self):
+        """Test that queries only check the version until crashes change"""
+        self.get(bucket='week')
+        with self.assertNumQueries(1):
+            self.get(bucket='hour_of_day', zip_code='10001', by_borough='true')
+        
+        CrashWriter().write_frame(crashes_to_frame([Crash(
+            collision_id=6, crash_date=datetime(2024, 2, 1, tzinfo=dt_timezone.utc), crash_time='9:00',
+            latitude=40.7128, longitude=-74.0060, borough='BRONX', zip_code='10451'
+        )]))
+        self.assertEqual(self.points(bucket='month')[-1], ('2024-02-01', 1, 0, 0))
+    
+    def test_invalid_params(self):
+        """Test that unknown buckets, bad sizes and unsupported filters are rejected"""
+        for params in ({'bucket': 'year'}, {'size': 0}, {'size': 'x'}, {'bucket': 'weekday', 'size': 8},
+                       {'min_severity': 1}, {'start_date': 'bad'}):
+            response = self.client.get(reverse('crash-timeseries'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('error', response.data)
+
+
+class StubSocrataHandler(BaseHTTPRequestHandler):
+    """Serve paged collision records the way the Socrata query endpoint does"""
+    
+    records = []
+    requested_starts = []
+    fail_from = None
+    
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        start, end = re.findall(r"crash_date [<>]=? '([\d-]+)'", payload['query'])
+        page_number = payload['page']['pageNumber']
+        page_size = payload['page']['pageSize']
+        self.requested_starts.append(start)
+        
+        if self.fail_from and start >= self.fail_from:
+            self.send_error(503)
+            return
+        
+        matching = [r for r in self.records if start <= r['crash_date'][:10] < end]
+        page = matching[(page_number - 1) * page_size:page_number * page_size]
+        
+        body = json.dumps(page).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class FetchNycDataCommandTest(TestCase):
+    """Test fetch_nyc_data against a local stub of the API"""
+    
+    def setUp(self):
+        """Start a stub API server with records spread over three months"""
+        start = datetime(2022, 1, 1)
+        StubSocrataHandler.records = [
+            {
+                'collision_id': str(4000000 + i),
+                'crash_date': (start + timedelta(days=i * 3)).strftime('%Y-%m-%dT00:00:00.000'),
+                'crash_time': '8:15',
+                'latitude': '40.7128',
+                'longitude': '-74.0060',
+                'borough': 'MANHATTAN',
+                'number_of_persons_injured': '1',
+                'number_of_persons_killed': '0',
+            }
+            for i in range(30)
+        ]
+        StubSocrataHandler.requested_starts = []
+        StubSocrataHandler.fail_from = None
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubSocrataHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/query.json"
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def fetch(self, **options):
+        options = {
+            'base_url': self.base_url,
+            'start_date': '2022-01-01',
+            'end_date': '2022-04-01',
+            'rate': 1000,
+            'stdout': StringIO(),
+            **options,
+        }
+        call_command('fetch_nyc_data', **options)
+    
+    def test_fetch_with_worker_pool(self):
+        """Test that concurrent workers page through every window"""
+        self.fetch(workers=4, limit=4)
+        
+        self.assertEqual(Crash.objects.count(), 30)
+        self.assertEqual(
+            set(Crash.objects.values_list('collision_id', flat=True)),
+            {4000000 + i for i in range(30)}
+        )
+    
+    def test_fetch_respects_max_records(self):
+        """Test that fetching stops once --max-records is reached"""
+        self.fetch(workers=1, limit=5, max_records=10)
+        
+        self.assertEqual(Crash.objects.count(), 10)
+    
+    def test_refetch_skips_existing(self):
+        """Test that fetching the same windows twice adds no duplicates"""
+        self.fetch(workers=2, limit=10)
+        self.fetch(workers=2, limit=10)
+        
+        self.assertEqual(Crash.objects.count(), 30)
+    
+    def test_refetch_updates_revised_records(self):
+        """Test that a refetch only rewrites records revised at the source"""
+        self.fetch(workers=2, limit=10)
+        StubSocrataHandler.records[7]['number_of_persons_injured'] = '3'
+        
+        stdout = StringIO()
+        self.fetch(workers=2, limit=10, stdout=stdout)
+        
+        self.assertIn('0 created, 1 updated, 29 skipped', stdout.getvalue())
+        self.assertEqual(Crash.objects.get(collision_id=4000007).number_of_persons_injured, 3)
+    
+    def test_fetch_streaming(self):
+        """Test that --stream writes every record in batch-size chunks"""
+        self.fetch(workers=2, limit=8, batch_size=3, stream=True)
+        
+        self.assertEqual(Crash.objects.count(), 30)
+    
+    def test_fetch_prints_pipeline_summary(self):
+        """Test that every pipeline stage reports its rows and queue peak"""
+        stdout = StringIO()
+        self.fetch(workers=2, limit=10, batch_size=4, stdout=stdout)
+        
+        output = stdout.getvalue()
+        self.assertRegex(output, r'fetch: 30 rows in 5 batches')
+        self.assertRegex(output, r'parse: 30 rows in \d+ batches.*queue peak [1-4]/4')
+        self.assertRegex(output, r'write: 30 rows in \d+ batches.*queue peak [1-4]/4')
+    
+    def test_fetch_reports_rejected_records(self):
+        """Test that invalid records are written to the reject report"""
+        StubSocrataHandler.records[3]['crash_date'] = '2022-01-10Tnot-a-time'
+        del StubSocrataHandler.records[5]['latitude']
+        with tempfile.TemporaryDirectory() as tmpdir:
+            reject_file = os.path.join(tmpdir, 'rejects.ndjson')
+            self.fetch(workers=2, limit=10, reject_file=reject_file)
+            
+            with open(reject_file) as f:
+                rejected = [json.loads(line) for line in f]
+        
+        self.assertEqual(Crash.objects.count(), 28)
+        self.assertEqual(
+            sorted((r['collision_id'], r['reject_reason']) for r in rejected),
+            [('4000003', 'invalid crash_date'), ('4000005', 'missing coordinates')]
+        )
+    
+    def test_fetch_records_sync_state(self):
+        """Test that a completed run saves its checkpoint and watermark"""
+        self.fetch(workers=2, limit=10)
+        
+        state = SyncState.objects.get()
+        self.assertEqual(state.last_window_end, datetime(2022, 4, 1).date())
+        self.assertEqual(state.max_crash_date.date(), datetime(2022, 3, 29).date())
+        self.assertEqual(state.max_collision_id, 4000029)
+    
+    def test_incremental_fetches_after_watermark(self):
+        """Test that --incremental only requests windows from the watermark on"""
+        self.fetch(workers=2, limit=10)
+        StubSocrataHandler.requested_starts = []
+        
+        self.fetch(workers=2, limit=10, incremental=True, end_date='2022-05-01')
+        
+        self.assertEqual(min(StubSocrataHandler.requested_starts), '2022-03-29')
+        self.assertEqual(Crash.objects.count(), 30)
+    
+    def test_resume_after_failed_windows(self):
+        """Test that --resume restarts from the last contiguous completed window"""
+        StubSocrataHandler.fail_from = '2022-03-02'
+        self.fetch(workers=2, limit=10)
+        
+        state = SyncState.objects.get()
+        self.assertEqual(state.last_window_end, datetime(2022, 3, 2).date())
+        self.assertEqual(Crash.objects.count(), 20)
+        
+        StubSocrataHandler.fail_from = None
+        StubSocrataHandler.requested_starts = []
+        self.fetch(workers=2, limit=10, resume=True)
+        
+        self.assertEqual(min(StubSocrataHandler.requested_starts), '2022-03-02')
+        self.assertEqual(Crash.objects.count(), 30)
+
+
+class IterJsonArrayTest(TestCase):
+    """Test the incremental JSON array parser used for streamed pages"""
+    
+    def test_parses_across_chunk_boundaries(self):
+        """Test that records split across chunks are reassembled"""
+        records = [{'collision_id': str(i), 'on_street_name': 'BRÜCKNER BLVD'} for i in range(20)]
+        body = json.dumps(records, ensure_ascii=False).encode()
+        
+        for size in (1, 7, 64, len(body)):
+            chunks = [body[i:i + size] for i in range(0, len(body), size)]
+            self.assertEqual(list(iter_json_array(chunks)), records)
+    
+    def test_empty_array(self):
+        """Test that an empty page yields nothing"""
+        self.assertEqual(list(iter_json_array([b' [', b'] '])), [])
+    
+    def test_truncated_body(self):
+        """Test that a body cut off mid-record raises an error"""
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'[{"collision_id": "1"}, {"colli']))
+
+
+class LoadCrashDumpCommandTest(TestCase):
+    """Test loading offline dumps of the collisions dataset"""
+    
+    CSV_HEADER = (
+        'CRASH DATE,CRASH TIME,BOROUGH,ZIP CODE,LATITUDE,LONGITUDE,LOCATION,ON STREET NAME,'
+        'CROSS STREET NAME,OFF STREET NAME,NUMBER OF PERSONS INJURED,NUMBER OF PERSONS KILLED,'
+        'NUMBER OF PEDESTRIANS INJURED,NUMBER OF PEDESTRIANS KILLED,NUMBER OF CYCLIST INJURED,'
+        'NUMBER OF CYCLIST KILLED,NUMBER OF MOTORIST INJURED,NUMBER OF MOTORIST KILLED,'
+        'CONTRIBUTING FACTOR VEHICLE 1,CONTRIBUTING FACTOR VEHICLE 2,CONTRIBUTING FACTOR VEHICLE 3,'
+        'CONTRIBUTING FACTOR VEHICLE 4,CONTRIBUTING FACTOR VEHICLE 5,COLLISION_ID,VEHICLE TYPE CODE 1,'
+        'VEHICLE TYPE CODE 2,VEHICLE TYPE CODE 3,VEHICLE TYPE CODE 4,VEHICLE TYPE CODE 5'
+    )
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def write_file(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+    
+    def test_load_csv(self):
+        """Test loading a CSV dump, rejecting rows without usable data"""
+        rows = [
+            '09/11/2021,2:39,BROOKLYN,11208,40.667202,-73.8665,"(40.667202, -73.8665)",,,1211 LORING AVENUE,'
+            '2,0,0,0,0,0,2,0,Unspecified,,,,,4455765,Sedan,,,,',
+            '03/26/2022,11:45,,,40.7,-73.9,,BROOKLYN BRIDGE,,,1,1,1,1,0,0,0,0,'
+            'Pavement Slippery,,,,,4513547,Sedan,Bike,,,',
+            '06/29/2022,6:55,,,,,,THROGS NECK BRIDGE,,,0,0,0,0,0,0,0,0,'
+            'Following Too Closely,Unspecified,,,,4541903,Sedan,Pick-up Truck,,,',
+            'not a date,6:55,,,40.7,-73.9,,,,,0,0,0,0,0,0,0,0,,,,,,4541904,,,,,',
+        ]
+        path = self.write_file('crashes.csv', '\n'.join([self.CSV_HEADER] + rows) + '\n')
+        
+        call_command('load_crash_dump', path, chunk_size=2, stdout=StringIO())
+        
+        self.assertEqual(Crash.objects.count(), 2)
+        crash = Crash.objects.get(collision_id=4455765)
+        self.assertEqual(crash.crash_date.date(), datetime(2021, 9, 11).date())
+        self.assertEqual(crash.crash_time, '2:39')
+        self.assertEqual(crash.borough, 'BROOKLYN')
+        self.assertEqual(crash.off_street_name, '1211 LORING AVENUE')
+        self.assertEqual(crash.number_of_motorist_injured, 2)
+        self.assertAlmostEqual(crash.latitude, 40.667202)
+        self.assertEqual(Crash.objects.get(collision_id=4513547).vehicle_type_code2, 'Bike')
+    
+    def test_load_ndjson(self):
+        """Test loading an NDJSON dump in API field format"""
+        records = [
+            {
+                'collision_id': str(4000000 + i),
+                'crash_date': '2022-01-0%dT00:00:00.000' % (i + 1),
+                'crash_time': '10:00',
+                'latitude': '40.7128',
+                'longitude': '-74.0060',
+                'borough': 'MANHATTAN',
+                'number_of_persons_injured': str(i),
+            }
+            for i in range(5)
+        ]
+        path = self.write_file('crashes.ndjson', '\n'.join(json.dumps(r) for r in records) + '\n')
+        
+        call_command('load_crash_dump', path, chunk_size=2, stdout=StringIO())
+        
+        self.assertEqual(Crash.objects.count(), 5)
+        self.assertEqual(Crash.objects.get(collision_id=4000004).number_of_persons_injured, 4)
+        self.assertEqual(Crash.objects.get(collision_id=4000004).zip_code, '')
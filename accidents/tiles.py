@@ -0,0 +1,307 @@
+import os
+import shutil
+import struct
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from hotspots.models import Hotspot
+
+from .geo import mercator
+from .models import Crash, DatasetVersion, crash_severity
+from .points import crash_points
+from .signals import crashes_cleared, crashes_rebuilt, crashes_written
+from .versions import CRASHES, HOTSPOTS
+
+
+# Tiles are served for zooms 0 to MAX_TILE_ZOOM; clients overzoom beyond it
+MAX_TILE_ZOOM = 16
+
+# Below DETAIL_ZOOM crashes are aggregated into an AGGREGATE_GRID square
+# grid per tile; from it on every crash is its own feature
+DETAIL_ZOOM = 14
+AGGREGATE_GRID = 64
+
+# Coordinate units across one tile
+TILE_EXTENT = 4096
+
+# (min_lon, min_lat, max_lon, max_lat) pre-generated by generate_tiles
+NYC_BBOX = (-74.26, 40.49, -73.69, 40.92)
+
+MVT_CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+
+def varint(value):
+    """Encode an unsigned integer as a protobuf varint"""
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def length_delimited(number, payload):
+    return varint(number << 3 | 2) + varint(len(payload)) + payload
+
+
+class LayerEncoder:
+    """Collect point features of one Mapbox Vector Tile layer and encode them.
+
+    Keys and values are shared between features through the layer's
+    dictionaries, as the MVT spec requires.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.keys = {}
+        self.values = {}
+        self.features = []
+
+    def add_point(self, x, y, properties, feature_id=None):
+        tags = []
+        for key, value in properties.items():
+            tags.append(self.keys.setdefault(key, len(self.keys)))
+            tags.append(self.values.setdefault((type(value), value), len(self.values)))
+        # MoveTo command with a count of one, then the zigzagged coordinates
+        geometry = varint(9) + varint(zigzag(x)) + varint(zigzag(y))
+        feature = b''
+        if feature_id is not None:
+            feature += varint(1 << 3) + varint(feature_id)
+        feature += length_delimited(2, b''.join(varint(tag) for tag in tags))
+        feature += varint(3 << 3) + varint(1)  # GeomType POINT
+        feature += length_delimited(4, geometry)
+        self.features.append(feature)
+
+    def encode_value(self, value_type, value):
+        if value_type is str:
+            return length_delimited(1, value.encode())
+        if value_type is float:
+            return varint(3 << 3 | 1) + struct.pack('<d', value)
+        if value_type is bool:
+            return varint(7 << 3) + varint(int(value))
+        if value < 0:
+            return varint(6 << 3) + varint(zigzag(value))
+        return varint(5 << 3) + varint(value)
+
+    def encode(self):
+        layer = varint(15 << 3) + varint(2)  # MVT version 2
+        layer += length_delimited(1, self.name.encode())
+        layer += b''.join(length_delimited(2, feature) for feature in self.features)
+        layer += b''.join(length_delimited(3, key.encode()) for key in self.keys)
+        layer += b''.join(length_delimited(4, self.encode_value(*value)) for value in self.values)
+        layer += varint(5 << 3) + varint(TILE_EXTENT)
+        return length_delimited(3, layer)
+
+
+def tile_range(zoom, bbox):
+    """Return (min_x, min_y, max_x, max_y) of the tiles covering a bounding box"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    left, top = mercator(max_lat, min_lon)
+    right, bottom = mercator(min_lat, max_lon)
+    last = 2 ** zoom - 1
+    return tuple(
+        min(int(value * 2 ** zoom), last) for value in (left, top, right, bottom)
+    )
+
+
+def tile_coordinates(zoom, x, y, tile_x, tile_y):
+    """Convert Web Mercator coordinates to integer units inside tile (tile_x, tile_y)"""
+    return (
+        np.floor((x * 2 ** zoom - tile_x) * TILE_EXTENT).astype('int64'),
+        np.floor((y * 2 ** zoom - tile_y) * TILE_EXTENT).astype('int64'),
+    )
+
+
+def crash_layer(points, indexes, zoom, tile_x, tile_y):
+    """Encode the crashes at indexes, all inside one tile, as the crashes layer"""
+    layer = LayerEncoder('crashes')
+    x, y = tile_coordinates(zoom, *(values[indexes] for values in points.mercator), tile_x, tile_y)
+    injured = points.injured[indexes]
+    killed = points.killed[indexes]
+    if zoom >= DETAIL_ZOOM:
+        for collision_id, px, py, n_injured, n_killed in zip(
+            points.collision_ids[indexes].tolist(), x.tolist(), y.tolist(), injured.tolist(), killed.tolist()
+        ):
+            layer.add_point(px, py, {
+                'injured': n_injured,
+                'killed': n_killed,
+                'severity': crash_severity(n_injured, n_killed),
+            }, feature_id=collision_id)
+        return layer
+
+    cell_size = TILE_EXTENT // AGGREGATE_GRID
+    cells = (y // cell_size) * AGGREGATE_GRID + x // cell_size
+    unique, members = np.unique(cells, return_inverse=True)
+    counts = np.bincount(members, minlength=len(unique))
+    for px, py, count, n_injured, n_killed in zip(
+        np.rint(np.bincount(members, weights=x, minlength=len(unique)) / counts).astype('int64').tolist(),
+        np.rint(np.bincount(members, weights=y, minlength=len(unique)) / counts).astype('int64').tolist(),
+        counts.tolist(),
+        np.bincount(members, weights=injured, minlength=len(unique)).astype('int64').tolist(),
+        np.bincount(members, weights=killed, minlength=len(unique)).astype('int64').tolist(),
+    ):
+        layer.add_point(px, py, {'count': count, 'injured': n_injured, 'killed': n_killed})
+    return layer
+
+
+def load_hotspots():
+    """Return every hotspot with its Web Mercator coordinates"""
+    hotspots = list(Hotspot.objects.values(
+        'id', 'name', 'latitude', 'longitude', 'radius', 'crash_count', 'severity_index'
+    ))
+    for hotspot in hotspots:
+        hotspot['x'], hotspot['y'] = (float(value) for value in mercator(hotspot['latitude'], hotspot['longitude']))
+    return hotspots
+
+
+def hotspot_layer(hotspots, zoom, tile_x, tile_y):
+    layer = LayerEncoder('hotspots')
+    for hotspot in hotspots:
+        px, py = (int(value) for value in tile_coordinates(zoom, hotspot['x'], hotspot['y'], tile_x, tile_y))
+        if 0 <= px < TILE_EXTENT and 0 <= py < TILE_EXTENT:
+            layer.add_point(px, py, {
+                'name': hotspot['name'],
+                'radius': hotspot['radius'],
+                'crash_count': hotspot['crash_count'],
+                'severity_index': hotspot['severity_index'],
+            }, feature_id=hotspot['id'])
+    return layer
+
+
+def encode_tile(points, indexes, hotspots, zoom, tile_x, tile_y):
+    layers = [crash_layer(points, indexes, zoom, tile_x, tile_y), hotspot_layer(hotspots, zoom, tile_x, tile_y)]
+    return b''.join(layer.encode() for layer in layers if layer.features)
+
+
+def tiles_at_zoom(points, hotspots, zoom, bbox=NYC_BBOX):
+    """Yield (x, y, tile) for every tile at a zoom level covering a bounding box.
+
+    Crashes are bucketed by tile once with a sort, so each tile only
+    touches its own rows.
+    """
+    min_x, min_y, max_x, max_y = tile_range(zoom, bbox)
+    x, y = points.mercator
+    tile_x = np.minimum((x * 2 ** zoom).astype('int64'), 2 ** zoom - 1)
+    tile_y = np.minimum((y * 2 ** zoom).astype('int64'), 2 ** zoom - 1)
+    inside = np.flatnonzero((tile_x >= min_x) & (tile_x <= max_x) & (tile_y >= min_y) & (tile_y <= max_y))
+    keys = tile_y[inside] * 2 ** zoom + tile_x[inside]
+    order = np.argsort(keys, kind='stable')
+    keys, inside = keys[order], inside[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype='int64')
+    bounds = dict(zip(keys[starts].tolist(), zip(starts.tolist(), np.r_[starts[1:], len(keys)].tolist())))
+    for ty in range(min_y, max_y + 1):
+        for tx in range(min_x, max_x + 1):
+            start, end = bounds.get(ty * 2 ** zoom + tx, (0, 0))
+            yield tx, ty, encode_tile(points, inside[start:end], hotspots, zoom, tx, ty)
+
+
+def build_tile(points, hotspots, zoom, tile_x, tile_y):
+    x, y = points.mercator
+    scale = 2 ** zoom
+    indexes = np.flatnonzero(
+        (x >= tile_x / scale) & (x < (tile_x + 1) / scale) & (y >= tile_y / scale) & (y < (tile_y + 1) / scale)
+    )
+    return encode_tile(points, indexes, hotspots, zoom, tile_x, tile_y)
+
+
+def tile_directory():
+    """Directory of the cached tiles for the current set of hotspots"""
+    return os.path.join(settings.TILE_CACHE_DIR, f'h{DatasetVersion.current(HOTSPOTS)}')
+
+
+def tile_path(directory, zoom, tile_x, tile_y):
+    return os.path.join(directory, str(zoom), str(tile_x), f'{tile_y}.mvt')
+
+
+def store_tile(path, tile):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename so readers never see a partial tile
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(tile)
+    os.replace(temporary, path)
+
+
+def get_tile(zoom, tile_x, tile_y):
+    """Return an encoded tile, from the disk cache when possible"""
+    path = tile_path(tile_directory(), zoom, tile_x, tile_y)
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+    points = crash_points()
+    tile = build_tile(points, load_hotspots(), zoom, tile_x, tile_y)
+    # Skip caching when crashes changed while the tile was built, as their
+    # invalidation may already have run; the request's pinned version
+    # would not show that
+    if DatasetVersion.stored(CRASHES) == points.version:
+        store_tile(path, tile)
+    return tile
+
+
+def prune_tile_cache():
+    """Remove cached tiles built for earlier sets of hotspots"""
+    current = os.path.basename(tile_directory())
+    if os.path.isdir(settings.TILE_CACHE_DIR):
+        for name in os.listdir(settings.TILE_CACHE_DIR):
+            if name != current:
+                shutil.rmtree(os.path.join(settings.TILE_CACHE_DIR, name), ignore_errors=True)
+
+
+def invalidate_tiles(latitudes, longitudes):
+    """Delete the cached tiles, at every zoom, that contain any of the given points"""
+    directory = tile_directory()
+    if not os.path.isdir(directory):
+        return
+    x, y = mercator(np.asarray(latitudes, dtype='float64'), np.asarray(longitudes, dtype='float64'))
+    for zoom in range(MAX_TILE_ZOOM + 1):
+        if not os.path.isdir(os.path.join(directory, str(zoom))):
+            continue
+        scale = 2 ** zoom
+        tiles = np.unique(
+            np.minimum((x * scale).astype('int64'), scale - 1) * scale
+            + np.minimum((y * scale).astype('int64'), scale - 1)
+        )
+        for tile_x, tile_y in zip(*divmod(tiles, scale)):
+            try:
+                os.remove(tile_path(directory, zoom, tile_x, tile_y))
+            except FileNotFoundError:
+                pass
+
+
+@receiver(crashes_written)
+def invalidate_written_tiles(sender, frame, previous, deferred=False, **kwargs):
+    if deferred:
+        # The whole cache is dropped by clear_tile_cache at the end
+        return
+    # Both the new and any overwritten locations may have changed tiles;
+    # deleting after commit keeps a concurrent request from caching a tile
+    # built from rows about to be replaced
+    latitudes = np.concatenate([
+        frame['latitude'].to_numpy(dtype='float64'), previous['latitude'].to_numpy(dtype='float64')
+    ])
+    longitudes = np.concatenate([
+        frame['longitude'].to_numpy(dtype='float64'), previous['longitude'].to_numpy(dtype='float64')
+    ])
+    transaction.on_commit(lambda: invalidate_tiles(latitudes, longitudes))
+
+
+@receiver(post_save, sender=Crash)
+@receiver(post_delete, sender=Crash)
+def invalidate_saved_crash_tiles(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_tiles([instance.latitude], [instance.longitude]))
+
+
+@receiver(crashes_cleared)
+@receiver(crashes_rebuilt)
+def clear_tile_cache(sender, **kwargs):
+    transaction.on_commit(lambda: shutil.rmtree(settings.TILE_CACHE_DIR, ignore_errors=True))
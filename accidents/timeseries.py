@@ -0,0 +1,175 @@
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from .filters import FILTER_PARAMS, parse_date, parse_flag
+from .models import CrashHourlyRollup, DatasetVersion
+from .versions import CRASHES
+
+
+# Buckets laid out along time; size is how many units each one spans
+TIMELINE_BUCKETS = ['hour', 'day', 'week', 'month']
+# Buckets folding every crash onto a cycle, with the cycle length
+CYCLE_BUCKETS = {'hour_of_day': 24, 'weekday': 7}
+BUCKETS = TIMELINE_BUCKETS + list(CYCLE_BUCKETS)
+
+# Filters the rollup can answer
+TIMESERIES_FILTER_PARAMS = {'borough', 'zip_code', 'start_date', 'end_date'}
+
+# Days are counted from a Monday so weeks start on Mondays
+EPOCH = date(1970, 1, 5)
+
+TOTAL_COLUMNS = ['crash_count', 'injured', 'killed']
+
+
+class RollupArrays:
+    """The hourly rollup table as packed NumPy columns, at one version of the crash table.
+
+    Boroughs and ZIP codes are stored as codes into small arrays of names,
+    so filtering and bucketing are array operations over a few bytes per
+    row.
+    """
+
+    def __init__(self, version, frame):
+        self.version = version
+        dates = frame['day'].to_numpy().astype('datetime64[D]')
+        self.days = (dates - np.datetime64(EPOCH)).astype('int64')
+        # Months since January 1970
+        self.months = dates.astype('datetime64[M]').astype('int64')
+        self.hours = frame['hour'].to_numpy(dtype='int64')
+        self.boroughs, self.borough_names = pd.factorize(frame['borough'], sort=True)
+        self.zip_codes, self.zip_code_names = pd.factorize(frame['zip_code'])
+        self.totals = frame[TOTAL_COLUMNS].to_numpy(dtype='int64')
+
+    @classmethod
+    def load(cls, version):
+        columns = ['day', 'hour', 'borough', 'zip_code'] + TOTAL_COLUMNS
+        # Dates are read as ISO strings, which NumPy parses in bulk far
+        # faster than it converts date objects
+        rows = CrashHourlyRollup.objects.order_by().annotate(
+            day=Cast('date', CharField())
+        ).values_list(*columns)
+        return cls(version, pd.DataFrame.from_records(list(rows.iterator(chunk_size=10000)), columns=columns))
+
+    def select(self, params, bucket):
+        """Boolean mask of the rows matching the borough, ZIP code and date filters"""
+        mask = np.ones(len(self.days), dtype=bool)
+        borough = params.get('borough')
+        if borough:
+            mask &= self.boroughs == self.borough_names.get_indexer([borough.upper()])[0]
+        zip_code = params.get('zip_code')
+        if zip_code:
+            mask &= self.zip_codes == self.zip_code_names.get_indexer([zip_code])[0]
+        start_date = params.get('start_date')
+        if start_date:
+            mask &= self.days >= (parse_date(start_date, 'start_date').date() - EPOCH).days
+        end_date = params.get('end_date')
+        if end_date:
+            mask &= self.days <= (parse_date(end_date, 'end_date').date() - EPOCH).days
+        if bucket in ('hour', 'hour_of_day'):
+            mask &= self.hours != CrashHourlyRollup.UNKNOWN_HOUR
+        return mask
+
+    def bucket_keys(self, bucket, size):
+        """Bucket of every row: units since EPOCH, or position in a cycle, floored to size"""
+        if bucket == 'hour':
+            return (self.days * 24 + self.hours) // size * size
+        if bucket == 'day':
+            return self.days // size * size
+        if bucket == 'week':
+            return self.days // (7 * size) * (7 * size)
+        if bucket == 'month':
+            return self.months // size * size
+        if bucket == 'hour_of_day':
+            return self.hours // size * size
+        return self.days % 7 // size * size
+
+
+_rollup = None
+_rollup_lock = threading.Lock()
+
+
+def rollup_arrays():
+    """Return the packed rollup, reloaded when the crashes DatasetVersion has moved on"""
+    global _rollup
+    version = DatasetVersion.current(CRASHES)
+    rollup = _rollup
+    if rollup is not None and rollup.version == version:
+        return rollup
+    with _rollup_lock:
+        if _rollup is None or _rollup.version != version:
+            _rollup = RollupArrays.load(version)
+        return _rollup
+
+
+def bucket_label(bucket, key):
+    if bucket == 'hour':
+        return ('start', (datetime.combine(EPOCH, datetime.min.time()) + timedelta(hours=key)).isoformat())
+    if bucket in ('day', 'week'):
+        return ('start', (EPOCH + timedelta(days=key)).isoformat())
+    if bucket == 'month':
+        return ('start', date(1970 + key // 12, key % 12 + 1, 1).isoformat())
+    return ('hour' if bucket == 'hour_of_day' else 'weekday', key)
+
+
+def build_series(keys, totals, bucket, size):
+    """Sum totals into buckets with np.bincount, filling empty buckets with zeros"""
+    step = 7 * size if bucket == 'week' else size
+    if bucket in CYCLE_BUCKETS:
+        first, last = 0, CYCLE_BUCKETS[bucket] - 1
+    elif len(keys):
+        first, last = int(keys.min()), int(keys.max())
+    else:
+        return []
+    slots = (keys - first) // step
+    length = (last - first) // step + 1
+    sums = [np.bincount(slots, weights=totals[:, i], minlength=length).astype('int64').tolist() for i in range(3)]
+    return [
+        dict([bucket_label(bucket, first + slot * step)], crash_count=crash_count, injured=injured, killed=killed)
+        for slot, (crash_count, injured, killed) in enumerate(zip(*sums))
+    ]
+
+
+def crash_timeseries(params):
+    """Crash, injury and fatality totals per bucket, answered from the hourly rollup.
+
+    Parameters: ``bucket`` (hour, day, week, month, hour_of_day or weekday),
+    ``size`` (units per bucket), ``by_borough`` (one series per borough)
+    and the borough, zip_code and date range filters. Raises ValueError
+    for malformed values.
+    """
+    bucket = params.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    try:
+        size = int(params.get('size', 1))
+    except ValueError:
+        raise ValueError("size must be an integer")
+    limit = CYCLE_BUCKETS.get(bucket)
+    if size < 1 or (limit and size > limit):
+        raise ValueError(f"size must be between 1 and {limit}" if limit else "size must be positive")
+    unsupported = sorted(
+        name for name in FILTER_PARAMS if params.get(name) and name not in TIMESERIES_FILTER_PARAMS
+    )
+    if unsupported:
+        raise ValueError(f"timeseries cannot filter by {', '.join(unsupported)}")
+
+    rollup = rollup_arrays()
+    mask = rollup.select(params, bucket)
+    keys = rollup.bucket_keys(bucket, size)
+    if parse_flag(params.get('by_borough', '')):
+        series = []
+        for code, borough in enumerate(rollup.borough_names):
+            rows = mask & (rollup.boroughs == code)
+            if rows.any():
+                series.append({
+                    'borough': borough,
+                    'points': build_series(keys[rows], rollup.totals[rows], bucket, size)
+                })
+    else:
+        series = [{'borough': None, 'points': build_series(keys[mask], rollup.totals[mask], bucket, size)}]
+    return {'bucket': bucket, 'size': size, 'series': series}
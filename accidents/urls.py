@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CrashViewSet
+from .views import CrashViewSet, crash_tile
 
 router = DefaultRouter()
 router.register(r'crashes', CrashViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', crash_tile, name='crash-tile'),
 ]
@@ -0,0 +1,71 @@
+import hashlib
+from functools import wraps
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Crash, DatasetVersion
+from .signals import crashes_cleared, crashes_rebuilt, crashes_written
+
+
+# DatasetVersion names
+CRASHES = 'crashes'
+HOTSPOTS = 'hotspots'
+
+
+@receiver(crashes_written)
+@receiver(crashes_cleared)
+@receiver(crashes_rebuilt)
+@receiver(post_save, sender=Crash)
+@receiver(post_delete, sender=Crash)
+def bump_crashes_version(sender, **kwargs):
+    DatasetVersion.bump(CRASHES)
+
+
+def dataset_validators(request, names):
+    """Return the versions of the named datasets and the ETag and Last-Modified of a response built from them.
+
+    The ETag covers the versions and the Accept header, which picks the
+    renderer; Last-Modified is None until a dataset has changed.
+    """
+    versions = dict.fromkeys(names, 0)
+    last_modified = None
+    for name, version, updated_at in DatasetVersion.objects.filter(name__in=names).values_list(
+        'name', 'version', 'updated_at'
+    ):
+        versions[name] = version
+        last_modified = max(last_modified or updated_at, updated_at)
+    tag = hashlib.md5(repr((sorted(versions.items()), request.META.get('HTTP_ACCEPT', ''))).encode()).hexdigest()
+    return versions, f'W/"{tag}"', last_modified and int(last_modified.timestamp())
+
+
+def dataset_condition(*names):
+    """Decorate a view to answer conditional GETs from the versions of the named datasets.
+
+    Successful GET responses carry an ETag, Last-Modified and a
+    Cache-Control asking clients to revalidate, and a request whose
+    validators still match gets a 304 before the view runs. The view
+    sees the versions the validators were built from through
+    DatasetVersion.current(), so it does not read them again.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            versions, etag, last_modified = dataset_validators(request, names)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                with DatasetVersion.pinned(versions):
+                    response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.headers['ETag'] = etag
+            if last_modified is not None:
+                response.headers['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -1,16 +1,93 @@
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.response import Response
-from django.db.models import Sum, Count
-from .models import Crash
+import hashlib
 
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Q, Sum, Count
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from .facets import FACETS
+from .filters import FILTER_PARAMS, filter_crashes, filter_summary, parse_bbox, summary_can_filter
+from .geo import cell_ranges, haversine
+from .heatmap import density_grid
+from .models import Crash, CrashDailySummary, DatasetVersion, crash_severity
+from .pagination import KeysetPagination
+from .points import crash_points
+from .renderers import ColumnarJSONRenderer, CSVRenderer, NDJSONRenderer
+from .timeseries import crash_timeseries
+from .tiles import MAX_TILE_ZOOM, MVT_CONTENT_TYPE, NYC_BBOX, get_tile
+from .versions import CRASHES, HOTSPOTS, dataset_condition
+
+# Columns of the export endpoint, leaving out internal bookkeeping
+EXPORT_FIELDS = [
+    f.attname for f in Crash._meta.concrete_fields if f.name not in ('content_hash', 'geo_cell')
+]
+
+# Fields of the compact columnar list format, as needed by the map
+COLUMNAR_FIELDS = [
+    'collision_id',
+    'latitude',
+    'longitude',
+    'number_of_persons_injured',
+    'number_of_persons_killed',
+    'total_severity',
+]
+
+# Largest radius accepted by search_by_location, in metres
+MAX_SEARCH_RADIUS = 50000
+
+# Most neighbours the nearest action returns
+MAX_NEIGHBORS = 1000
+
+# Zoom levels accepted by the clusters action, and the most clusters it
+# returns before falling back to a coarser zoom
+MAX_CLUSTER_ZOOM = 22
+MAX_CLUSTERS = 500
+
+# Heatmap grid cells along the longer side of the bbox, and the widest
+# Gaussian smoothing accepted, in cells
+DEFAULT_HEATMAP_RESOLUTION = 128
+MAX_HEATMAP_RESOLUTION = 512
+MAX_HEATMAP_SIGMA = 10
+
+# Rows fetched from the database cursor and encoded per streamed piece
+EXPORT_CHUNK_SIZE = 2000
+
+
+def export_chunks(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of value tuples read through a database cursor"""
+    date_index = fields.index('crash_date')
+    rows = []
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        row = list(row)
+        row[date_index] = row[date_index].isoformat()
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+@method_decorator(dataset_condition(CRASHES), name='dispatch')
 class CrashViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Crash.objects.all()
+    pagination_class = KeysetPagination
+    renderer_classes = [JSONRenderer, BrowsableAPIRenderer, ColumnarJSONRenderer]
     
     def list(self, request):
-        """List crashes with basic info"""
-        crashes = self.get_queryset()
-        return Response([{
+        """List a page of crashes with basic info, filtered by the query parameters"""
+        try:
+            crashes = filter_crashes(self.get_queryset(), request.query_params)
+            if request.accepted_renderer.format == ColumnarJSONRenderer.format:
+                return self.columnar_list(crashes)
+            crashes = self.paginate_queryset(crashes)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        return self.get_paginated_response([{
             'collision_id': c.collision_id,
             'crash_date': c.crash_date,
             'latitude': c.latitude,
@@ -26,6 +103,26 @@ class CrashViewSet(viewsets.ReadOnlyModelViewSet):
             'vehicle_type_code_5': c.vehicle_type_code_5
         } for c in crashes])
     
+    def columnar_list(self, queryset):
+        """Return a page of map fields as one array per field.
+        
+        Boroughs are sent as indexes into a per-page dictionary and
+        coordinates are rounded to 6 decimals (about 0.1m).
+        """
+        rows = self.paginate_queryset(queryset.values('crash_date', 'borough', *COLUMNAR_FIELDS))
+        boroughs = sorted({row['borough'] for row in rows})
+        codes = {borough: code for code, borough in enumerate(boroughs)}
+        columns = {name: [row[name] for row in rows] for name in COLUMNAR_FIELDS}
+        for name in ('latitude', 'longitude'):
+            columns[name] = [round(value, 6) for value in columns[name]]
+        columns['borough'] = [codes[row['borough']] for row in rows]
+        return Response({
+            'next': self.paginator.get_next_link(),
+            'count': len(rows),
+            'columns': columns,
+            'dictionaries': {'borough': boroughs},
+        })
+    
     def retrieve(self, request, pk=None):
         """Get detailed crash info"""
         try:
@@ -60,7 +157,7 @@ class CrashViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'])
     def search_by_location(self, request):
-        """Search crashes within a radius of given coordinates"""
+        """Search crashes within a radius of given coordinates, nearest first"""
         lat = request.query_params.get('lat')
         lon = request.query_params.get('lon')
         radius = request.query_params.get('radius', 1000)
@@ -75,47 +172,314 @@ class CrashViewSet(viewsets.ReadOnlyModelViewSet):
         except ValueError:
             return Response({'error': 'Invalid coordinate values'}, status=400)
         
-        # Simple radius search
-        lat_delta = radius / 111000
-        lon_delta = radius / (111000 * abs(lat / 90))
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return Response({'error': 'Coordinates out of range'}, status=400)
+        if not 0 < radius <= MAX_SEARCH_RADIUS:
+            return Response({'error': f'Radius must be between 0 and {MAX_SEARCH_RADIUS} metres'}, status=400)
         
-        crashes = Crash.objects.filter(
-            latitude__gte=lat - lat_delta,
-            latitude__lte=lat + lat_delta,
-            longitude__gte=lon - lon_delta,
-            longitude__lte=lon + lon_delta,
-        )
+        # Candidates come from the grid cells covering the circle, one
+        # indexed range per grid row; exact distances are checked below
+        cells = Q()
+        for first, last in cell_ranges(lat, lon, radius):
+            cells |= Q(geo_cell__range=(first, last))
+        candidates = list(Crash.objects.filter(cells).order_by().values_list(
+            'collision_id', 'crash_date', 'latitude', 'longitude', 'borough', 'total_severity'
+        ))
+        
+        if candidates:
+            coordinates = np.array([(c[2], c[3]) for c in candidates])
+            distances = haversine(lat, lon, coordinates[:, 0], coordinates[:, 1])
+            nearby = np.flatnonzero(distances <= radius)
+            nearby = nearby[np.argsort(distances[nearby], kind='stable')]
+        else:
+            nearby = []
         
         return Response({
-            'count': crashes.count(),
+            'count': len(nearby),
             'results': [{
-                'collision_id': c.collision_id,
-                'crash_date': c.crash_date,
-                'latitude': c.latitude,
-                'longitude': c.longitude,
-                'borough': c.borough,
-                'total_severity': c.total_severity
-            } for c in crashes]
+                'collision_id': candidates[i][0],
+                'crash_date': candidates[i][1],
+                'latitude': candidates[i][2],
+                'longitude': candidates[i][3],
+                'borough': candidates[i][4],
+                'total_severity': candidates[i][5],
+                'distance': round(float(distances[i]), 1)
+            } for i in nearby]
         })
     
     @action(detail=False, methods=['get'])
-    def stats(self, request):
-        """Get crash statistics"""
-        queryset = self.get_queryset()
+    def nearest(self, request):
+        """Get the k crashes closest to given coordinates, nearest first"""
+        try:
+            lat = float(request.query_params['lat'])
+            lon = float(request.query_params['lon'])
+        except KeyError:
+            return Response({'error': 'Latitude and longitude are required'}, status=400)
+        except ValueError:
+            return Response({'error': 'Invalid coordinate values'}, status=400)
         
-        total_crashes = queryset.count()
-        total_injured = queryset.aggregate(total=Sum('number_of_persons_injured'))['total'] or 0
-        total_killed = queryset.aggregate(total=Sum('number_of_persons_killed'))['total'] or 0
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return Response({'error': 'Coordinates out of range'}, status=400)
+        try:
+            k = int(request.query_params.get('k', 10))
+        except ValueError:
+            k = None
+        if k is None or not 0 < k <= MAX_NEIGHBORS:
+            return Response({'error': f'k must be an integer between 1 and {MAX_NEIGHBORS}'}, status=400)
+        
+        collision_ids, distances = crash_points().nearest(lat, lon, k)
+        crashes = Crash.objects.in_bulk(collision_ids.tolist())
+        # Crashes deleted since the snapshot was taken are skipped
+        return Response({
+            'count': len(crashes),
+            'results': [{
+                'collision_id': crash.collision_id,
+                'crash_date': crash.crash_date,
+                'latitude': crash.latitude,
+                'longitude': crash.longitude,
+                'borough': crash.borough,
+                'total_severity': crash.total_severity,
+                'distance': round(float(distance), 1)
+            } for crash, distance in (
+                (crashes.get(collision_id), distance)
+                for collision_id, distance in zip(collision_ids.tolist(), distances)
+            ) if crash is not None]
+        })
+    
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """Get crashes grouped into map clusters for a zoom level and bounding box"""
+        try:
+            zoom = int(request.query_params['zoom'])
+        except KeyError:
+            return Response({'error': 'zoom is required'}, status=400)
+        except ValueError:
+            return Response({'error': 'zoom must be an integer'}, status=400)
+        try:
+            bbox = request.query_params.get('bbox')
+            bbox = parse_bbox(bbox) if bbox else (-180, -90, 180, 90)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        if not 0 <= zoom <= MAX_CLUSTER_ZOOM:
+            return Response({'error': f'zoom must be between 0 and {MAX_CLUSTER_ZOOM}'}, status=400)
         
-        borough_stats = queryset.values('borough').annotate(
-            crash_count=Count('collision_id'),
-            injured_count=Sum('number_of_persons_injured'),
-            killed_count=Sum('number_of_persons_killed')
-        ).order_by('-crash_count')
+        # Step out to coarser zooms until the viewport holds few enough clusters
+        points = crash_points()
+        while True:
+            clusters = points.clusters(zoom)
+            visible = clusters.within(*bbox)
+            if len(visible) <= MAX_CLUSTERS or zoom == 0:
+                break
+            zoom -= 1
         
         return Response({
-            'total_crashes': total_crashes,
-            'total_injured': total_injured,
-            'total_killed': total_killed,
-            'borough_breakdown': list(borough_stats)
-        })
\ No newline at end of file
+            'zoom': zoom,
+            'count': len(visible),
+            'results': [{
+                'latitude': round(latitude, 6),
+                'longitude': round(longitude, 6),
+                'count': count,
+                'injured': injured,
+                'killed': killed,
+                'collision_id': collision_id if count == 1 else None
+            } for latitude, longitude, count, injured, killed, collision_id in zip(
+                clusters.latitudes[visible].tolist(),
+                clusters.longitudes[visible].tolist(),
+                clusters.counts[visible].tolist(),
+                clusters.injured[visible].tolist(),
+                clusters.killed[visible].tolist(),
+                clusters.collision_ids[visible].tolist(),
+            )]
+        })
+    
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """Stream every crash matching the query parameters as NDJSON or CSV"""
+        try:
+            crashes = filter_crashes(self.get_queryset(), request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(EXPORT_FIELDS, export_chunks(crashes, EXPORT_FIELDS)),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = f'attachment; filename="crashes.{renderer.format}"'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def hourly(self, request):
+        """Get crash, injury and fatality counts per hour of day for the matching crashes"""
+        try:
+            crashes = filter_crashes(self.get_queryset(), request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        groups = {
+            g['hour']: g for g in crashes.filter(hour__isnull=False).order_by().values('hour').annotate(
+                crash_count=Count('collision_id'),
+                injured_count=Sum('number_of_persons_injured'),
+                killed_count=Sum('number_of_persons_killed')
+            )
+        }
+        empty = {'crash_count': 0, 'injured_count': 0, 'killed_count': 0}
+        return Response({
+            'results': [{**empty, **groups.get(hour, {}), 'hour': hour} for hour in range(24)]
+        })
+    
+    @action(detail=False, methods=['get'])
+    def top_severity(self, request):
+        """Get the N most severe crashes matching the query parameters"""
+        try:
+            limit = int(request.query_params.get('limit', 10))
+            crashes = filter_crashes(self.get_queryset(), request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        crashes = crashes.order_by('-total_severity', 'collision_id')[:max(0, min(limit, 1000))]
+        return Response([{
+            'collision_id': c.collision_id,
+            'crash_date': c.crash_date,
+            'latitude': c.latitude,
+            'longitude': c.longitude,
+            'borough': c.borough,
+            'number_of_persons_injured': c.number_of_persons_injured,
+            'number_of_persons_killed': c.number_of_persons_killed,
+            'total_severity': c.total_severity
+        } for c in crashes])
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Get the contributing factors or vehicle types most cited by the matching crashes
+        
+        Without filters the counts kept on the dictionary tables are read
+        directly; with filters they are one grouped join over the facet table.
+        """
+        params = request.query_params
+        facet = FACETS.get(params.get('facet', 'factor'))
+        if facet is None:
+            return Response({'error': f"facet must be one of {', '.join(FACETS)}"}, status=400)
+        try:
+            limit = int(params.get('limit', 20))
+            crashes = None
+            if any(params.get(name) for name in FILTER_PARAMS):
+                crashes = filter_crashes(self.get_queryset(), params)
+            results = list(facet.counts(crashes)[:max(0, min(limit, 1000))])
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        return Response({'facet': params.get('facet', 'factor'), 'results': results})
+    
+    @action(detail=False, methods=['get'])
+    def heatmap(self, request):
+        """Get a severity- or count-weighted density grid over a bounding box"""
+        params = request.query_params
+        try:
+            bbox = parse_bbox(params['bbox']) if params.get('bbox') else NYC_BBOX
+            resolution = int(params.get('resolution', DEFAULT_HEATMAP_RESOLUTION))
+            sigma = float(params.get('sigma', 0))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        weight = params.get('weight', 'severity')
+        
+        if not 0 < resolution <= MAX_HEATMAP_RESOLUTION:
+            return Response({'error': f'resolution must be between 1 and {MAX_HEATMAP_RESOLUTION}'}, status=400)
+        if not 0 <= sigma <= MAX_HEATMAP_SIGMA:
+            return Response({'error': f'sigma must be between 0 and {MAX_HEATMAP_SIGMA}'}, status=400)
+        if weight not in ('severity', 'count'):
+            return Response({'error': "weight must be 'severity' or 'count'"}, status=400)
+        
+        filters = sorted((name, params[name]) for name in FILTER_PARAMS if name != 'bbox' and params.get(name))
+        key = hashlib.md5(repr((bbox, resolution, sigma, weight, filters)).encode()).hexdigest()
+        key = f'heatmap:{DatasetVersion.current(CRASHES)}:{key}'
+        # The rendered JSON is cached, as encoding a large grid costs more
+        # than computing it
+        content = cache.get(key)
+        if content is None:
+            try:
+                latitudes, longitudes, weights = self.heatmap_points(filters, bbox, weight)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=400)
+            grid = density_grid(latitudes, longitudes, weights, bbox, resolution, sigma)
+            content = JSONRenderer().render({
+                'bbox': list(bbox),
+                'width': grid.shape[1],
+                'height': grid.shape[0],
+                'max': round(float(grid.max()), 4),
+                'grid': np.round(grid, 4).tolist()
+            })
+            cache.set(key, content)
+        return HttpResponse(content, content_type='application/json')
+    
+    def heatmap_points(self, filters, bbox, weight):
+        """Return (latitudes, longitudes, weights) arrays of the crashes to plot"""
+        if not filters:
+            points = crash_points()
+            latitudes, longitudes = points.latitudes, points.longitudes
+            if weight == 'count':
+                return latitudes, longitudes, None
+            return latitudes, longitudes, crash_severity(points.injured, points.killed)
+        
+        min_lon, min_lat, max_lon, max_lat = bbox
+        crashes = filter_crashes(self.get_queryset(), dict(filters)).filter(
+            latitude__gte=min_lat, latitude__lte=max_lat, longitude__gte=min_lon, longitude__lte=max_lon
+        )
+        packed = np.fromiter(
+            crashes.order_by().values_list('latitude', 'longitude', 'total_severity').iterator(chunk_size=10000),
+            dtype=[('latitude', 'float64'), ('longitude', 'float64'), ('total_severity', 'int64')],
+        )
+        weights = None if weight == 'count' else packed['total_severity']
+        return packed['latitude'], packed['longitude'], weights
+    
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Get crash statistics for the crashes matching the query parameters
+        
+        Borough and date filters are answered from the daily summary table,
+        so latency does not grow with the number of crashes. Other filters
+        fall back to one grouped query over the crash table.
+        """
+        params = request.query_params
+        try:
+            if summary_can_filter(params):
+                groups = filter_summary(CrashDailySummary.objects.all(), params).values('borough').annotate(
+                    crash_count=Sum('crash_count'),
+                    injured_count=Sum('injured'),
+                    killed_count=Sum('killed')
+                )
+            else:
+                groups = filter_crashes(self.get_queryset(), params).values('borough').annotate(
+                    crash_count=Count('collision_id'),
+                    injured_count=Sum('number_of_persons_injured'),
+                    killed_count=Sum('number_of_persons_killed')
+                )
+            borough_stats = list(groups.order_by('-crash_count'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        # Totals are the sum of the borough groups, so one query does it all
+        return Response({
+            'total_crashes': sum(b['crash_count'] for b in borough_stats),
+            'total_injured': sum(b['injured_count'] for b in borough_stats),
+            'total_killed': sum(b['killed_count'] for b in borough_stats),
+            'borough_breakdown': [b for b in borough_stats if b['crash_count']]
+        })
+
+    
+    @action(detail=False, methods=['get'])
+    def timeseries(self, request):
+        """Get crash, injury and fatality totals over time from the rollup tables"""
+        try:
+            return Response(crash_timeseries(request.query_params))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+
+@dataset_condition(CRASHES, HOTSPOTS)
+def crash_tile(request, z, x, y):
+    """Serve one Mapbox Vector Tile of crashes and hotspots"""
+    if z > MAX_TILE_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        raise Http404('Tile out of range')
+    return HttpResponse(get_tile(z, x, y), content_type=MVT_CONTENT_TYPE)
@@ -0,0 +1,94 @@
+"""Compare CPU time of per-record and vectorized normalization of API pages.
+
+Usage: python benchmarks/normalize_cpu.py [page_size ...]
+
+``per_record`` reproduces what fetch_nyc_data used to do for each record
+(parse_date, a cast per field and a Crash instance for the writer);
+``normalize_frame`` converts the whole page in one pass into the columns
+the writer inserts.
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nyc_traffic.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import pandas as pd  # noqa: E402
+
+from accidents.models import Crash  # noqa: E402
+from accidents.normalize import INTEGER_FIELDS, TEXT_FIELDS, normalize_frame  # noqa: E402
+
+
+def make_page(page_size):
+    record = {
+        'crash_date': '2022-01-01T00:00:00.000',
+        'crash_time': '14:30',
+        'borough': 'BROOKLYN',
+        'zip_code': '11201',
+        'latitude': '40.6782',
+        'longitude': '-73.9442',
+        'on_street_name': 'FLATBUSH AVENUE',
+        'number_of_persons_injured': '1',
+        'number_of_persons_killed': '0',
+        'number_of_motorist_injured': '1',
+        'contributing_factor_vehicle_1': 'Driver Inattention/Distraction',
+        'vehicle_type_code1': 'Sedan',
+    }
+    return [{**record, 'collision_id': str(4000000 + i)} for i in range(page_size)]
+
+
+def parse_date(date_string):
+    try:
+        if 'T' in date_string:
+            return datetime.fromisoformat(date_string.replace('Z', '+00:00'))
+        return datetime.strptime(date_string, '%Y-%m-%d')
+    except ValueError:
+        return datetime.now()
+
+
+def per_record(page):
+    rows = []
+    for record in page:
+        row = {
+            'collision_id': int(record.get('collision_id', 0)),
+            'crash_date': parse_date(record.get('crash_date')),
+            'latitude': float(record.get('latitude', 0)),
+            'longitude': float(record.get('longitude', 0)),
+        }
+        for name in INTEGER_FIELDS:
+            row[name] = int(record.get(name, 0))
+        for name in TEXT_FIELDS:
+            row[name] = record.get(name, '')
+        rows.append(Crash(**row))
+    return rows
+
+
+def vectorized(page):
+    return normalize_frame(pd.DataFrame.from_records(page))
+
+
+def best_of(parse, page, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        parse(page)
+        timings.append(time.process_time() - started)
+    return min(timings) * 1000
+
+
+def main():
+    page_sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+    print(f"{'page size':>10} {'per-record ms':>14} {'vectorized ms':>14}")
+    for page_size in page_sizes:
+        page = make_page(page_size)
+        print(f"{page_size:>10} {best_of(per_record, page):>14.1f} {best_of(vectorized, page):>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
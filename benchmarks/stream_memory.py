@@ -0,0 +1,86 @@
+"""Compare peak memory of whole-page and streamed parsing of API pages.
+
+Usage: python benchmarks/stream_memory.py [page_size ...]
+
+The whole-page path mirrors ``response.json()``: the body is buffered and
+decoded into one list. The streamed path mirrors ``fetch_nyc_data --stream``:
+64KB chunks go through ``iter_json_array`` and records are handed on in
+batches of 1000.
+"""
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from accidents.socrata import iter_json_array  # noqa: E402
+
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 1000
+
+
+def make_body(page_size):
+    record = {
+        'crash_date': '2022-01-01T00:00:00.000',
+        'crash_time': '14:30',
+        'borough': 'BROOKLYN',
+        'zip_code': '11201',
+        'latitude': '40.6782',
+        'longitude': '-73.9442',
+        'on_street_name': 'FLATBUSH AVENUE',
+        'cross_street_name': 'ATLANTIC AVENUE',
+        'number_of_persons_injured': '1',
+        'number_of_persons_killed': '0',
+        'contributing_factor_vehicle_1': 'Driver Inattention/Distraction',
+        'contributing_factor_vehicle_2': 'Unspecified',
+        'vehicle_type_code1': 'Sedan',
+        'vehicle_type_code2': 'Station Wagon/Sport Utility Vehicle',
+    }
+    return json.dumps([{**record, 'collision_id': str(4000000 + i)} for i in range(page_size)]).encode()
+
+
+def chunks_of(body):
+    for start in range(0, len(body), CHUNK_SIZE):
+        yield body[start:start + CHUNK_SIZE]
+
+
+def whole_page(body):
+    data = json.loads(b''.join(chunks_of(body)))
+    return len(data)
+
+
+def streamed(body):
+    count = 0
+    batch = []
+    for record in iter_json_array(chunks_of(body)):
+        batch.append(record)
+        if len(batch) >= BATCH_SIZE:
+            count += len(batch)
+            batch = []
+    return count + len(batch)
+
+
+def peak_mib(parse, body):
+    tracemalloc.start()
+    try:
+        parse(body)
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    page_sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000, 100000]
+    print(f"{'page size':>10} {'body MiB':>10} {'whole MiB':>10} {'stream MiB':>11}")
+    for page_size in page_sizes:
+        body = make_body(page_size)
+        print(
+            f"{page_size:>10} {len(body) / (1024 * 1024):>10.1f} "
+            f"{peak_mib(whole_page, body):>10.1f} {peak_mib(streamed, body):>11.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
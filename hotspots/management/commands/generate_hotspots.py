@@ -2,7 +2,8 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from sklearn.cluster import KMeans
 import numpy as np
-from accidents.models import Crash
+from accidents.models import Crash, DatasetVersion
+from accidents.versions import HOTSPOTS
 from hotspots.models import Hotspot
 
 class Command(BaseCommand):
@@ -76,4 +77,5 @@ class Command(BaseCommand):
             hotspots_created += 1
             self.stdout.write(f"Created hotspot {i+1}: {crash_count} crashes, severity: {severity_index:.1f}")
         
+        DatasetVersion.bump(HOTSPOTS)
         self.stdout.write(f"Generated {hotspots_created} hotspots from {len(crashes)} crashes")
\ No newline at end of file
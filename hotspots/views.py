@@ -1,8 +1,11 @@
+from django.utils.decorators import method_decorator
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from accidents.versions import HOTSPOTS, dataset_condition
 from .models import Hotspot
 
+@method_decorator(dataset_condition(HOTSPOTS), name='dispatch')
 class HotspotViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Hotspot.objects.all()
     